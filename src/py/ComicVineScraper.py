@@ -90,7 +90,7 @@ def __launch(delegate):
       Resources.initialize()
       
       # fire up the debug logging system
-      log.install(ComicRack.MainWindow)
+      log.install(ComicRack.MainWindow, Resources.LOG_DIRECTORY)
       
       # install a handler to catch uncaught Winforms exceptions
       def exception_handler(sender, event):
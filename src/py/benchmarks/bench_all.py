@@ -0,0 +1,97 @@
+'''
+This module runs all of the micro-benchmarks for this project (the CPU-bound
+helpers that run once for every book or every candidate series), prints how
+many operations per second each one did, and compares those numbers with a
+saved baseline, so that it can be used to gate changes that make any of these
+hot paths slower.
+
+Usage (from this directory, with the rest of src/py on the path):
+
+   ipy bench_all.py [--filter TEXT] [--samples N] [--tolerance FRACTION]
+                    [--save-baseline]
+
+Exits with status 1 if any benchmark is more than 'tolerance' (default 0.2,
+i.e. 20%) slower than the baseline.  Use --save-baseline to record a new
+baseline (in baseline.json) after a change that was meant to be slower, or
+when running on a new machine.
+
+@author: Cory Banack
+'''
+import os
+import sys
+import log
+import microbench
+import bench_parsing
+import bench_matching
+import bench_sorting
+
+# add new benchmark modules here.
+__MODULES = [ bench_parsing, bench_matching, bench_sorting ]
+
+# the file that the baseline results are saved in (next to this file.  note
+# that this module usually runs as __main__, so its name isn't 'bench_all')
+__BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 
+   "baseline.json")
+
+
+#==============================================================================
+def main(argv):
+   ''' Runs the benchmarks, as described above.  Returns the exit status. '''
+
+   filter_s = ""
+   samples_n = 10
+   tolerance_n = 0.20
+   save_b = False
+   args = list(argv)
+   while args:
+      arg = args.pop(0)
+      if arg == "--filter" and args:
+         filter_s = args.pop(0)
+      elif arg == "--samples" and args:
+         samples_n = int(args.pop(0))
+      elif arg == "--tolerance" and args:
+         tolerance_n = float(args.pop(0))
+      elif arg == "--save-baseline":
+         save_b = True
+      else:
+         print __doc__
+         return 2
+
+   benchmarks = []
+   for module in __MODULES:
+      benchmarks += [ b for b in module.load_benchmarks() \
+         if filter_s in b.name_s ]
+
+   print "{0:<40}{1:>14}  {2:>9}".format("benchmark", "ops/sec", "stdev")
+   results = []
+   for benchmark in benchmarks:
+      result = benchmark.run(samples_n)
+      results.append(result)
+      print result
+
+   if save_b:
+      microbench.save_baseline(results, __BASELINE_FILE)
+      print "\nsaved baseline: " + __BASELINE_FILE
+      return 0
+
+   print
+   lines, regressions = microbench.check_baseline(
+      results, __BASELINE_FILE, tolerance_n)
+   for line in lines:
+      print line
+   if regressions:
+      print "\n{0} benchmark(s) regressed by more than {1:.0%}".format(
+         len(regressions), tolerance_n)
+      return 1
+   return 0
+
+
+#==============================================================================
+if __name__ == "__main__":
+   ''' make sure we run properly if called from the command line '''
+   log.install(None)
+   try:
+      status_n = main(sys.argv[1:])
+   finally:
+      log.uninstall()
+   sys.exit(status_n)
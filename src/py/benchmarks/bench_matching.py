@@ -0,0 +1,140 @@
+'''
+This module contains the micro-benchmarks for the helpers that run once for
+every candidate series or cover image that is considered while scraping a
+book:  the series match score, the series filter, and the image hash
+similarity.
+
+The fixture data is generated from a fixed random seed, with series names
+taken from the filename parser's unit test data, so that every run (and
+every machine) benchmarks exactly the same work.  The image hashes come from
+the cover images in tools/testdata/cvfixtures/images, and from scaled down
+copies of them (like the thumbnails that we compare full size covers to.)
+
+@author: Cory Banack
+'''
+import clr
+import os
+import random
+import bench_parsing
+import dbutils
+import imagehash
+from bookdata import BookData
+from dbmodels import SeriesRef
+from matchscore import MatchScore
+from microbench import Benchmark
+
+clr.AddReference('System')
+from System.IO import Directory
+
+clr.AddReference('System.Drawing')
+from System.Drawing import Bitmap, Image
+
+# the directory that this module lives in
+__DIR = os.path.dirname(os.path.abspath(__file__))
+
+# a mix of common publishers, and the ones that the scraper penalizes or
+# (by default) filters out
+__PUBLISHERS = [ "Marvel", "DC Comics", "Image", "Dark Horse Comics",
+   "IDW Publishing", "Dynamite Entertainment", "Boom! Studios", "Vertigo",
+   "Panini Comics", "Marvel UK", "Marvel Italia", "Abril", "Semic_AS" ]
+
+# the publishers to filter out, trimmed and lower cased
+__IGNORED_PUBLISHERS = [ "panini comics", "marvel uk", "marvel italia",
+   "abril", "semic_as" ]
+
+
+#==============================================================================
+def load_benchmarks():
+   ''' Returns all of the Benchmarks in this module, as a list. '''
+
+   rand = random.Random(1)
+   names_sl = __load_series_names(
+      os.path.join(__DIR, "..", "tests", "test_fnameparser.data"))
+   series_refs = __make_series_refs(rand, names_sl, 500)
+   candidates = series_refs[:100]
+
+   books = []
+   for name_s in names_sl[:50]:
+      book = BookData()
+      book.series_s = name_s
+      book.issue_num_s = str(rand.randint(1, 120))
+      book.pub_year_n = rand.randint(1960, 2012)
+      books.append(book)
+
+   images = __load_images(os.path.join(__DIR, "..", "..", "..", "tools",
+      "testdata", "cvfixtures", "images"))
+   image_hashes = [ imagehash.hash(image) for image in images ]
+   hashes = [ (hash1, hash2) for hash1 in image_hashes \
+      for hash2 in image_hashes ]
+
+   matchscore = MatchScore()
+   def compute():
+      for book in books:
+         for series_ref in candidates:
+            matchscore.compute_n(book, series_ref)
+
+   def filter_refs():
+      dbutils.filter_series_refs(series_refs, __IGNORED_PUBLISHERS,
+         1950, 2020, 100)
+
+   def hash_images():
+      for image in images:
+         imagehash.hash(image)
+
+   def similarity():
+      for hash1, hash2 in hashes:
+         imagehash.similarity(hash1, hash2)
+
+   return [
+      Benchmark("matchscore.compute_n", compute, len(books)*len(candidates)),
+      Benchmark("dbutils.filter_series_refs", filter_refs, len(series_refs)),
+      Benchmark("imagehash.hash", hash_images, len(images)),
+      Benchmark("imagehash.similarity", similarity, len(hashes)),
+   ]
+
+
+#==============================================================================
+def __load_images(dir_s):
+   '''
+   Returns all of the cover images in the given fixture directory, plus a
+   half size copy of each one, as a list of Images.  They are never disposed,
+   since the benchmarks use them until the process ends.
+   '''
+   retval = []
+   for file_s in sorted(Directory.GetFiles(os.path.abspath(dir_s))):
+      image = Image.FromFile(file_s)
+      retval.append(image)
+      retval.append( Bitmap(image, max(1, image.Width // 2), 
+         max(1, image.Height // 2)) )
+   return retval
+
+
+#==============================================================================
+def __load_series_names(file_s):
+   '''
+   Returns the (unique) expected series names from the filename parser's
+   testdata file, in the order that they appear in that file.
+   '''
+   retval = []
+   for data in bench_parsing.load_testdata(file_s):
+      if data[1] and data[1] not in retval:
+         retval.append(data[1])
+   return retval
+
+
+#==============================================================================
+def __make_series_refs(rand, names_sl, count_n):
+   '''
+   Returns a list of 'count_n' SeriesRefs with names based on the given
+   series names, and random (but repeatable) years, publishers and sizes.
+   '''
+   retval = []
+   for i in range(count_n):
+      name_s = names_sl[i % len(names_sl)]
+      if i >= len(names_sl):
+         name_s += rand.choice(["", " Annual", " Special", " Vol. 2", ""])
+      year_n = -1 if rand.random() < 0.05 else rand.randint(1940, 2012)
+      retval.append( SeriesRef(10000 + i, name_s, year_n,
+         rand.choice(__PUBLISHERS), rand.choice([1, 4, 6, 12, 50, 250, 700]),
+         None) )
+   return retval
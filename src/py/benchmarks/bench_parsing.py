@@ -0,0 +1,134 @@
+'''
+This module contains the micro-benchmarks for the string and xml parsing
+helpers that run once for every book that is scraped:  the filename parser,
+the search term cleanup, the natural (issue number) ordering, the number
+word conversion, and the Comic Vine xml and json parsers (which parse the
+same responses, so they can be compared directly.)
+
+The fixture data comes from the filename parser's unit test data, and from
+the recorded Comic Vine responses in tools/testdata/cvfixtures.
+
+@author: Cory Banack
+'''
+import clr
+import os
+import re
+import cvdb
+import cvjson
+import fnameparser
+import utils
+import xml2py
+from microbench import Benchmark
+
+clr.AddReference('System')
+from System.IO import Directory, File, Path, SearchOption, StreamReader
+from System.Text import Encoding
+
+# the directory that this module lives in
+__DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+#==============================================================================
+def load_benchmarks():
+   ''' Returns all of the Benchmarks in this module, as a list. '''
+
+   data = load_testdata(
+      os.path.join(__DIR, "..", "tests", "test_fnameparser.data"))
+   filenames_sl = [ x[0] for x in data ]
+   series_sl = [ x[1] for x in data ]
+   issues_sl = [ x[2] for x in data if x[2] ]
+   fixtures_dir_s = os.path.join(__DIR, "..", "..", "..", "tools", 
+      "testdata", "cvfixtures", "api")
+   xml_sl = [ x[0] for x in __load_fixtures(fixtures_dir_s, "*.xml") ]
+   json_sl = __load_fixtures(fixtures_dir_s, "*.json")
+
+   def extract():
+      for filename_s in filenames_sl:
+         fnameparser.extract(filename_s)
+
+   def cleanup():
+      for series_s in series_sl:
+         __cleanup_search_terms(series_s, False)
+
+   def cleanup_alt():
+      for series_s in series_sl:
+         __cleanup_search_terms(series_s, True)
+
+   def expand():
+      for series_s in series_sl:
+         utils.convert_number_words(series_s.lower(), True)
+
+   def contract():
+      for series_s in series_sl:
+         utils.convert_number_words(series_s.lower(), False)
+
+   def natural_key():
+      for issue_s in issues_sl:
+         utils.natural_key(issue_s)
+
+   def natural_sort():
+      sorted(issues_sl, utils.natural_compare)
+
+   def parse_xml():
+      for xml_s in xml_sl:
+         xml2py.parseString(xml_s)
+
+   def parse_json():
+      for json_s, resource_s in json_sl:
+         cvjson.parseString(json_s, resource_s)
+
+   return [
+      Benchmark("fnameparser.extract", extract, len(filenames_sl)),
+      Benchmark("cvdb.cleanup_search_terms", cleanup, len(series_sl)),
+      Benchmark("cvdb.cleanup_search_terms(alt)", cleanup_alt, len(series_sl)),
+      Benchmark("utils.convert_number_words(expand)", expand, len(series_sl)),
+      Benchmark("utils.convert_number_words", contract, len(series_sl)),
+      Benchmark("utils.natural_key", natural_key, len(issues_sl)),
+      Benchmark("utils.natural_compare(sort)", natural_sort, 1),
+      Benchmark("xml2py.parseString", parse_xml, len(xml_sl)),
+      Benchmark("cvjson.parseString", parse_json, len(json_sl)),
+   ]
+
+
+#==============================================================================
+def __cleanup_search_terms(search_terms_s, alt_b):
+   ''' Calls the cvdb module's private search term cleanup function. '''
+   return cvdb.__cleanup_search_terms(search_terms_s, alt_b)
+
+
+#==============================================================================
+def load_testdata(file_s):
+   '''
+   Reads the filename parser's testdata out of the given file, and returns it
+   as a list of [filename, series, issue number, year] string lists.  See
+   test_fnameparser.py for the format of this file.
+   '''
+   retval = []
+   with StreamReader(file_s, Encoding.UTF8, False) as sr:
+      line = sr.ReadLine()
+      while line is not None:
+         line = line.strip()
+         if len(line) > 0 and not line.startswith("#"):
+            if line.startswith('"'):
+               data = re.findall(r'"(.*?)"', line)
+            else:
+               data = re.findall(r"'(.*?)'", line)
+            if len(data) == 3:
+               data.append("")
+            if len(data) == 4:
+               retval.append(data)
+         line = sr.ReadLine()
+   return retval
+
+
+#==============================================================================
+def __load_fixtures(dir_s, pattern_s):
+   '''
+   Returns the contents of all the response files in the given fixture dir
+   that match the given pattern, as a list of (contents, api resource) string
+   tuples.  The resource is the name of the directory the file is in.
+   '''
+   files_sl = sorted(Directory.GetFiles(Path.GetFullPath(dir_s), pattern_s,
+      SearchOption.AllDirectories))
+   return [ (File.ReadAllText(file_s, Encoding.UTF8),
+      Path.GetFileName(Path.GetDirectoryName(file_s))) for file_s in files_sl ]
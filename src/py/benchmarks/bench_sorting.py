@@ -0,0 +1,95 @@
+#coding: utf-8
+'''
+This module contains the micro-benchmarks for sorting the books at the start
+of a scrape (see ScrapeEngine.__sort_books):  computing each book's sort key,
+and sorting a whole (large) selection of books with those keys.
+
+The fixture data is a synthetic library of 50,000 books, generated from a
+fixed random seed.  Its series keys are built the same way as the ComicBook's
+unique_series_s (from series names taken from the filename parser's unit test
+data), and its issue numbers include the usual oddities:  decimals,
+negatives, fractions, letter suffixes, words and blanks.
+
+@author: Cory Banack
+'''
+import hashlib
+import os
+import random
+import re
+import bench_parsing
+import utils
+from microbench import Benchmark
+
+# the directory that this module lives in
+__DIR = os.path.dirname(os.path.abspath(__file__))
+
+# the number of books in the synthetic library
+__BOOKS_N = 50000
+
+# the number of different series (name and volume) in the synthetic library
+__SERIES_N = 700
+
+
+#==============================================================================
+def load_benchmarks():
+   ''' Returns all of the Benchmarks in this module, as a list. '''
+
+   rand = random.Random(1)
+   names_sl = [ data[1] for data in bench_parsing.load_testdata(
+      os.path.join(__DIR, "..", "tests", "test_fnameparser.data"))
+      if data[1] ]
+   series_sl = [ __unique_series_s(rand, names_sl[i % len(names_sl)])
+      for i in range(__SERIES_N) ]
+   books = [ _Book(rand.choice(series_sl), __issue_num_s(rand))
+      for i in range(__BOOKS_N) ]
+
+   def compute_keys():
+      for book in books:
+         utils.issue_sort_key(book.unique_series_s, book.issue_num_s)
+
+   def sort_books():
+      # the same sort that ScrapeEngine.__sort_books does
+      sorted(books, key=lambda book:
+         utils.issue_sort_key(book.unique_series_s, book.issue_num_s))
+
+   return [
+      Benchmark("utils.issue_sort_key", compute_keys, len(books)),
+      Benchmark("scrapeengine.sort_books(50k)", sort_books, len(books)),
+   ]
+
+
+#==============================================================================
+def __unique_series_s(rand, name_s):
+   '''
+   Returns a series key for the given series name, built the same way as a
+   ComicBook's unique_series_s:  the name, without any punctuation and in
+   lower case, plus a short hash of the book's folder and volume year.
+   '''
+   folder_s = "C:\\Comics\\" + rand.choice(["Marvel", "DC", "Image", "Misc"])
+   hash_s = folder_s + str(rand.randint(1940, 2012))
+   return re.sub('\W+', '', name_s).lower() + \
+      hashlib.md5(hash_s.encode("utf-8")).hexdigest()[:10].upper()
+
+
+#==============================================================================
+def __issue_num_s(rand):
+   ''' Returns a random (but repeatable) issue number string. '''
+   n = rand.random()
+   if n < 0.70: return str(rand.randint(0, 999))
+   elif n < 0.78: return str(rand.randint(0, 99)) + rand.choice("abcdefgh")
+   elif n < 0.84: return "{0}.{1}".format(rand.randint(0, 99),
+      rand.choice([1, 5, 25]))
+   elif n < 0.87: return rand.choice(["-1", "0", "½", "0½", ".5"])
+   elif n < 0.92: return rand.choice(["Annual", "Special", "AU", "nn"])
+   else: return ""
+
+
+#==============================================================================
+class _Book(object):
+   '''
+   A stand-in for a ComicBook, with just the (already computed) properties
+   that its sort key is made from.
+   '''
+   def __init__(self, unique_series_s, issue_num_s):
+      self.unique_series_s = unique_series_s
+      self.issue_num_s = issue_num_s
@@ -0,0 +1,142 @@
+'''
+This module contains a tiny framework for the micro-benchmarks in this
+directory:  the Benchmark class, which times a function and reports how many
+operations per second it can do, and the functions that save those results
+as a baseline and check new results against it for regressions.
+
+@author: Cory Banack
+'''
+import clr
+import json
+import math
+
+clr.AddReference('System')
+from System import Environment
+from System.Diagnostics import Stopwatch
+from System.IO import File
+
+# each timing sample runs the benchmarked function for at least this long
+SAMPLE_MS = 100.0
+
+# before taking any samples, we warm up (i.e. jit) for at least this long
+WARMUP_MS = 300.0
+
+
+#==============================================================================
+class Benchmark(object):
+   '''
+   A named function to benchmark.  Each call to the function should do 'ops_n'
+   operations (i.e. parse 'ops_n' file names), which is how we convert the
+   time it takes into operations per second.
+   '''
+
+   #===========================================================================
+   def __init__(self, name_s, function, ops_n=1):
+      self.name_s = name_s
+      self.function = function
+      self.ops_n = max(1, ops_n)
+
+
+   #===========================================================================
+   def run(self, samples_n):
+      '''
+      Runs this benchmark, and returns its BenchmarkResult.  The result is
+      based on the given number of timing samples, each of which calls our
+      function as many times as it takes to fill SAMPLE_MS.
+      '''
+      # 1. warm up, and figure out how many calls fill up one sample
+      calls_n = 1
+      elapsed_ms = 0.0
+      warmup = Stopwatch.StartNew()
+      while warmup.Elapsed.TotalMilliseconds < WARMUP_MS or \
+            elapsed_ms < SAMPLE_MS / 10.0:
+         elapsed_ms = self.__time_ms(calls_n)
+         if elapsed_ms < SAMPLE_MS:
+            calls_n *= 2
+      calls_n = max(1, int(math.ceil(calls_n * SAMPLE_MS / elapsed_ms)))\
+         if elapsed_ms > 0 else calls_n
+
+      # 2. take the samples
+      rates = []
+      for i in range(max(2, samples_n)):
+         ms = self.__time_ms(calls_n)
+         rates.append(calls_n * self.ops_n * 1000.0 / ms if ms > 0 else 0.0)
+      return BenchmarkResult(self.name_s, rates)
+
+
+   #===========================================================================
+   def __time_ms(self, calls_n):
+      ''' Returns how long (in ms) it takes to call our function calls_n times.'''
+      function = self.function
+      stopwatch = Stopwatch.StartNew()
+      for i in xrange(calls_n):
+         function()
+      return stopwatch.Elapsed.TotalMilliseconds
+
+
+
+#==============================================================================
+class BenchmarkResult(object):
+   ''' The operations per second that were measured for a Benchmark. '''
+
+   #===========================================================================
+   def __init__(self, name_s, rates):
+      ''' 'rates' is the list of ops/sec that was measured for each sample. '''
+      self.name_s = name_s
+      self.mean_n = sum(rates) / len(rates)
+      self.stdev_n = math.sqrt( sum( (r - self.mean_n)**2 for r in rates ) \
+         / (len(rates) - 1) ) if len(rates) > 1 else 0.0
+      self.min_n = min(rates)
+      self.max_n = max(rates)
+
+   # the standard deviation of our samples, as a fraction of their mean
+   cv_n = property( lambda self :
+      self.stdev_n / self.mean_n if self.mean_n else 0.0 )
+
+   #===========================================================================
+   def __str__(self):
+      return "{0:<40}{1:>14,.0f}  +/- {2:>5.1%}  (min {3:,.0f})".format(
+         self.name_s, self.mean_n, self.cv_n, self.min_n)
+
+
+
+#==============================================================================
+def save_baseline(results, file_s):
+   ''' Saves the given BenchmarkResults as the baseline in the given file. '''
+   baseline = { "machine" : Environment.MachineName,
+      "ops_per_sec" : dict( (r.name_s, r.mean_n) for r in results ) }
+   File.WriteAllText(file_s, json.dumps(baseline, indent=2, sort_keys=True))
+
+
+
+#==============================================================================
+def check_baseline(results, file_s, tolerance_n):
+   '''
+   Compares the given BenchmarkResults with the baseline in the given file.
+   A result is a regression if it is more than 'tolerance_n' (i.e. 0.2 = 20%)
+   slower than its baseline.  Returns a list of lines describing the
+   comparison, and a list of the names of the benchmarks that regressed.
+   Benchmarks that aren't in the baseline are never regressions.
+   '''
+   if not File.Exists(file_s):
+      return ["no baseline to compare with: " + file_s], []
+
+   baseline = json.loads(File.ReadAllText(file_s))
+   lines = []
+   regressions = []
+   if baseline.get("machine") != Environment.MachineName:
+      lines.append("WARNING: the baseline was made on a different machine ("
+         + baseline.get("machine", "?") + ")")
+   for result in results:
+      base_n = baseline["ops_per_sec"].get(result.name_s)
+      if not base_n:
+         lines.append("{0:<40}{1:>14}".format(result.name_s, "(new)"))
+      else:
+         change_n = result.mean_n / base_n - 1.0
+         regressed_b = change_n < -tolerance_n
+         if regressed_b:
+            regressions.append(result.name_s)
+         lines.append("{0:<40}{1:>+13.1%}{2}{3}".format(result.name_s,
+            change_n, "  REGRESSION" if regressed_b else "",
+            "  (noisy)" if result.cv_n > tolerance_n / 2 else ""))
+   return lines, regressions
@@ -69,8 +69,11 @@ class BookData(object):
       The updated_properties() method defines which properties of this class 
       should be written out by implementing subclasses; ALL other properties
       should be ignored.
+      
+      Returns the number of properties that did NOT need to be written out,
+      because their values were already up-to-date in the original source.
       '''  
-      pass
+      return 0
 
       
 
@@ -43,8 +43,14 @@ class ComicBook(object):
       ComicBook object (the crbook) parameter and the the given ScrapeEngine.
       '''
       self.__scraper = scraper;
+      self.__crbook = crbook;
       self.__bookdata = PluginBookData(crbook, scraper)
       self.__parse_extra_details_from_path()
+      
+      # a map of the (expensive to compute) derived values for this book, 
+      # keyed by name.  each value is computed the first time it is needed.
+      # this map MUST be cleared (see __invalidate) whenever our data changes.
+      self.__derived_cache = {}
 
    
    #===========================================================================
@@ -74,25 +80,30 @@ class ComicBook(object):
    # The number of pages in this book, an integer >= 0.
    page_count_n = property( lambda self : self.__bookdata.page_count_n )
    
+   # The unique id string of this book in the ComicRack library. Not None.
+   id_s = property( lambda self : sstr(self.__crbook.Id) )
+   
    # the unique id string associated with this comic book's series.  all comic
    # books that appear to be from the same series will have the same id string,
    # which will be different for each series. will not be null or None.
-   unique_series_s = property( lambda self : self.__unique_series_s() )  
+   unique_series_s = property( lambda self : 
+      self.__derived("unique_series_s", self.__unique_series_s) )  
 
    # an IssueRef object identifying this book in the database, if available.
    # will be None if not available, which is always the case for books that 
    # haven't been scraped before.
-   issue_ref = property( lambda self : None if 
-      self.__extract_issue_ref() == 'skip' else self.__extract_issue_ref() )
+   issue_ref = property( lambda self : self.__issue_ref() )
    
    # a SeriesRef object identifying this book's series in the database, if 
    # available.  will be None if not available, which is always the case for 
    # books that haven't been scraped before.
-   series_ref = property( lambda self : self.__extract_series_ref() )
+   series_ref = property( lambda self : 
+      self.__derived("series_ref", self.__extract_series_ref) )
     
    # true if this book as has been marked to "skip forever" (the scraper should
    # silently skip this book if this value is true, regardless of self.issue_ref
-   skip_b = property( lambda self : self.__extract_issue_ref() == 'skip' ) 
+   skip_b = property( lambda self : 
+      self.__derived("issue_ref", self.__extract_issue_ref) == 'skip' ) 
 
    #==========================================================================
    def create_image_of_page(self, page_index):
@@ -133,8 +144,35 @@ class ComicBook(object):
          log.debug("Added ", ComicBook.CVDBSKIP, " flag to comic book 'Notes'")
          
       bd.update()
+      self.__invalidate()
          
 
+   #===========================================================================
+   def __issue_ref(self):
+      ''' Returns the value of the issue_ref property (see above.) '''
+      issue_ref = self.__derived("issue_ref", self.__extract_issue_ref)
+      return None if issue_ref == 'skip' else issue_ref
+   
+   #===========================================================================
+   def __derived(self, name_s, compute):
+      '''
+      Returns the derived value with the given name for this book, calling the
+      given no-argument 'compute' function to calculate it only if it isn't 
+      already in our cache of derived values.
+      '''
+      if name_s not in self.__derived_cache:
+         self.__derived_cache[name_s] = compute()
+      return self.__derived_cache[name_s]
+   
+   #===========================================================================
+   def __invalidate(self):
+      '''
+      Throws away all of this book's cached derived values, so that they will
+      be recomputed (from the book's current data) the next time they are used.
+      Call this whenever the underlying book data changes.
+      '''
+      self.__derived_cache = {}
+
    # =============================================================================
    def __extract_issue_ref(self): 
       '''
@@ -250,6 +288,9 @@ class ComicBook(object):
       
       As a side-effect, some detailed debug log information about the new values
       is also emitted.
+      
+      Returns the number of values that didn't have to be written to the
+      backing data source, because they were already up-to-date there.
       '''
       log.debug("setting values for this comic book ('*' = changed):")
       config = self.__scraper.config
@@ -438,7 +479,9 @@ class ComicBook(object):
       # cover url -------------
       self.__update_cover_url(issue)
       
-      bd.update();
+      unchanged_n = bd.update();
+      self.__invalidate()
+      return unchanged_n
    
    #===========================================================================
    def __update_publishers(self, issue, config):
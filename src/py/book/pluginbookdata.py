@@ -39,42 +39,86 @@ class PluginBookData(BookData):
       def split(s):
          return s.split(",") if s else [] 
       
-      # load our own copy of all data from the ComicRack database
-      self.series_s = crbook.Series    # don't use shadows!  we'll parse these 3
-      self.issue_num_s = crbook.Number # values from the comic's filename our
-      self.pub_year_n =  crbook.Year   # self if they are not present!
-      self.pub_month_n = crbook.Month
-      self.pub_day_n = crbook.Day
-      self.rel_year_n = crbook.ReleasedTime.Year
-      self.rel_month_n = crbook.ReleasedTime.Month
-      self.rel_day_n = crbook.ReleasedTime.Day
-      self.volume_year_n = crbook.ShadowVolume
-      self.format_s = crbook.ShadowFormat
-      self.title_s = crbook.Title
-      self.crossovers_sl = split(crbook.AlternateSeries)
-      self.summary_s = crbook.Summary
-      self.publisher_s = crbook.Publisher
-      self.imprint_s = crbook.Imprint
-      self.characters_sl = split(crbook.Characters)
-      self.teams_sl = split(crbook.Teams)
-      self.locations_sl = split(crbook.Locations)
-      self.writers_sl = split(crbook.Writer)
-      self.pencillers_sl = split(crbook.Penciller)
-      self.inkers_sl = split(crbook.Inker)
-      self.colorists_sl = split(crbook.Colorist)
-      self.letterers_sl = split(crbook.Letterer)
-      self.cover_artists_sl = split(crbook.CoverArtist)
-      self.editors_sl = split(crbook.Editor)
-      self.tags_sl = split(crbook.Tags) 
-      self.notes_s = crbook.Notes
-      self.path_s = crbook.FilePath 
-      self.webpage_s = crbook.Web
-      self.rating_n = crbook.CommunityRating
-      self.page_count_n = crbook.PageCount
-      self.issue_key_s = crbook.GetCustomValue(PluginBookData.__ISSUE_KEY)
-      self.series_key_s = crbook.GetCustomValue(PluginBookData.__SERIES_KEY)
+      # reading data out of the ComicRack database is slow (it goes across
+      # interop) so we don't do it until we have to.  this map contains a 
+      # 'loader' function for each property whose value hasn't been read
+      # from ComicRack yet.  see _load_property() for details.
+      self.__loaders = {
+         "series_s" : lambda : crbook.Series,  # don't use shadows!  we'll 
+         "issue_num_s" : lambda : crbook.Number, # parse these 3 values from
+         "pub_year_n" : lambda : crbook.Year,  # the comic's filename our self 
+         "pub_month_n" : lambda : crbook.Month, # if they are not present!
+         "pub_day_n" : lambda : crbook.Day,
+         "rel_year_n" : lambda : crbook.ReleasedTime.Year,
+         "rel_month_n" : lambda : crbook.ReleasedTime.Month,
+         "rel_day_n" : lambda : crbook.ReleasedTime.Day,
+         "volume_year_n" : lambda : crbook.ShadowVolume,
+         "format_s" : lambda : crbook.ShadowFormat,
+         "title_s" : lambda : crbook.Title,
+         "crossovers_sl" : lambda : split(crbook.AlternateSeries),
+         "summary_s" : lambda : crbook.Summary,
+         "publisher_s" : lambda : crbook.Publisher,
+         "imprint_s" : lambda : crbook.Imprint,
+         "characters_sl" : lambda : split(crbook.Characters),
+         "teams_sl" : lambda : split(crbook.Teams),
+         "locations_sl" : lambda : split(crbook.Locations),
+         "writers_sl" : lambda : split(crbook.Writer),
+         "pencillers_sl" : lambda : split(crbook.Penciller),
+         "inkers_sl" : lambda : split(crbook.Inker),
+         "colorists_sl" : lambda : split(crbook.Colorist),
+         "letterers_sl" : lambda : split(crbook.Letterer),
+         "cover_artists_sl" : lambda : split(crbook.CoverArtist),
+         "editors_sl" : lambda : split(crbook.Editor),
+         "tags_sl" : lambda : split(crbook.Tags),
+         "notes_s" : lambda : crbook.Notes,
+         "path_s" : lambda : crbook.FilePath,
+         "webpage_s" : lambda : crbook.Web,
+         "rating_n" : lambda : crbook.CommunityRating,
+         "page_count_n" : lambda : crbook.PageCount,
+         "issue_key_s" : lambda : 
+            crbook.GetCustomValue(PluginBookData.__ISSUE_KEY),
+         "series_key_s" : lambda : 
+            crbook.GetCustomValue(PluginBookData.__SERIES_KEY),
+      }
+      
+      # the values of all of the properties that we've read in from ComicRack,
+      # as they were when we read them.  this lets us skip writing values back
+      # into ComicRack when they haven't changed. 
+      self.__originals = {}
+      
+      # volume_year_n and format_s are read from ComicRack's 'shadow' fields 
+      # (which fall back on values parsed from the filename) but written to 
+      # the real fields, so their original values must come from the real 
+      # fields, or a scraped value that matches the filename won't be written.
+      self.__original_loaders = {
+         "volume_year_n" : lambda : crbook.Volume,
+         "format_s" : lambda : crbook.Format,
+      }
+      
       self.__crbook = crbook;
       self.__scraper = scraper;
+      
+      
+   #==========================================================================
+   def _load_property(self, property):
+      '''
+      Makes sure that the given property ("series_s", etc.) has been read in 
+      from the backing ComicRack book, and that its original value has been
+      recorded.  This happens automatically the first time that a property is
+      used (read OR written), so there's no need to call this directly.
+      '''
+      loader = self.__loaders.pop(property, None)
+      if loader:
+         base = BookData.__dict__[property]
+         original_loader = self.__original_loaders.get(property)
+         if original_loader:
+            base.fset(self, original_loader())
+            self.__originals[property] = base.fget(self)
+            base.fset(self, loader())
+         else:
+            base.fset(self, loader())
+            self.__originals[property] = base.fget(self)
+      
                                     
    #==========================================================================
    def create_image_of_page(self, page_index):
@@ -104,8 +148,32 @@ class PluginBookData(BookData):
       Overridden to implement abstract method defined in superclass. Writes all 
       eligible properties in this object out to their counterparts in ComicRack 
       (i.e. back into the ComicBook object that was passed into __init__.) 
+      
+      Properties whose values are the same as they were when they were read in
+      from ComicRack are NOT written back, since every write to ComicRack can
+      trigger its change tracking (and maybe a library save.)  Returns the
+      number of properties that were skipped for that reason.
       '''
       ok_to_update = self.updated_properties()
+      unchanged = [] # the properties we didn't write 'cause they're unchanged
+      
+      # returns True iff the given property's value is different than what 
+      # ComicRack currently has.
+      def changed(property):
+         if property in self.__loaders:
+            changed_b = False # never been read or written, so no change
+         else:
+            changed_b = property not in self.__originals or \
+               getattr(self, property) != self.__originals[property] 
+         if not changed_b:
+            unchanged.append(property)
+         return changed_b
+      
+      # records that the given properties' values were written to ComicRack,
+      # so ComicRack has them now.  call this only after a successful write.
+      def wrote(*properties):
+         for property in properties:
+            self.__originals[property] = getattr(self, property)
       
       
       # removes commas from the the given string  
@@ -113,119 +181,175 @@ class PluginBookData(BookData):
          s = re.sub(r",(\s+)", r"\1", s) if s else ""
          return re.sub(r",", r" ", s)
       
+      # true iff this book was previously scraped with the very same issue key
+      # that it is being updated with now (i.e. it is being 'rescraped')
+      rescrape_b = "issue_key_s" in self.__originals and \
+         self.__originals["issue_key_s"] == self.issue_key_s and \
+         self.issue_key_s != BookData.blank("issue_key_s")
+      
       
       if "series_s" in ok_to_update:
-         self.__crbook.Series = self.series_s
+         if changed("series_s"):
+            self.__crbook.Series = self.series_s
+            wrote("series_s")
          ok_to_update.remove("series_s")
 
       if "issue_num_s" in ok_to_update:
-         self.__crbook.Number = self.issue_num_s
+         if changed("issue_num_s"):
+            self.__crbook.Number = self.issue_num_s
+            wrote("issue_num_s")
          ok_to_update.remove("issue_num_s")
       
       if "volume_year_n" in ok_to_update:
-         self.__crbook.Volume = self.volume_year_n
+         if changed("volume_year_n"):
+            self.__crbook.Volume = self.volume_year_n
+            wrote("volume_year_n")
          ok_to_update.remove("volume_year_n")
          
       if "format_s" in ok_to_update:
-         self.__crbook.Format = self.format_s
+         if changed("format_s"):
+            self.__crbook.Format = self.format_s
+            wrote("format_s")
          ok_to_update.remove("format_s")
          
       if "title_s" in ok_to_update:
-         self.__crbook.Title = self.title_s
+         if changed("title_s"):
+            self.__crbook.Title = self.title_s
+            wrote("title_s")
          ok_to_update.remove("title_s")
          
       if "crossovers_sl" in ok_to_update:
-         self.__crbook.AlternateSeries = \
-            ', '.join([cleanup(x) for x in self.crossovers_sl])
+         if changed("crossovers_sl"):
+            self.__crbook.AlternateSeries = \
+               ', '.join([cleanup(x) for x in self.crossovers_sl])
+            wrote("crossovers_sl")
          ok_to_update.remove("crossovers_sl")
          
       if "summary_s" in ok_to_update:
-         self.__crbook.Summary = self.summary_s
+         if changed("summary_s"):
+            self.__crbook.Summary = self.summary_s
+            wrote("summary_s")
          ok_to_update.remove("summary_s")
          
       if "publisher_s" in ok_to_update:
-         self.__crbook.Publisher = self.publisher_s
+         if changed("publisher_s"):
+            self.__crbook.Publisher = self.publisher_s
+            wrote("publisher_s")
          ok_to_update.remove("publisher_s")
          
       if "imprint_s" in ok_to_update:
-         self.__crbook.Imprint = self.imprint_s
+         if changed("imprint_s"):
+            self.__crbook.Imprint = self.imprint_s
+            wrote("imprint_s")
          ok_to_update.remove("imprint_s")
          
       if "characters_sl" in ok_to_update:
-         self.__crbook.Characters = \
-            ', '.join([cleanup(x) for x in self.characters_sl])
+         if changed("characters_sl"):
+            self.__crbook.Characters = \
+               ', '.join([cleanup(x) for x in self.characters_sl])
+            wrote("characters_sl")
          ok_to_update.remove("characters_sl")
             
       if "teams_sl" in ok_to_update:
-         self.__crbook.Teams = \
-            ', '.join([cleanup(x) for x in self.teams_sl])
+         if changed("teams_sl"):
+            self.__crbook.Teams = \
+               ', '.join([cleanup(x) for x in self.teams_sl])
+            wrote("teams_sl")
          ok_to_update.remove("teams_sl")
             
       if "locations_sl" in ok_to_update:
-         self.__crbook.Locations = \
-            ', '.join([cleanup(x) for x in self.locations_sl])
+         if changed("locations_sl"):
+            self.__crbook.Locations = \
+               ', '.join([cleanup(x) for x in self.locations_sl])
+            wrote("locations_sl")
          ok_to_update.remove("locations_sl")
             
       if "writers_sl" in ok_to_update:
-         self.__crbook.Writer = \
-            ', '.join([cleanup(x) for x in self.writers_sl])
+         if changed("writers_sl"):
+            self.__crbook.Writer = \
+               ', '.join([cleanup(x) for x in self.writers_sl])
+            wrote("writers_sl")
          ok_to_update.remove("writers_sl")
             
       if "pencillers_sl" in ok_to_update:
-         self.__crbook.Penciller = \
-            ', '.join([cleanup(x) for x in self.pencillers_sl])
+         if changed("pencillers_sl"):
+            self.__crbook.Penciller = \
+               ', '.join([cleanup(x) for x in self.pencillers_sl])
+            wrote("pencillers_sl")
          ok_to_update.remove("pencillers_sl")
             
       if "inkers_sl" in ok_to_update:
-         self.__crbook.Inker = \
-            ', '.join([cleanup(x) for x in self.inkers_sl])
+         if changed("inkers_sl"):
+            self.__crbook.Inker = \
+               ', '.join([cleanup(x) for x in self.inkers_sl])
+            wrote("inkers_sl")
          ok_to_update.remove("inkers_sl")
          
       if "colorists_sl" in ok_to_update:
-         self.__crbook.Colorist = \
-            ', '.join([cleanup(x) for x in self.colorists_sl])
+         if changed("colorists_sl"):
+            self.__crbook.Colorist = \
+               ', '.join([cleanup(x) for x in self.colorists_sl])
+            wrote("colorists_sl")
          ok_to_update.remove("colorists_sl")
          
       if "letterers_sl" in ok_to_update:
-         self.__crbook.Letterer = \
-            ', '.join([cleanup(x) for x in self.letterers_sl])
+         if changed("letterers_sl"):
+            self.__crbook.Letterer = \
+               ', '.join([cleanup(x) for x in self.letterers_sl])
+            wrote("letterers_sl")
          ok_to_update.remove("letterers_sl")
             
       if "cover_artists_sl" in ok_to_update:
-         self.__crbook.CoverArtist = \
-            ', '.join([cleanup(x) for x in self.cover_artists_sl])
+         if changed("cover_artists_sl"):
+            self.__crbook.CoverArtist = \
+               ', '.join([cleanup(x) for x in self.cover_artists_sl])
+            wrote("cover_artists_sl")
          ok_to_update.remove("cover_artists_sl")
             
       if "editors_sl" in ok_to_update:
-         self.__crbook.Editor = \
-            ', '.join([cleanup(x) for x in self.editors_sl])
+         if changed("editors_sl"):
+            self.__crbook.Editor = \
+               ', '.join([cleanup(x) for x in self.editors_sl])
+            wrote("editors_sl")
          ok_to_update.remove("editors_sl")
          
       if "tags_sl" in ok_to_update:
-         self.__crbook.Tags = \
-            ', '.join([cleanup(x) for x in self.tags_sl])
+         if changed("tags_sl"):
+            self.__crbook.Tags = \
+               ', '.join([cleanup(x) for x in self.tags_sl])
+            wrote("tags_sl")
          ok_to_update.remove("tags_sl")
             
       if "notes_s" in ok_to_update:
-         self.__crbook.Notes = self.notes_s
+         if changed("notes_s"):
+            self.__crbook.Notes = self.notes_s
+            wrote("notes_s")
          ok_to_update.remove("notes_s")
          
       if "webpage_s" in ok_to_update:
-         self.__crbook.Web = self.webpage_s
+         if changed("webpage_s"):
+            self.__crbook.Web = self.webpage_s
+            wrote("webpage_s")
          ok_to_update.remove("webpage_s")
          
       if "rating_n" in ok_to_update:
-         self.__crbook.CommunityRating = self.rating_n
+         if changed("rating_n"):
+            self.__crbook.CommunityRating = self.rating_n
+            wrote("rating_n")
          ok_to_update.remove("rating_n")
          
       if "issue_key_s" in ok_to_update:
-         self.__crbook.SetCustomValue(
-            PluginBookData.__ISSUE_KEY, sstr(self.issue_key_s))
+         if changed("issue_key_s"):
+            self.__crbook.SetCustomValue(
+               PluginBookData.__ISSUE_KEY, sstr(self.issue_key_s))
+            wrote("issue_key_s")
          ok_to_update.remove("issue_key_s")
          
       if "series_key_s" in ok_to_update:
-         self.__crbook.SetCustomValue(
-            PluginBookData.__SERIES_KEY, sstr(self.series_key_s))
+         if changed("series_key_s"):
+            self.__crbook.SetCustomValue(
+               PluginBookData.__SERIES_KEY, sstr(self.series_key_s))
+            wrote("series_key_s")
          ok_to_update.remove("series_key_s")
          
          
@@ -236,37 +360,47 @@ class PluginBookData(BookData):
       if "rel_year_n" in ok_to_update and \
          "rel_month_n" in ok_to_update and \
          "rel_day_n" in ok_to_update:
-         if self.rel_year_n != BookData.blank("rel_year_n") and \
+         if True in [changed(x) for x in 
+               ["rel_year_n", "rel_month_n", "rel_day_n"]] and \
+            self.rel_year_n != BookData.blank("rel_year_n") and \
             self.rel_month_n != BookData.blank("rel_month_n") and \
             self.rel_day_n != BookData.blank("rel_day_n"):
             date = DateTime(self.rel_year_n, self.rel_month_n, self.rel_day_n)
             self.__crbook.ReleasedTime = date
+            wrote("rel_year_n", "rel_month_n", "rel_day_n")
          ok_to_update.remove("rel_year_n")
          ok_to_update.remove("rel_month_n")
          ok_to_update.remove("rel_day_n")
          
         
       if "pub_year_n" in ok_to_update:
-         if self.pub_year_n != BookData.blank("pub_year_n"):
-            self.__crbook.Year = self.pub_year_n
+         if changed("pub_year_n"):
+            if self.pub_year_n != BookData.blank("pub_year_n"):
+               self.__crbook.Year = self.pub_year_n
+               wrote("pub_year_n")
          ok_to_update.remove("pub_year_n")
          
       if "pub_month_n" in ok_to_update:
-         if self.pub_year_n != BookData.blank("pub_year_n") and \
-            self.pub_month_n != BookData.blank("pub_month_n"):
-            self.__crbook.Month = self.pub_month_n
+         if changed("pub_month_n"):
+            if self.pub_year_n != BookData.blank("pub_year_n") and \
+               self.pub_month_n != BookData.blank("pub_month_n"):
+               self.__crbook.Month = self.pub_month_n
+               wrote("pub_month_n")
          ok_to_update.remove("pub_month_n")
          
       if "pub_day_n" in ok_to_update:
-         if self.pub_year_n != BookData.blank("pub_year_n") and \
-            self.pub_month_n != BookData.blank("pub_month_n") and \
-            self.pub_day_n != BookData.blank("pub_day_n"):
-            self.__crbook.Day = self.pub_day_n
+         if changed("pub_day_n"):
+            if self.pub_year_n != BookData.blank("pub_year_n") and \
+               self.pub_month_n != BookData.blank("pub_month_n") and \
+               self.pub_day_n != BookData.blank("pub_day_n"):
+               self.__crbook.Day = self.pub_day_n
+               wrote("pub_day_n")
          ok_to_update.remove("pub_day_n")
       
    
       # we only download and install a thumbnail for fileless CR books, and
-      # even then, only if the user's prefs indicate that they want us to      
+      # even then, only if the user's prefs indicate that they want us to.
+      # a book that is being rescraped already has this issue's thumbnail.
       if "cover_url_s" in ok_to_update:
          already_has_thumb = self.__crbook.CustomThumbnailKey
          book_is_fileless = not self.path_s
@@ -276,6 +410,8 @@ class PluginBookData(BookData):
                not config.download_thumbs_b or \
                (already_has_thumb and config.preserve_thumbs_b): 
             pass
+         elif already_has_thumb and rescrape_b:
+            unchanged.append("cover_url_s")
          else:
             image = db.query_image(self.cover_url_s)
             if not image:
@@ -294,3 +430,34 @@ class PluginBookData(BookData):
             log.debug(self.__class__.__name__ + " can't update property: " + s)
          raise Exception()
       
+      if unchanged:
+         log.debug("skipped writing ", len(unchanged), 
+            " unchanged value(s) back to ComicRack")
+      return len(unchanged)
+
+
+#==============================================================================
+def __lazy_property(property_s):
+   '''
+   Creates a replacement for the BookData property with the given name, which 
+   behaves just like the original except that in a PluginBookData, the value 
+   is only read in from ComicRack the first time it is actually used.
+   '''
+   base = BookData.__dict__[property_s]
+   
+   def getter(self):
+      self._load_property(property_s)
+      return base.fget(self)
+   
+   def setter(self, value):
+      self._load_property(property_s) # so we know the original value
+      base.fset(self, value)
+      
+   def deleter(self):
+      self._load_property(property_s) # so we know the original value
+      base.fdel(self)
+      
+   return property(getter, setter, deleter, base.__doc__)
+
+for __property_s in BookData.all_properties():
+   setattr(PluginBookData, __property_s, __lazy_property(__property_s))
@@ -15,17 +15,25 @@ You can easily obtain your own key for free at:
 '''
 
 import clr
+import cvjson
+import hashlib
+import httpclient
 import log
+import responsecache
+import taskqueue
 import xml2py
+from singleflight import SingleFlight
+from throttle import Throttle
 from utils import sstr
-from dberrors import DatabaseConnectionError
+from dberrors import DatabaseConnectionError, DatabaseOfflineError
 import utils
 import re
+import urlparse
 
 clr.AddReference('System')
-from System import DateTime
 from System.Net import WebException
-from System.IO import IOException
+from System.IO import Directory, File, IOException, Path
+from System.Text import UTF8Encoding
 from System.Web import HttpUtility
 
 clr.AddReference('IronPython')
@@ -33,12 +41,126 @@ from System.Threading import Thread, ThreadStart
 
 __CLIENTID = '&client=cvscraper'
 
-# this value is used to throttle our query speeds
-__next_query_time_ms = 0
+# the amount of time to wait between queries right now (see _initialize)
+__query_delay_ms = 1250
 
 # the amount of time to wait between queries
 __QUERY_DELAY_MS = 1250 
 
+# paces our queries (from all threads) so they are __query_delay_ms apart
+__throttle = Throttle("cv.throttle", __QUERY_DELAY_MS)
+
+# the base url for all of our comicvine api queries.  this can be changed
+# (see _initialize) to point at a local stand-in server, for benchmarking.
+__API_URL = 'http://comicvine.gamespot.com/api/'
+__api_url_s = __API_URL
+
+# if this isn't None, it is the directory that we are recording all of our
+# comicvine responses (and cover images) into, for the stand-in server.
+__record_dir_s = None
+
+# True if we are working offline, i.e. answering every query from the response
+# cache instead of contacting comicvine.  see _initialize and _is_offline.
+__offline_b = False
+
+# True if we should start working offline automatically, as soon as we 
+# discover that comicvine can't be reached.
+__auto_offline_b = True
+
+# the default amount of time (in milliseconds) that a response in the 
+# responsecache stays fresh, i.e. can be used without asking comicvine if it
+# has changed.  this is the same as cvdb's TTL for missing issues.
+__RESPONSE_TTL_MS = 15 * 60 * 1000
+
+# the amount of time that a cached response stays fresh right now
+__response_ttl_ms = __RESPONSE_TTL_MS
+
+# if True, cached responses that aren't fresh are used right away anyway, and 
+# revalidated in the background.  if False, they are revalidated first.
+__stale_while_revalidate_b = False
+
+# the format ('xml' or 'json') that we ask comicvine to send its responses in
+__format_s = 'xml'
+
+# concurrent downloads of the same api url (i.e. from the scraper thread and
+# the taskqueue's prefetch threads) share one request, and its parsed dom
+__flights = SingleFlight("cv.query")
+
+
+# =============================================================================
+def _initialize(api_url_s=None, query_delay_ms=None, record_dir_s=None,
+      offline_b=False, auto_offline_b=True, response_ttl_ms=None,
+      stale_while_revalidate_b=False, format_s=None):
+   '''
+   Sets up this module's connection to ComicVine.  By default, we talk to 
+   the real ComicVine api, politely waiting between queries.  Every response
+   that we get is also stored in the (persistent) responsecache, and reused
+   until it expires.  Expired responses are revalidated with a conditional 
+   request, so they are only downloaded again if they have changed.
+   
+   'api_url_s' -> a different base url for the api (i.e. a local stand-in 
+       server, see tools/cvstandin) or None for the real one.
+   'query_delay_ms' -> a different delay between queries, or None.
+   'record_dir_s' -> if not None, every api response and cover image that we
+       download is also recorded in this directory, in the stand-in server's 
+       fixture format.
+   'offline_b' -> if True, we work offline:  every query is answered from the 
+       responsecache, and queries that aren't cached raise a 
+       DatabaseOfflineError.  
+   'auto_offline_b' -> if True, we start working offline as soon as we find 
+       that comicvine can't be reached.
+   'response_ttl_ms' -> a different amount of time that cached responses stay
+       fresh (0 revalidates them every time), or None.
+   'stale_while_revalidate_b' -> if True, expired cached responses are used 
+       right away, and revalidated in the background (see taskqueue.)
+   'format_s' -> 'json' to get comicvine's responses in JSON (see cvjson), 
+       or 'xml' or None to get them in XML.  While recording, responses are
+       always XML, since that's what the stand-in server's fixtures are.
+   '''
+   global __api_url_s, __query_delay_ms, __record_dir_s
+   global __offline_b, __auto_offline_b
+   global __response_ttl_ms, __stale_while_revalidate_b, __format_s
+   __api_url_s = api_url_s.rstrip('/') + '/' if api_url_s else __API_URL
+   __query_delay_ms = __QUERY_DELAY_MS if query_delay_ms is None \
+      else max(0, int(query_delay_ms))
+   __throttle.delay_ms = __query_delay_ms
+   __record_dir_s = record_dir_s if record_dir_s else None
+   __offline_b = offline_b
+   __auto_offline_b = auto_offline_b
+   __response_ttl_ms = __RESPONSE_TTL_MS if response_ttl_ms is None \
+      else max(0, int(response_ttl_ms))
+   __stale_while_revalidate_b = stale_while_revalidate_b
+   __format_s = 'json' if sstr(format_s).lower() == 'json' else 'xml'
+   if __record_dir_s and __format_s != 'xml':
+      # the stand-in server only reads xml fixtures (and converts them to json
+      # when asked) so we always record xml responses
+      log.debug("recording comicvine responses, so asking for xml, not ",
+         __format_s)
+      __format_s = 'xml'
+   if __api_url_s != __API_URL or __query_delay_ms != __QUERY_DELAY_MS:
+      log.debug("using comicvine api at ", __api_url_s, 
+         " (", __query_delay_ms, " ms between queries)")
+   if __record_dir_s:
+      log.debug("recording comicvine responses in: ", __record_dir_s)
+   if __offline_b:
+      log.debug("WORKING OFFLINE: using cached comicvine responses only")
+   if __response_ttl_ms != __RESPONSE_TTL_MS or __stale_while_revalidate_b:
+      log.debug("cached comicvine responses stay fresh for ",
+         __response_ttl_ms, " ms", " (then used while revalidating)" 
+         if __stale_while_revalidate_b else "")
+   if __format_s != 'xml':
+      log.debug("asking comicvine for ", __format_s, " responses")
+      
+      
+# =============================================================================
+def _is_offline():
+   ''' 
+   Returns True if we are working offline right now, either because we were
+   asked to (see _initialize) or because comicvine couldn't be reached.
+   '''
+   return __offline_b
+
+
 # =============================================================================
 def _query_series_ids_dom(API_KEY, searchterm_s, page_n=1):
    ''' 
@@ -52,8 +174,9 @@ def _query_series_ids_dom(API_KEY, searchterm_s, page_n=1):
    '''
    
    # {0} is the search string, {1} is the page number of the results we want
-   QUERY = 'http://comicvine.gamespot.com/api/search/?api_key=' + API_KEY + \
-      __CLIENTID + '&format=xml&limit=100&resources=volume' + \
+   QUERY = __api_url_s + 'search/?api_key=' + API_KEY + \
+      __CLIENTID + '&format=' + __format_s + \
+      '&limit=100&resources=volume' + \
       '&field_list=name,start_year,publisher,id,image,count_of_issues' + \
       '&query={0}'
    # leave "page=1" off of query to fix a bug, e.g. search for 'bprd vampire'
@@ -75,8 +198,8 @@ def _query_series_details_dom(API_KEY, seriesid_s):
    This method doesn't return null, but it may throw Exceptions.
    '''
    # {0} is the series id, an integer.
-   QUERY = 'http://comicvine.gamespot.com/api/volume/4050-{0}/?api_key=' \
-     + API_KEY + __CLIENTID + '&format=xml' \
+   QUERY = __api_url_s + 'volume/4050-{0}/?api_key=' \
+     + API_KEY + __CLIENTID + '&format=' + __format_s \
      + '&field_list=name,start_year,publisher,image,count_of_issues,id'
       # parsing relies on 'field_list' specifying 2 or more elements!!
       
@@ -98,8 +221,9 @@ def _query_issue_ids_dom(API_KEY, seriesid_s, page_n=1):
    '''
    
    # {0} is the series ID, an integer     
-   QUERY = 'http://comicvine.gamespot.com/api/issues/?api_key=' + API_KEY + __CLIENTID +\
-      '&format=xml&field_list=name,issue_number,id,image&filter=volume:{0}'
+   QUERY = __api_url_s + 'issues/?api_key=' + API_KEY + __CLIENTID +\
+      '&format=' + __format_s + \
+      '&field_list=name,issue_number,id,image&filter=volume:{0}'
    PAGE = "" if page_n == 1 \
       else "&page={0}&offset={1}".format(page_n, (page_n-1)*100)
    
@@ -118,49 +242,103 @@ def _query_issue_id_dom(API_KEY, seriesid_s, issue_num_s):
    '''
    
    # {0} is the series ID, an integer, and {1} is issue number, a string     
-   QUERY = 'http://comicvine.gamespot.com/api/issues/?api_key=' + API_KEY + \
-      __CLIENTID + '&format=xml&field_list=name,issue_number,id,image' + \
+   QUERY = __api_url_s + 'issues/?api_key=' + API_KEY + \
+      __CLIENTID + '&format=' + __format_s + \
+      '&field_list=name,issue_number,id,image' + \
       '&filter=volume:{0},issue_number:{1}'
    
+   issue_num_s = _issue_num_query_s(issue_num_s)
+   if not seriesid_s or not issue_num_s:
+      raise ValueError('bad parameters')
+   return __get_dom( QUERY.format(sstr(seriesid_s), 
+      HttpUtility.UrlPathEncode(sstr(issue_num_s)) ) )
+
+
+
+# =============================================================================
+def _issue_num_query_s(issue_num_s):
+   '''
+   Returns the form of the given issue number that _query_issue_id_dom() 
+   actually sends to ComicVine.  ComicVine's issue number filter only matches
+   exact strings, so two issue numbers give the same results iff they have 
+   the same query form.  Returns '' for a blank issue number.
+   '''
    # cv does not play well with leading zeros in issue nums. see issue #403.
    issue_num_s = sstr(issue_num_s).strip()
    if len(issue_num_s) > 0:  # fix issue 411
       issue_num_s = issue_num_s.lstrip('0').strip()
       issue_num_s = issue_num_s if len(issue_num_s) > 0 else '0'
-   
-   
-   if not seriesid_s or not issue_num_s:
-      raise ValueError('bad parameters')
-   return __get_dom( QUERY.format(sstr(seriesid_s), 
-      HttpUtility.UrlPathEncode(sstr(issue_num_s)) ) )
+   return issue_num_s
 
 
 
 # =============================================================================
-def _query_issue_details_dom(API_KEY, issueid_s):
+def _query_issue_details_dom(API_KEY, issueid_s, field_list_s=None):
    ''' 
    Performs a query that will obtain a dom containing the ComicVine API details
-   for given issue.
+   for given issue.  If a (comma separated) 'field_list_s' is given, the dom
+   only contains those details; otherwise it contains all of them.
    
    Never returns null, but may throw exceptions if there are problems.
    '''
    
    # {0} is the issue ID 
-   QUERY = 'http://comicvine.gamespot.com/api/issue/4000-{0}/?api_key=' \
-      + API_KEY + __CLIENTID + '&format=xml'
+   QUERY = __api_url_s + 'issue/4000-{0}/?api_key=' \
+      + API_KEY + __CLIENTID + '&format=' + __format_s
+   # parsing relies on 'field_list' specifying 2 or more elements!!
+   FIELDS = '&field_list=' + field_list_s if field_list_s else ''
       
    if issueid_s is None or issueid_s == '':
       raise ValueError('bad parameters')
-   url = QUERY.format(sstr(issueid_s) )
+   url = QUERY.format(sstr(issueid_s) ) + FIELDS
    return __get_dom(url)
 
 
 # =============================================================================
-def __get_dom(url, lasttry=False):
+def __get_dom(url):
    ''' 
    Obtains a parsed comicvine-formatted DOM tree from the XML at the given URL. 
    Never returns null, but may throw an exception if it has any problems
-   downloading or parsing the XML.
+   downloading or parsing the XML.  
+   
+   If the URL's response is in the responsecache and still fresh, the DOM
+   comes from there.  If it is cached but not fresh, it is revalidated first
+   (or, with the stale-while-revalidate policy, afterwards, in the background.)
+   
+   If we are working offline, the DOM comes from the responsecache instead,
+   and if it isn't cached, this method throws a DatabaseOfflineError.
+   
+   If another thread is already downloading the same URL, this method waits 
+   for it and returns the same DOM, rather than downloading it a second time.
+   '''
+   
+   if __offline_b:
+      return __get_cached_dom(url)
+   
+   # when we're recording, every response must come from comicvine
+   cached = None if __record_dir_s else responsecache.load(__cache_key_s(url))
+   if cached and cached.age_ms < __response_ttl_ms:
+      log.count("cv.response.fresh")
+      return __parse_dom(url, cached.response_s)
+   elif cached and __stale_while_revalidate_b and \
+         __revalidate_later(url, cached):
+      log.count("cv.response.stale")
+      return __parse_dom(url, cached.response_s)
+   else:
+      return __flights.do(__cache_key_s(url), 
+         lambda: __download_dom(url, cached))
+   
+   
+# =============================================================================
+def __download_dom(url, cached, lasttry=False):
+   ''' 
+   Obtains a parsed comicvine-formatted DOM tree from the XML at the given URL,
+   by downloading it from comicvine.  If the given CachedResponse (from the 
+   responsecache) isn't None, we only download the XML if it has changed; 
+   otherwise the cached response is used (and made fresh again.)
+   
+   Never returns null, but may throw an exception if it has any problems
+   downloading or parsing the XML.  
    '''
    
    retval = None
@@ -168,11 +346,25 @@ def __get_dom(url, lasttry=False):
    
    #1. obtain xml from comicvine
    xml = None
+   etag_s = None
+   modified_s = None
    if not error_occurred:
-      try: xml = __get_page( url )
+      try: xml, etag_s, modified_s = __get_page(url, cached)
       except Exception, ex:
-         if lasttry: raise ex
+         if lasttry and __auto_offline_b and \
+               type(ex) == DatabaseConnectionError:
+            # comicvine can't be reached, even after a retry
+            __go_offline(ex)
+            return __get_cached_dom(url)
+         elif lasttry: raise ex
          else: error_occurred = True
+         
+   #1b. if the xml hasn't changed, use our cached copy of it
+   if not error_occurred and xml is None and cached:
+      log.count("cv.response.revalidated")
+      responsecache.store(__cache_key_s(url), cached.response_s, 
+         etag_s, modified_s)
+      return __parse_dom(url, cached.response_s)
    
    #2. make the xml is not empty
    if not error_occurred:
@@ -181,12 +373,13 @@ def __get_dom(url, lasttry=False):
          if lasttry: raise Exception(msg)
          else: error_occurred = True
          
-   # 3. convert the xml into a dom
+   # 3. convert the xml (or json) into a dom
    dom = None   
    if not error_occurred:
       try:
-         xml = __strip_invalid_xml_chars(xml)
-         dom = xml2py.parseString(xml)
+         if not __is_json(url):
+            xml = __strip_invalid_xml_chars(xml)
+         dom = __parse_dom(url, xml)
       except Exception, ex:
          if lasttry: raise ex
          else: error_occurred = True
@@ -202,6 +395,8 @@ def __get_dom(url, lasttry=False):
    if not error_occurred:
       if int(dom.status_code) == 1:
          retval = dom # success
+         log.count("cv.response.miss")
+         responsecache.store(__cache_key_s(url), xml, etag_s, modified_s)
       else:
          if lasttry: raise DatabaseConnectionError("Comic Vine", url, 
             'code {0}: "{1}"'.format(dom.status_code, dom.error),
@@ -214,23 +409,104 @@ def __get_dom(url, lasttry=False):
       t = Thread(ThreadStart(lambda x=0: Thread.CurrentThread.Sleep(2500)))
       t.Start()
       t.Join()
-      return __get_dom(url, True)
+      return __download_dom(url, cached, True)
    else:            
       return retval
         
          
 # =============================================================================
-def __get_page(url):
+def __get_cached_dom(url):
+   '''
+   Obtains a parsed comicvine-formatted DOM tree for the given URL from the
+   responsecache, without contacting comicvine at all.  Never returns null, 
+   but throws a DatabaseOfflineError if the URL's response isn't cached.
+   '''
+   cached = responsecache.load(__cache_key_s(url))
+   if not cached:
+      raise DatabaseOfflineError("Comic Vine", url)
+   return __parse_dom(url, cached.response_s)
+   
+   
+# =============================================================================
+def __parse_dom(url, page):
+   ''' 
+   Parses the given (cleaned up) response page for the given URL into a DOM 
+   tree, using cvjson if it is a JSON response, or xml2py if it is XML. 
+   Both produce the same DOM for the same response.
+   '''
+   if __is_json(url):
+      with log.span("cvjson.parseString"):
+         resource_s = _fixture_key_s(url).split('?')[0].split('/')[0]
+         return cvjson.parseString(page, resource_s)
+   else:
+      with log.span("xml2py.parseString"):
+         return xml2py.parseString(page)
+   
+   
+# =============================================================================
+def __is_json(url):
+   ''' Returns True iff the given api url asks for a JSON response. '''
+   return '&format=json' in url
+   
+   
+# =============================================================================
+def __revalidate_later(url, cached):
+   '''
+   Submits a background task to the shared taskqueue that revalidates the 
+   given (stale) CachedResponse for the given URL, so that it will be fresh 
+   the next time that someone needs it.  Returns False if that can't be done 
+   (i.e. the taskqueue isn't running), so the caller must revalidate it now.
+   '''
+   def revalidate():
+      try:
+         __flights.do(__cache_key_s(url), 
+            lambda: __download_dom(url, cached))
+      except:
+         log.debug_exc("WARNING: couldn't revalidate cached response: " + url)
+   try:
+      taskqueue.submit(revalidate, taskqueue.BACKGROUND, ("cv.revalidate", url))
+      return True
+   except:
+      return False
+   
+   
+# =============================================================================
+def __go_offline(cause):
+   '''
+   Starts working offline (for the rest of this scrape), because of the given
+   error contacting comicvine.
+   '''
+   global __offline_b
+   if not __offline_b:
+      __offline_b = True
+      log.debug("COMICVINE CAN'T BE REACHED, SO WORKING OFFLINE FROM NOW ON:")
+      log.debug("   ", sstr(cause).replace('\r',''))
+   
+   
+# =============================================================================
+def __get_page(url, cached=None):
    ''' 
-   Reads the webpage at the given URL into a new string, which is returned.  
-   The returned value may be None if a problem is encountered, OR an exception 
-   may be thrown.   If the exception is a DatabaseConnectionError, that 
-   represents an problem connecting to the Comic Vine database.
+   Reads the webpage at the given URL into a new string.  If the given 
+   CachedResponse isn't None, the page is only read if it is different than
+   that cached response.  Returns a tuple containing the page (or None if it
+   didn't change) and its ETag and Last-Modified values (either may be None.)
+   
+   An exception may be thrown.   If the exception is a DatabaseConnectionError,
+   that represents an problem connecting to the Comic Vine database.
    '''
-   wait_until_ready() # throttle request speed to make ComicVine happy
+   with log.span("cv.throttle"):
+      wait_until_ready() # throttle request speed to make ComicVine happy
 
    try:
-      return utils.get_html_string(url)
+      with log.span("cv.get_page", url=url):
+         page, etag_s, modified_s = httpclient.get_string_if_modified(url, 
+            cached.etag_s if cached else None, 
+            cached.modified_s if cached else None)
+         if page is not None:
+            if __record_dir_s: __record_page(url, page)
+            # json strings are html decoded one at a time (see cvjson)
+            if not __is_json(url): page = utils.html_decode(page)
+         return page, etag_s, modified_s
    except (WebException, IOException) as wex:
       # this type of exception almost certainly means that the user's internet
       # is broken or the comicvine website is down.  so wrap it in a nice, 
@@ -263,13 +539,74 @@ def wait_until_ready():
    '''
    Waits until a fixed amount of time has passed since this function was 
    last called.  Returns immediately if that much time has already passed.
+   
+   This is safe to call from any thread (i.e. the scraper thread and the
+   taskqueue's image download threads); concurrent callers wait their turn,
+   first come first served.  See Throttle.
    '''
-   global __next_query_time_ms, __QUERY_DELAY_MS 
-   time_ms = (DateTime.Now-DateTime(1970,1,1)).TotalMilliseconds
-   wait_ms = __next_query_time_ms - time_ms
-   if ( wait_ms > 0 ):
-      t = Thread(ThreadStart(lambda x=0: Thread.CurrentThread.Sleep(wait_ms)))
-      t.Start()
-      t.Join()
-   time_ms = (DateTime.Now-DateTime(1970,1,1)).TotalMilliseconds
-   __next_query_time_ms = time_ms + __QUERY_DELAY_MS
+   __throttle.wait()
+
+   
+# =============================================================================
+def _fixture_key_s(url):
+   '''
+   Returns the key that identifies the response for the given api url in the
+   stand-in server's fixture format:  the api resource path (i.e. 
+   "issue/4000-123") and the sorted query parameters, minus the api key.  
+   The stand-in server computes exactly the same keys.
+   '''
+   parts = urlparse.urlsplit(url)
+   path_s = parts.path[parts.path.find('/api/') + 5:].strip('/') \
+      if '/api/' in parts.path else parts.path.strip('/')
+   params = [ p for p in urlparse.parse_qsl(parts.query) 
+      if p[0] not in ('api_key', 'client') ]
+   return path_s + '?' + '&'.join(sorted(k + '=' + v for k, v in params))
+   
+   
+# =============================================================================
+def __cache_key_s(url):
+   '''
+   Returns the key that identifies the response for the given api url in the
+   responsecache.  Responses from anywhere other than the real comicvine api
+   (i.e. a stand-in server) get different keys, so they never mix.
+   '''
+   key_s = _fixture_key_s(url)
+   return key_s if __api_url_s == __API_URL else __api_url_s + key_s
+   
+   
+# =============================================================================
+def __record_page(url, page):
+   '''
+   Records the given (raw) api response page for the given url into our 
+   recording directory, in the stand-in server's fixture format.
+   '''
+   try:
+      key_s = _fixture_key_s(url)
+      dir_s = Path.Combine(__record_dir_s, 'api', key_s.split('/')[0])
+      if not Directory.Exists(dir_s):
+         Directory.CreateDirectory(dir_s)
+      name_s = hashlib.md5(key_s.encode('utf-8')).hexdigest()
+      File.WriteAllText(Path.Combine(dir_s, name_s + '.key'), key_s)
+      File.WriteAllText(Path.Combine(dir_s, name_s + '.xml'), page,
+         UTF8Encoding())
+   except:
+      log.debug_exc("WARNING: couldn't record comicvine response: " + url)
+      
+
+# =============================================================================
+def _record_image(url_s, data):
+   '''
+   If we are recording (see _initialize), records the given downloaded image
+   file bytes for the given image url, in the stand-in server's fixture format.
+   '''
+   if __record_dir_s and url_s:
+      try:
+         dir_s = Path.Combine(__record_dir_s, 'images')
+         if not Directory.Exists(dir_s):
+            Directory.CreateDirectory(dir_s)
+         ext_s = Path.GetExtension(urlparse.urlsplit(url_s).path).lower()
+         name_s = hashlib.md5(url_s.encode('utf-8')).hexdigest() + \
+            (ext_s if ext_s else '.jpg')
+         File.WriteAllBytes(Path.Combine(dir_s, name_s), data)
+      except:
+         log.debug_exc("WARNING: couldn't record image: " + url_s)
@@ -10,17 +10,21 @@ NOT call these functions directly.
 
 import clr
 import cvconnection
+import httpclient
 import log
 import re
+import thumbcache
 import utils
 from utils import is_string, sstr 
 from dbmodels import IssueRef, SeriesRef, Issue
-from resources import Resources
+from dberrors import DatabaseOfflineError
+from singleflight import SingleFlight
 import cvimprints
 
 clr.AddReference('System')
-from System.Net import WebRequest
-from System.IO import Directory, File, Path, StreamReader
+from System import Environment
+from System.Diagnostics import Stopwatch
+from System.IO import Directory, File, MemoryStream, Path, StreamReader
 from System.Text import Encoding
 
 clr.AddReference('System.Drawing')
@@ -34,6 +38,25 @@ __series_details_cache = None
 # it must be set when calling initialize.
 __api_key = ""
 
+# the comma separated list of fields that _query_issue asks comicvine for 
+# (see __issue_field_list_s), or None to ask for all of them.
+__issue_field_list_s = None
+
+# how long (in milliseconds) query_issue_ref remembers that an issue number 
+# wasn't found in a series, before it's willing to ask comicvine again
+__ISSUE_MISS_TTL_MS = 15 * 60 * 1000
+
+# this cache is used to speed up query_issue_ref when an issue doesn't exist.
+# it maps (series key, issue number key) tuples to the time (in ms, on the 
+# monotonic Stopwatch clock) when the lookup for that issue should be retried.
+# unlike the other caches, it lives as long as the main app does, so it spans
+# separate scrape operations.  only lookups that found NO issues are cached.
+__issue_miss_cache = {}
+
+# concurrent downloads of the same image url (i.e. from the cover panels and
+# the taskqueue's prefetch threads) share one request
+__image_flights = SingleFlight("cv.image")
+
 
 # =============================================================================
 def _initialize(**kwargs):
@@ -41,13 +64,71 @@ def _initialize(**kwargs):
    ComicVine implementation of the identically named method in the db.py 
    You must pass in a valid Comic Vine api key as a keyword argument to this
    method, like so:    _initialize(**{'cv_apikey','my-key-here'})
+   
+   You can also pass in the scrape's Configuration ('cv_config'), so that 
+   _query_issue only asks for the issue details that will actually be used.
    '''
-   global __series_details_cache, __api_key
+   global __series_details_cache, __api_key, __issue_field_list_s
    __series_details_cache = {}
    __api_key = kwargs["cv_apikey"] if "cv_apikey" in kwargs else ""
+   __issue_field_list_s = __issue_field_list(kwargs.get("cv_config"))
    
    if not __api_key: raise Exception("You must set a ComicVine API key!") 
    
+   # these are normally only used for testing and benchmarking; they can also
+   # be set with environment variables, so that we can use them in a normal
+   # ComicRack session.  see tools/cvstandin for more details.
+   # note that falsey values (i.e. a ttl of 0) are real settings, too.
+   def setting(key_s, env_s):
+      value = kwargs.get(key_s) 
+      return value if value is not None \
+         else Environment.GetEnvironmentVariable(env_s)
+   def number(value):
+      return None if value is None or sstr(value).strip() == "" \
+         else int(value)
+   query_delay_s = setting("cv_query_delay_ms", "CVS_QUERY_DELAY_MS")
+   ttl_s = setting("cv_response_ttl_ms", "CVS_RESPONSE_TTL_MS")
+   stale_s = setting("cv_stale_while_revalidate", "CVS_STALE_WHILE_REVALIDATE")
+   cvconnection._initialize( setting("cv_api_url", "CVS_API_URL"),
+      number(query_delay_s),
+      setting("cv_record_dir", "CVS_RECORD_DIR"),
+      kwargs.get("cv_offline", False), kwargs.get("cv_auto_offline", True),
+      number(ttl_s), sstr(stale_s).lower() in ("1","true"),
+      setting("cv_format", "CVS_FORMAT") )
+   connections_s = setting("cv_http_connections", "CVS_HTTP_CONNECTIONS")
+   timeout_s = setting("cv_http_timeout_ms", "CVS_HTTP_TIMEOUT_MS")
+   httpclient.configure( number(connections_s), number(timeout_s) )
+   
+# =============================================================================
+def __issue_field_list(config):
+   '''
+   Returns the comma separated list of comicvine fields that issue details
+   queries need, for a scrape with the given Configuration:  the fields that
+   are always needed (ids, series, number and cover), plus the fields for 
+   each kind of metadata that it updates.  Returns None (all fields) if the 
+   given Configuration is None.
+   '''
+   if not config:
+      return None
+   fields_sl = ["id", "volume", "issue_number", "image"]
+   optional = [ 
+      ("name", config.update_title_b),
+      ("cover_date", config.update_published_b),
+      ("store_date", config.update_released_b),
+      ("description", config.update_summary_b),
+      ("site_detail_url", config.update_webpage_b),
+      ("story_arc_credits", config.update_crossovers_b),
+      ("character_credits", config.update_characters_b),
+      ("team_credits", config.update_teams_b),
+      ("location_credits", config.update_locations_b),
+      ("person_credits", config.update_writer_b or config.update_penciller_b 
+         or config.update_inker_b or config.update_cover_artist_b 
+         or config.update_colorist_b or config.update_letterer_b
+         or config.update_editor_b) ]
+   fields_sl += [ field_s for field_s, update_b in optional if update_b ]
+   return ','.join(fields_sl)
+
+   
 # =============================================================================
 def _shutdown():
    ''' ComicVine implementation of the identically named method in the db.py '''
@@ -55,6 +136,12 @@ def _shutdown():
    __series_details_cache = None
       
 
+# =============================================================================
+def _is_offline():
+   ''' ComicVine implementation of the identically named method in the db.py '''
+   return cvconnection._is_offline()
+
+
 # =============================================================================
 def _get_db_name_s():
    ''' ComicVine implementation of the identically named method in the db.py '''
@@ -122,6 +209,8 @@ def _check_magic_file(path_s):
          num_results_n = int(dom.number_of_total_results)
          series_ref =\
             __volume_to_seriesref(dom.results) if num_results_n==1 else None
+      except DatabaseOfflineError:
+         raise # we can't tell whether the file is good until we're online 
       except:
          log.debug_exc("error getting SeriesRef for: " + sstr(series_key_s))
          
@@ -164,6 +253,8 @@ def _query_series_refs(search_terms_s, callback_function):
                num_results_n = int(dom.number_of_total_results)
                if num_results_n == 1:
                   series_refs.add(__volume_to_seriesref(dom.results))
+            except DatabaseOfflineError:
+               raise
             except:
                pass # happens when the user enters an non-existent key
       
@@ -365,9 +456,29 @@ def __issue_to_issueref(issue):
 
 
 # =============================================================================
-def query_issue_ref(series_ref, issue_num_s):
-   ''' ComicVine implementation of the identically named method in the db.py '''
+def query_issue_ref(series_ref, issue_num_s, issue_refs=None):
+   ''' 
+   ComicVine implementation of the identically named method in the db.py.
+   If the caller already has all the IssueRefs in the given series, it can 
+   pass them in as 'issue_refs', so we can find the issue without querying.
+   If it isn't there (exactly once) we still query for it, as usual.
+   '''
+   if issue_refs is not None:
+      issue_ref = __find_issue_ref(issue_refs, issue_num_s)
+      if issue_ref:
+         return issue_ref
+   
    series_key = series_ref.series_key  
+   # issue numbers that are sent the same way (i.e. '5', ' 5' and '05') share
+   # a miss entry.  the time comes from a monotonic clock, so changes to the 
+   # system clock don't matter.
+   miss_key = (series_key, _issue_num_key_s(issue_num_s))
+   now_ms = Stopwatch.GetTimestamp() * 1000.0 / Stopwatch.Frequency
+   if __issue_miss_cache.get(miss_key, 0) > now_ms:
+      log.debug("issue ", sstr(issue_num_s), " isn't in series ", 
+         sstr(series_key), " (cached)")
+      return None
+   
    dom = cvconnection._query_issue_id_dom(__api_key, series_key, issue_num_s)
    num_results_n = int(dom.number_of_total_results) if dom else 0
    attempts = 1
@@ -384,7 +495,48 @@ def query_issue_ref(series_ref, issue_num_s):
                   __api_key, series_key, issue_num_s)
          num_results_n = int(dom.number_of_total_results) if dom else 0
          
-   return __issue_to_issueref(dom.results.issue) if num_results_n==1 else None 
+   if num_results_n == 1:
+      __issue_miss_cache.pop(miss_key, None)
+      return __issue_to_issueref(dom.results.issue)
+   else:
+      # ambiguous results (more than one issue) aren't misses, so we don't 
+      # cache them; they're rare, and comicvine's data may be fixed any time.
+      if num_results_n == 0:
+         if len(__issue_miss_cache) > 1000:
+            __issue_miss_cache.clear() # keep the cache from getting too big
+         __issue_miss_cache[miss_key] = now_ms + __ISSUE_MISS_TTL_MS
+      return None 
+
+
+# =============================================================================
+def _issue_num_key_s(issue_num_s):
+   '''
+   Returns the form of the given issue number that we actually send to 
+   ComicVine when we look it up.  Issue numbers that have the same form 
+   always find the same issue, so this is safe to use as a cache key.
+   '''
+   return cvconnection._issue_num_query_s(issue_num_s)
+
+
+# =============================================================================
+def __find_issue_ref(issue_refs, issue_num_s):
+   '''
+   Finds the IssueRef with the given issue number (or one of its alternate 
+   forms, just like query_issue_ref would try) in the given IssueRefs.  
+   Returns None if there isn't exactly one such IssueRef.
+   '''
+   issue_num_s = sstr(issue_num_s)
+   for attempt in range(4):
+      key_s = issue_num_s.strip().lower()
+      matches = [ref for ref in issue_refs 
+         if ref.issue_num_s.strip().lower() == key_s]
+      if matches:
+         return matches[0] if len(matches) == 1 else None
+      new_issue_num_s = __alternate_issue_num_s(issue_num_s)
+      if new_issue_num_s == issue_num_s:
+         break
+      issue_num_s = new_issue_num_s
+   return None
 
 
 # =============================================================================
@@ -406,7 +558,7 @@ def __alternate_issue_num_s(issue_num_s):
    return issue_num_s
 
 # =============================================================================
-def _query_image( ref, lasttry = False ):
+def _query_image( ref, display_b, lasttry = False ):
    ''' ComicVine implementation of the identically named method in the db.py '''
    
    retval = None # the Image object that we will return
@@ -420,34 +572,52 @@ def _query_image( ref, lasttry = False ):
    elif is_string(ref):
       image_url_s = ref
    
-   # 2. attempt to load the image for the URL
+   # 2. if we've downloaded this image before, it's in the thumbcache
    if image_url_s:
-      response = None
-      response_stream = None
+      retval = thumbcache.load_image(image_url_s, display_b)
+
+   # 3. otherwise, attempt to download the image for the URL (unless we are
+   #    working offline, in which case there's no image for it at all)
+   if image_url_s and not retval and not cvconnection._is_offline():
+      memory_stream = None
       try:
-         cvconnection.wait_until_ready() # throttle our request speed 
-         request = WebRequest.Create(image_url_s)
-         request.UserAgent = "[ComicVineScraper, version " + \
-         Resources.SCRIPT_VERSION + "]"
-         response = request.GetResponse()
-         response_stream = response.GetResponseStream()
-         retval = Image.FromStream(response_stream)
+         data = __image_flights.do(image_url_s, 
+            lambda: __download_image(image_url_s))
+         # our miss was already counted above, so don't count this reload
+         retval = thumbcache.load_image(image_url_s, display_b, False)
+         if not retval:
+            # the thumbcache isn't working, so use the downloaded image as is
+            memory_stream = MemoryStream(data)
+            retval = Image.FromStream(memory_stream)
+            memory_stream = None # the image needs it, don't dispose it
       except:
          if lasttry:
             log.debug_exc('ERROR retry image load failed:')
             retval = None
          else:
             log.debug('RETRY loading image -> ', image_url_s)
-            retval = _query_image( ref, True )
+            retval = _query_image( ref, display_b, True )
       finally: 
-         if response: response.Dispose()
-         if response_stream: response_stream.Dispose()
+         if memory_stream: memory_stream.Dispose()
 
    # if this value is stil None, it means an error occurred, or else comicvine 
    # simply doesn't have any Image for the given ref object             
    return retval 
 
 
+# =============================================================================
+def __download_image(image_url_s):
+   '''
+   Downloads the image data (bytes) at the given URL, stores it in the 
+   thumbcache, and returns it.  Throws an exception if the download fails.
+   '''
+   cvconnection.wait_until_ready() # throttle our request speed 
+   data = httpclient.get_bytes(image_url_s)
+   cvconnection._record_image(image_url_s, data)
+   thumbcache.store(image_url_s, data)
+   return data
+
+
 # =============================================================================
 def _query_issue(issue_ref, slow_data):
    ''' ComicVine implementation of the identically named method in the db.py '''
@@ -456,7 +626,7 @@ def _query_issue(issue_ref, slow_data):
    issue = Issue(issue_ref)
    
    dom = cvconnection._query_issue_details_dom(
-            __api_key, sstr(issue_ref.issue_key))
+            __api_key, sstr(issue_ref.issue_key), __issue_field_list_s)
    __issue_parse_simple_stuff(issue, dom)
    __issue_parse_series_details(issue, dom)
    __issue_parse_story_credits(issue, dom)
@@ -492,6 +662,7 @@ def _query_issue(issue_ref, slow_data):
 def __issue_parse_simple_stuff(issue, dom):
    ''' Parses in the 'easy' parts of the DOM '''
 
+   # the title and webpage aren't in the DOM if we didn't ask for them
    if is_string(dom.results.id):
       issue.issue_key = dom.results.id
    if is_string(dom.results.volume.id):
@@ -500,10 +671,11 @@ def __issue_parse_simple_stuff(issue, dom):
       issue.series_name_s = dom.results.volume.name.strip()
    if is_string(dom.results.issue_number):
       issue.issue_num_s = dom.results.issue_number.strip()
-   if is_string(dom.results.site_detail_url) and \
+   if "site_detail_url" in dom.results.__dict__ and \
+         is_string(dom.results.site_detail_url) and \
          dom.results.site_detail_url.startswith("http"):
       issue.webpage_s = dom.results.site_detail_url
-   if is_string(dom.results.name):
+   if "name" in dom.results.__dict__ and is_string(dom.results.name):
       issue.title_s = dom.results.name.strip();
       
    # grab the published (front cover) date
@@ -553,9 +725,11 @@ def __issue_parse_series_details(issue, dom):
       raise Exception(__name__ + " module isn't initialized!")
    cache = __series_details_cache
    if series_id in cache:
+      log.count("cvdb.series_details.hit")
       volume_year_n = cache[series_id][0]
       publisher_s = cache[series_id][1]
    else: 
+      log.count("cvdb.series_details.miss")
       # contact comicvine to extract details for this comic book 
       series_dom = cvconnection._query_series_details_dom(__api_key, series_id)
       if series_dom is None:
@@ -632,7 +806,8 @@ def __issue_parse_summary(issue, dom):
    NBSP = re.compile('&nbsp;?')
    MULTISPACES = re.compile(' {2,}')
    STRIP_TAGS = re.compile('<.*?>')
-   if is_string(dom.results.description):
+   if "description" in dom.results.__dict__ and \
+         is_string(dom.results.description):
       summary_s = OVERVIEW.sub('', dom.results.description)
       summary_s = PARAGRAPH.sub('\n', summary_s)
       summary_s = STRIP_TAGS.sub('', summary_s)
@@ -0,0 +1,114 @@
+'''
+This module decodes ComicVine's JSON responses (i.e. queries with the
+'format=json' parameter) into DOM trees that have exactly the same shape as
+the ones that xml2py produces for the equivalent XML responses.  That way,
+cvdb can build its SeriesRefs, IssueRefs and Issues out of either kind of
+response, with the same code.
+
+The JSON text is decoded by .NET's JavaScriptSerializer, which is much
+faster than parsing XML with ipypulldom and xml2py.  If that isn't
+available, python's (slower) json module is used instead.
+
+@author: Cory Banack
+'''
+
+import clr
+from utils import sstr
+
+clr.AddReference('System')
+from System import Array, Int32
+from System.Collections import IDictionary
+from System.Web import HttpUtility
+from System.Xml import XmlNodeType
+
+try:
+   clr.AddReference('System.Web.Extensions')
+   from System.Web.Script.Serialization import JavaScriptSerializer
+except:
+   JavaScriptSerializer = None
+   import json
+
+# the name of the elements in the 'results' list of a response to a query
+# for each api resource.  (in JSON, the list elements don't have names.)
+__RESULTS_NAMES = { 'search' : 'volume', 'volumes' : 'volume',
+   'issues' : 'issue' }
+
+
+# =============================================================================
+def parseString(json_s, resource_s):
+   '''
+   Decodes the given ComicVine JSON response (a string) into a new DOM tree,
+   and returns it.  The DOM is the same as the one that xml2py.parseString
+   would return for the equivalent XML response, as cvconnection prepares it.
+
+   'resource_s' -> the api resource that the response is for (i.e. 'search',
+       'issues' or 'issue'), so that we know what the 'results' are called.
+
+   Throws an exception if the given string isn't valid JSON.
+   '''
+   if JavaScriptSerializer:
+      serializer = JavaScriptSerializer()
+      serializer.MaxJsonLength = Int32.MaxValue
+      response = serializer.DeserializeObject(json_s)
+   else:
+      response = json.loads(json_s)
+   return __to_node(response, 'response',
+      __RESULTS_NAMES.get(resource_s, 'result'))
+
+
+# =============================================================================
+class JsonNode(object):
+   '''
+   An element in a DOM tree that was decoded from JSON.  Just like the
+   elements that xml2py makes, its children are its attributes (a single
+   child, or a list if there are more than one with the same name), and its
+   leaves are strings.
+   '''
+   def __init__(self):
+      self._nodetype = XmlNodeType.Element
+
+
+# =============================================================================
+def __to_node(value, name_s, results_name_s=None):
+   '''
+   Converts the given decoded JSON value (for an element with the given name)
+   into the DOM element that xml2py would have made for it.
+   '''
+
+   if value is None or value == '':
+      return JsonNode() # an empty element
+   elif isinstance(value, basestring):
+      # cvconnection html decodes xml responses, so we must do the same
+      return HttpUtility.HtmlDecode(value) if '&' in value else value
+   elif isinstance(value, bool):
+      return 'true' if value else 'false'
+   elif isinstance(value, dict):
+      items = value.items()
+   elif isinstance(value, IDictionary):
+      items = [ (key, value[key]) for key in value.Keys ]
+   elif isinstance(value, (list, tuple, Array)):
+      # a list (in xml) is an element with a child for each list element.
+      # the children of 'results' are named for the resource (see above);
+      # the children of 'x_credits' and 'xs' elements are named 'x'.
+      if name_s == 'results' and results_name_s:
+         child_s = results_name_s
+      elif name_s.endswith('_credits'):
+         child_s = name_s[:-len('_credits')]
+      elif name_s.endswith('s') and len(name_s) > 1:
+         child_s = name_s[:-1]
+      else:
+         child_s = 'item'
+      items = [ (child_s, child) for child in value ]
+   else:
+      return sstr(value) # a number
+
+   node = JsonNode()
+   for key_s, child in items:
+      child = __to_node(child, key_s, results_name_s)
+      if not key_s in node.__dict__:
+         setattr(node, key_s, child)
+      elif isinstance(node.__dict__[key_s], list):
+         node.__dict__[key_s].append(child)
+      else:
+         setattr(node, key_s, [node.__dict__[key_s], child])
+   return node
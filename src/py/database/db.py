@@ -15,8 +15,12 @@ source, and therefore may be quite slow and occassionally unreliable.
 '''
 
 import cvdb
+import log
+import responsecache
+import thumbcache
 import utils
 import re
+from resources import Resources
 
 
 # a limited-size cache for storing the results of SeriesRef searches
@@ -26,6 +30,10 @@ __series_ref_cache = None
 # this cache is used to speed up query_issue_refs.
 __issue_refs_cache = None
 
+# this cache is used to speed up query_issue_ref.  maps (series key, normalized
+# issue number) tuples to IssueRefs, or to None if there was no such issue.
+__issue_ref_cache = None
+
 
 # =============================================================================
 def initialize(**kwargs):
@@ -37,9 +45,12 @@ def initialize(**kwargs):
    Some database implementations may have additional keyword arugments.
    '''
    
-   global __series_ref_cache, __issue_refs_cache
+   global __series_ref_cache, __issue_refs_cache, __issue_ref_cache
    __series_ref_cache = {}
    __issue_refs_cache = {}
+   __issue_ref_cache = {}
+   thumbcache.initialize(Resources.LOCAL_CACHE_DIRECTORY + r'\images')
+   responsecache.initialize(Resources.LOCAL_CACHE_DIRECTORY + r'\responses')
    cvdb._initialize(**kwargs)
    
 # =============================================================================
@@ -49,10 +60,29 @@ def shutdown():
    this module might be holding onto.  Be sure to call this method before 
    shutting down the application, and don't use this module after shutting down!
    '''
-   global __series_ref_cache, issue_refs_cache
+   global __series_ref_cache, __issue_refs_cache, __issue_ref_cache
    __series_ref_cache = None
    __issue_refs_cache = None
+   __issue_ref_cache = None
    cvdb._shutdown()
+   responsecache.shutdown()
+   thumbcache.shutdown()
+
+# =============================================================================
+def is_offline():
+   '''
+   Returns True if this database is working offline right now.  That happens 
+   when we are asked to (see the database's initialize() keyword arguments), 
+   or when the database can't be reached in the middle of a scrape.
+   
+   While offline, every query is answered from the persistent local caches.
+   Queries that can't be answered that way throw a DatabaseOfflineError 
+   (except query_image, which just returns None.)
+   
+   This method does not perform any database reads or writes, i.e. it's fast.
+   '''
+   return cvdb._is_offline()
+
 
 # =============================================================================
 def get_db_name_s():
@@ -151,9 +181,13 @@ def query_series_refs( search_terms_s, ignored_search_terms_sl = list(),
       raise Exception(__name__ + " module isn't initialized!")
    
    if search_terms_s in __series_ref_cache:
+      log.count("db.series_refs.hit")
       return list(__series_ref_cache[search_terms_s])
    else:
-      series_refs = cvdb._query_series_refs(search_terms_s, callback_function)
+      log.count("db.series_refs.miss")
+      with log.span("cvdb.query_series_refs", terms=search_terms_s):
+         series_refs = \
+            cvdb._query_series_refs(search_terms_s, callback_function)
       if len(__series_ref_cache ) > 10:
          __series_ref_cache = {} # keep the cache from ever getting too big
       __series_ref_cache[search_terms_s] = list(series_refs)
@@ -189,10 +223,13 @@ def query_issue_refs(series_ref, callback_function=lambda x : False):
    
    issue_refs = set()
    if series_ref in __issue_refs_cache:
+      log.count("db.issue_refs.hit")
       issue_refs = set(__issue_refs_cache[series_ref]) 
    else: 
+      log.count("db.issue_refs.miss")
       __issue_refs_cache = {} # only keep one element in cache (else too big!)
-      issue_refs = cvdb._query_issue_refs(series_ref, callback_function)
+      with log.span("cvdb.query_issue_refs", series=series_ref.series_key):
+         issue_refs = cvdb._query_issue_refs(series_ref, callback_function)
       __issue_refs_cache[series_ref] = set(issue_refs) 
    return issue_refs
 
@@ -205,7 +242,54 @@ def query_issue_ref(series_ref, issue_num_s):
    a new IssueRef object if possible, or it returns None if it is not possible
    (if, for example, the issue number string doesn't match any issue.)
    '''
-   return cvdb.query_issue_ref(series_ref, issue_num_s)
+   
+   # use caching here, since this method gets called for the same series and 
+   # issue number over and over again, i.e. every time the user highlights a
+   # series in the series dialog.  we only cache the issues that we found;
+   # cvdb caches 'not found' results itself, for a limited amount of time.
+   global __issue_ref_cache
+   if __issue_ref_cache == None:
+      raise Exception(__name__ + " module isn't initialized!")
+   
+   key = __issue_ref_key(series_ref, issue_num_s)
+   if key in __issue_ref_cache:
+      log.count("db.issue_ref.hit")
+      return __issue_ref_cache[key]
+   else:
+      log.count("db.issue_ref.miss")
+      # if we've already got all the issues in this series, look in those
+      issue_refs = __issue_refs_cache.get(series_ref) \
+         if __issue_refs_cache else None
+      issue_refs = list(issue_refs) if issue_refs is not None else None
+      with log.span("cvdb.query_issue_ref", series=series_ref.series_key,
+            issue=issue_num_s):
+         issue_ref = cvdb.query_issue_ref(series_ref, issue_num_s, issue_refs)
+      if issue_ref:
+         if len(__issue_ref_cache) > 1000:
+            __issue_ref_cache = {} # keep the cache from ever getting too big
+         __issue_ref_cache[key] = issue_ref
+      return issue_ref
+   
+
+# =============================================================================
+def is_issue_ref_cached(series_ref, issue_num_s):
+   '''
+   Returns True iff calling query_issue_ref with the given arguments will 
+   return an IssueRef from the cache, i.e. without accessing the database at
+   all.  Issues that weren't found are never cached here.
+   '''
+   return __issue_ref_cache != None and \
+      __issue_ref_key(series_ref, issue_num_s) in __issue_ref_cache
+   
+
+# =============================================================================
+def __issue_ref_key(series_ref, issue_num_s):
+   '''
+   Returns the query_issue_ref cache key for the given arguments.  Issue
+   numbers share a key (i.e. '5' and '05') only if the database looks them
+   up in exactly the same way.
+   '''
+   return (series_ref.series_key, cvdb._issue_num_key_s(issue_num_s))
    
 
 # =============================================================================
@@ -219,19 +303,25 @@ def query_issue(issue_ref, slow_data=False):
    additional OPTIONAL data and add it to the Issue. 
    
    '''
-   return cvdb._query_issue(issue_ref, slow_data)
+   with log.span("cvdb.query_issue", issue=issue_ref.issue_key):
+      return cvdb._query_issue(issue_ref, slow_data)
 
 
 # =============================================================================
-def query_image(ref):
+def query_image(ref, display_b=False):
    '''
    This method takes either an IssueRef object, a SeriesRef object, or a direct
    URL string, and queries the database for a single associated cover image.   
    If no image can be found, if an error occurs, or if the given ref is None, 
    this method will return None.
    
+   Images that have been downloaded before are loaded from a cache on disk.
+   If 'display_b' is True, the returned image is only meant to be shown on 
+   screen, so it may be a smaller, scaled down copy of the original image. 
+   
    Note that the returned Image object (if there is one) is a .NET Image object,
    which must be explicitly Disposed() when you are done with it, in order
    to prevent memory leaks.
    '''
-   return utils.strip_back_cover( cvdb._query_image(ref) )
\ No newline at end of file
+   with log.span("cvdb.query_image"):
+      return utils.strip_back_cover( cvdb._query_image(ref, display_b) )
\ No newline at end of file
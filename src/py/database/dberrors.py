@@ -44,4 +44,22 @@ class DatabaseConnectionError(Exception):
       Returns the underlying database error code associated with this error,
       if there is one.  If there isn't, this value will be "0" 
       '''
-      return self.__error_code_s
\ No newline at end of file
+      return self.__error_code_s
+
+
+# =============================================================================
+class DatabaseOfflineError(DatabaseConnectionError):
+   ''' 
+   A special DatabaseConnectionError that gets thrown when we are working 
+   offline (see db.is_offline()) and the answer to a database query isn't 
+   in our local caches, so it can't be answered until we are online again.
+   '''
+   
+   # ==========================================================================
+   def __init__(self, database_name_s, url_s):
+      ''' 
+      database_name_s -> the name of the database that we are offline from
+      url_s -> the url of the query that couldn't be answered
+      '''
+      super(DatabaseOfflineError, self).__init__(database_name_s, url_s,
+         "working offline, and this query isn't in the local cache")
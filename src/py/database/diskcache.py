@@ -0,0 +1,154 @@
+'''
+This module contains the DiskCache class, which keeps track of the files in a
+size-limited, on-disk cache directory, and deletes the least recently used
+ones when the cache gets too big.  It is shared by the thumbcache and the
+responsecache, which decide what goes into the files.
+
+@author: Cory Banack
+'''
+
+import clr
+import log
+from collections import OrderedDict
+
+clr.AddReference('System')
+from System import DateTime
+from System.IO import Directory, DirectoryInfo, File, FileInfo, Path
+
+#==============================================================================
+class DiskCache(object):
+   '''
+   The files in a cache directory, in least to most recently used order, and
+   their total size.  The order is kept on disk as the files' last write
+   times, so it survives from one scrape to the next.
+
+   This class is NOT thread-safe; its owner must synchronize all calls to it.
+   '''
+
+   #===========================================================================
+   def __init__(self, name_s, max_bytes_n, pattern_s="*"):
+      '''
+      Initializes this DiskCache, which deletes old files when its files take
+      up more than 'max_bytes_n' bytes.  Only files that match the given
+      pattern (i.e. "*.xml") are part of the cache.  The name is only used for
+      log messages.  Call initialize() before using it.
+      '''
+      self.__name_s = name_s
+      self.__max_bytes_n = max_bytes_n
+      self.__pattern_s = pattern_s
+
+      # the directory that this cache stores its files in, or None if this
+      # cache isn't initialized.
+      self.__directory_s = None
+
+      # the files in the cache directory, in least to most recently used
+      # order.  maps the file name to the size of the file (in bytes)
+      self.__files = OrderedDict()
+
+      # the total size (in bytes) of all the files in the cache directory
+      self.__total_bytes_n = 0
+
+
+   #===========================================================================
+   # the cache directory, or None if this cache isn't initialized
+   directory_s = property( lambda self : self.__directory_s )
+
+
+   #===========================================================================
+   def initialize(self, directory_s):
+      '''
+      Starts using the given directory (which will be created if it doesn't
+      exist) for this cache, and reads in the files that are already there.
+      If the directory can't be used, this cache stays uninitialized.
+      '''
+      self.__directory_s = None
+      self.__files = OrderedDict()
+      self.__total_bytes_n = 0
+      try:
+         if not Directory.Exists(directory_s):
+            Directory.CreateDirectory(directory_s)
+         infos = list(DirectoryInfo(directory_s).GetFiles(self.__pattern_s))
+         infos.sort(key=lambda info: info.LastWriteTimeUtc.Ticks)
+         for info in infos:
+            self.__files[info.Name] = info.Length
+            self.__total_bytes_n += info.Length
+         self.__directory_s = directory_s
+      except:
+         log.debug_exc("WARNING: can't use " + self.__name_s + ": "
+            + directory_s)
+
+
+   #===========================================================================
+   def shutdown(self):
+      ''' Undoes initialize().  The cached files stay on disk, of course. '''
+      if self.__directory_s:
+         log.debug(self.__name_s, ": ", len(self.__files), " files (",
+            "{0:.1f}".format(self.__total_bytes_n / 1048576.0), " MB)")
+      self.__directory_s = None
+      self.__files = OrderedDict()
+      self.__total_bytes_n = 0
+
+
+   #===========================================================================
+   def contains(self, name_s):
+      ''' Returns True iff this cache has a file with the given name. '''
+      return name_s in self.__files
+
+
+   #===========================================================================
+   def path_s(self, name_s):
+      ''' Returns the full path of the cache file with the given name. '''
+      return Path.Combine(self.__directory_s, name_s)
+
+
+   #===========================================================================
+   def add(self, name_s):
+      '''
+      Records a newly written cache file, which is now the most recently used
+      one, and then deletes old files until the cache fits in its size limit.
+      '''
+      self.__total_bytes_n -= self.__files.pop(name_s, 0)
+      bytes_n = FileInfo(self.path_s(name_s)).Length
+      self.__files[name_s] = bytes_n
+      self.__total_bytes_n += bytes_n
+      self.__trim()
+
+
+   #===========================================================================
+   def touch(self, name_s):
+      '''
+      Marks the given cache file as the most recently used one, both in memory
+      and on disk (so the order survives until next time.)
+      '''
+      self.__files[name_s] = self.__files.pop(name_s)
+      try:
+         File.SetLastWriteTimeUtc(self.path_s(name_s), DateTime.UtcNow)
+      except:
+         pass # not a big deal, it just makes our LRU order a bit less accurate
+
+
+   #===========================================================================
+   def delete(self, name_s):
+      ''' Deletes the given cache file. '''
+      self.__total_bytes_n -= self.__files.pop(name_s, 0)
+      try:
+         File.Delete(self.path_s(name_s))
+      except:
+         log.debug_exc("WARNING: can't delete " + self.__name_s + " file: "
+            + name_s)
+
+
+   #===========================================================================
+   def __trim(self):
+      '''
+      Deletes the least recently used cache files until the cache fits into
+      its size limit again.
+      '''
+      if self.__total_bytes_n > self.__max_bytes_n:
+         deleted_n = 0
+         for name_s in list(self.__files.keys()):
+            if self.__total_bytes_n <= self.__max_bytes_n:
+               break
+            self.delete(name_s)
+            deleted_n += 1
+         log.debug(self.__name_s, ": deleted ", deleted_n, " old files")
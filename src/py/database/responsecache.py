@@ -0,0 +1,177 @@
+'''
+This module contains a persistent, on-disk cache for the responses (xml
+documents) that we get from the comic book database, keyed by a string that
+identifies the query (see cvconnection.__cache_key_s).  Every successful
+response is stored here, so that when the database can't be reached, we can
+still answer any query that we've answered before (see "offline mode" in
+the db module.)  Like the thumbcache, it survives from one scrape to the next.
+
+Each response is stored along with the time that it was downloaded, and the
+ETag and Last-Modified headers that it came with, so that it can be reused
+while it is fresh, and revalidated (with a conditional GET) once it isn't.
+
+The cache has a size limit.  When it is exceeded, the least recently used
+files are deleted.
+
+@author: Cory Banack
+'''
+
+import clr
+import hashlib
+import log
+from diskcache import DiskCache
+
+clr.AddReference('System')
+from System import DateTime, DateTimeKind
+from System.IO import File
+from System.Text import UTF8Encoding
+from System.Threading import Monitor
+
+# the maximum number of bytes of responses that this cache will keep on disk
+__MAX_BYTES = 128 * 1024 * 1024
+
+# the file extension for cached responses
+__EXT = ".xml"
+
+# the first line of every cache file is a header that starts with this, and
+# then contains the tab separated download time, ETag and Last-Modified values
+__HEADER = "#cvscraper-response"
+
+# the lock that protects all of the module state below
+__lock = object()
+
+# the cache files on disk (and their least recently used order.)  its 
+# directory_s is None whenever this module isn't initialized.
+__cache = DiskCache("response cache", __MAX_BYTES, "*" + __EXT)
+
+
+# =============================================================================
+def initialize(directory_s):
+   '''
+   Initializes this module, so that it stores its cached responses in the given
+   directory (which will be created if it doesn't exist.)  Call this method
+   once before using this module, and remember to call "shutdown()" later.
+   '''
+   Monitor.Enter(__lock)
+   try:
+      __cache.initialize(directory_s)
+   finally:
+      Monitor.Exit(__lock)
+
+
+# =============================================================================
+def shutdown():
+   '''
+   Undoes the "initialize()" method.  The cached files stay on disk, of course.
+   '''
+   Monitor.Enter(__lock)
+   try:
+      __cache.shutdown()
+   finally:
+      Monitor.Exit(__lock)
+
+
+# =============================================================================
+def load(key_s):
+   '''
+   Returns the CachedResponse for the given query key, or None if there 
+   isn't one.
+   '''
+   Monitor.Enter(__lock)
+   try:
+      cached = None
+      if __cache.directory_s and key_s:
+         name_s = __name_s(key_s)
+         if __cache.contains(name_s):
+            try:
+               cached = __parse( File.ReadAllText(
+                  __cache.path_s(name_s), UTF8Encoding()) )
+               __cache.touch(name_s)
+            except:
+               log.debug_exc("WARNING: can't load cached response: " + key_s)
+               __cache.delete(name_s)
+               cached = None
+         log.count("responsecache.hit" if cached else "responsecache.miss")
+      return cached
+   finally:
+      Monitor.Exit(__lock)
+
+
+# =============================================================================
+def store(key_s, response_s, etag_s=None, modified_s=None):
+   '''
+   Stores the given response (a string) in this cache for the given key, 
+   along with the ETag and Last-Modified headers that it came with (if any.)
+   The response is marked as downloaded right now, so storing the same 
+   response again (i.e. after it is revalidated) makes it fresh again.
+   '''
+   Monitor.Enter(__lock)
+   try:
+      if __cache.directory_s and key_s and response_s:
+         try:
+            name_s = __name_s(key_s)
+            header_s = '\t'.join([__HEADER, "{0:.0f}".format(__now_ms()), 
+               __clean_s(etag_s), __clean_s(modified_s)])
+            File.WriteAllText(__cache.path_s(name_s),
+               header_s + '\n' + response_s, UTF8Encoding())
+            __cache.add(name_s)
+         except:
+            log.debug_exc("WARNING: can't cache response: " + key_s)
+   finally:
+      Monitor.Exit(__lock)
+
+
+# =============================================================================
+class CachedResponse(object):
+   '''
+   A response that was loaded from this cache.  It has the response string 
+   itself, the ETag and Last-Modified headers that it was downloaded with 
+   (either may be None), and the number of milliseconds since it was 
+   downloaded (or last revalidated.)
+   '''
+   
+   #===========================================================================
+   def __init__(self, response_s, etag_s, modified_s, age_ms):
+      ''' Initializes this CachedResponse with the given values. '''
+      self.response_s = response_s
+      self.etag_s = etag_s
+      self.modified_s = modified_s
+      self.age_ms = age_ms
+
+
+# =============================================================================
+def __parse(file_s):
+   ''' Returns a new CachedResponse for the given contents of a cache file. '''
+   etag_s = None
+   modified_s = None
+   age_ms = float("inf") # files from older versions have no header (stale) 
+   if file_s.startswith(__HEADER):
+      header_s, file_s = (file_s.split('\n', 1) + [''])[:2]
+      fields_sl = header_s.split('\t')
+      try:
+         age_ms = max(0.0, __now_ms() - float(fields_sl[1]))
+      except:
+         pass # a bad download time just means the response is stale
+      if len(fields_sl) > 2 and fields_sl[2]: etag_s = fields_sl[2]
+      if len(fields_sl) > 3 and fields_sl[3]: modified_s = fields_sl[3]
+   return CachedResponse(file_s, etag_s, modified_s, age_ms)
+
+
+# =============================================================================
+def __now_ms():
+   ''' Returns the current (UTC) time, in milliseconds since the epoch. '''
+   return (DateTime.UtcNow - 
+      DateTime(1970, 1, 1, 0, 0, 0, DateTimeKind.Utc)).TotalMilliseconds
+
+
+# =============================================================================
+def __clean_s(value_s):
+   ''' Makes the given header value safe to put into a cache file header. '''
+   return value_s.replace('\t',' ').replace('\r','').replace('\n','') \
+      if value_s else ''
+
+
+# =============================================================================
+def __name_s(key_s):
+   ''' Returns the name of the cache file for the given key. '''
+   return hashlib.md5(key_s.encode("utf-8")).hexdigest() + __EXT
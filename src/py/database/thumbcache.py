@@ -0,0 +1,184 @@
+'''
+This module contains a persistent, on-disk cache for the cover images that
+we download from the comic book database, keyed by image URL.  For each URL
+it stores the original image file exactly as it was downloaded, plus (for big
+images) a smaller, pre-scaled copy that is quicker to load for on-screen
+display.  Since it lives on disk, the cache survives from one scrape to the
+next, so covers never need to be downloaded twice.
+
+The cache has a size limit.  When it is exceeded, the least recently used
+files are deleted.
+
+@author: Cory Banack
+'''
+
+import clr
+import hashlib
+import log
+from diskcache import DiskCache
+
+clr.AddReference('System')
+from System.IO import File, FileAccess, FileMode, FileShare, FileStream, \
+   MemoryStream
+from System.Threading import Monitor
+
+clr.AddReference('System.Drawing')
+from System.Drawing import Bitmap, Graphics, Image
+from System.Drawing.Drawing2D import InterpolationMode
+from System.Drawing.Imaging import ImageFormat
+
+# the maximum number of bytes of image files that this cache will keep on disk
+__MAX_BYTES = 256 * 1024 * 1024
+
+# images taller than this (in pixels) also get a scaled down display copy
+__DISPLAY_HEIGHT = 450
+
+# the file extensions for the original and scaled display copies of an image
+__ORIGINAL_EXT = ".img"
+__DISPLAY_EXT = ".jpg"
+
+# the lock that protects all of the module state below
+__lock = object()
+
+# the cache files on disk (and their least recently used order.)  its 
+# directory_s is None whenever this module isn't initialized.
+__cache = DiskCache("image file cache", __MAX_BYTES)
+
+
+# =============================================================================
+def initialize(directory_s):
+   '''
+   Initializes this module, so that it stores its cached images in the given
+   directory (which will be created if it doesn't exist.)  Call this method
+   once before using this module, and remember to call "shutdown()" later.
+   '''
+   Monitor.Enter(__lock)
+   try:
+      __cache.initialize(directory_s)
+   finally:
+      Monitor.Exit(__lock)
+
+
+# =============================================================================
+def shutdown():
+   '''
+   Undoes the "initialize()" method.  The cached files stay on disk, of course.
+   '''
+   Monitor.Enter(__lock)
+   try:
+      __cache.shutdown()
+   finally:
+      Monitor.Exit(__lock)
+
+
+# =============================================================================
+def load_image(url_s, display_b, counted_b=True):
+   '''
+   Returns a new Image object (don't forget to Dispose() it!) for the given
+   image URL, loaded from this cache, or None if that image isn't cached.
+   If 'display_b' is True, the returned image may be a scaled down copy of
+   the original that is meant for on-screen display.  If 'counted_b' is 
+   False, this lookup doesn't count as a cache hit or miss (i.e. reloading 
+   an image that was just stored after a counted miss.)
+   '''
+   Monitor.Enter(__lock)
+   try:
+      image = None
+      if __cache.directory_s and url_s:
+         name_s = __name_s(url_s, __DISPLAY_EXT) if display_b else None
+         if not name_s or not __cache.contains(name_s):
+            name_s = __name_s(url_s, __ORIGINAL_EXT)
+         if __cache.contains(name_s):
+            try:
+               image = __read_image(name_s)
+               __cache.touch(name_s)
+            except:
+               log.debug_exc("WARNING: can't load cached image: " + url_s)
+               __cache.delete(name_s)
+               image = None
+         if counted_b:
+            log.count("thumbcache.hit" if image else "thumbcache.miss")
+      return image
+   finally:
+      Monitor.Exit(__lock)
+
+
+# =============================================================================
+def store(url_s, data):
+   '''
+   Stores the given bytes (the original, downloaded image file) in this cache
+   for the given image URL, along with a scaled down display copy if the
+   image is big.  Throws an exception if the given bytes are not an image.
+   '''
+   # decode first, so we never store something that isn't a valid image
+   stream = MemoryStream(data)
+   try:
+      image = Image.FromStream(stream)
+      try:
+         display_image = __create_display_image(image)
+      finally:
+         image.Dispose()
+   finally:
+      stream.Dispose()
+
+   Monitor.Enter(__lock)
+   try:
+      if __cache.directory_s and url_s:
+         try:
+            name_s = __name_s(url_s, __ORIGINAL_EXT)
+            File.WriteAllBytes(__cache.path_s(name_s), data)
+            __cache.add(name_s)
+            if display_image:
+               name_s = __name_s(url_s, __DISPLAY_EXT)
+               display_image.Save(__cache.path_s(name_s), ImageFormat.Jpeg)
+               __cache.add(name_s)
+         except:
+            log.debug_exc("WARNING: can't cache image: " + url_s)
+   finally:
+      Monitor.Exit(__lock)
+      if display_image: display_image.Dispose()
+
+
+# =============================================================================
+def __create_display_image(image):
+   '''
+   Returns a new, scaled down copy of the given image, suitable for displaying
+   on screen, or None if the given image is already small enough for that.
+   '''
+   if image.Height <= __DISPLAY_HEIGHT:
+      return None
+   width_n = max(1, int(round(image.Width * __DISPLAY_HEIGHT /
+      float(image.Height))))
+   display_image = Bitmap(width_n, __DISPLAY_HEIGHT)
+   graphics = Graphics.FromImage(display_image)
+   try:
+      graphics.InterpolationMode = InterpolationMode.HighQualityBicubic
+      graphics.DrawImage(image, 0, 0, width_n, __DISPLAY_HEIGHT)
+   finally:
+      graphics.Dispose()
+   return display_image
+
+
+# =============================================================================
+def __read_image(name_s):
+   '''
+   Reads the image file with the given name (streaming it straight from disk,
+   without reading the whole file into memory first) into a new Image object.
+   Caller must hold the lock.
+   '''
+   stream = FileStream(__cache.path_s(name_s),
+      FileMode.Open, FileAccess.Read, FileShare.Read)
+   try:
+      image = Image.FromStream(stream)
+      try:
+         return Bitmap(image) # a copy that doesn't need the stream anymore
+      finally:
+         image.Dispose()
+   finally:
+      stream.Dispose()
+
+
+# =============================================================================
+def __name_s(url_s, ext_s):
+   ''' Returns the name of the cache file for the given URL and extension. '''
+   return hashlib.md5(url_s.encode("utf-8")).hexdigest() + ext_s
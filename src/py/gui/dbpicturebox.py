@@ -7,9 +7,9 @@ remotely loaded images using an asyncrhonous off-loading thread.
 
 import clr
 import utils
-import db
+import imagecache
+import imageloader
 from resources import Resources
-from scheduler import Scheduler
 
 clr.AddReference('System.Drawing')
 from System.Drawing import Graphics, Bitmap
@@ -31,15 +31,16 @@ class DBPictureBox(PictureBox):
    this class contains a number of features to automatically handle
    problems that may occur:
 
-   1) All image retrieval happens asyncronously on an external thread.   The 
-   final result is only loaded into this picturebox when the image retrieval is
-   finished.  If many image retrievals are requested nearly simulataneously, 
-   most of them will be ignored, and only the most recent one is guaranteed to 
-   actually be performed (and update the displayed image.)
+   1) All image retrieval happens asyncronously on external threads (in the 
+   imageloader module).  The final result is only loaded into this picturebox 
+   when the image retrieval is finished.  If many image retrievals are 
+   requested nearly simulataneously, the ones that are no longer needed are 
+   cancelled, and only the most recent one is guaranteed to actually be 
+   performed (and update the displayed image.)
 
-   2) All image retrieval is short-term cached, so if you switch the image ref 
-   back to a previous one, it will automatically use the cached image instead of 
-   reloading.
+   2) All image retrieval is cached (in the imagecache module, which is shared
+   by every DBPictureBox) so if you switch the image ref back to a previous 
+   one, it will automatically use the cached image instead of reloading.
    
    '''
 
@@ -50,11 +51,13 @@ class DBPictureBox(PictureBox):
       # the ref of whatever image should currently be displayed, or None
       self.__current_image_ref = None
       
-      # a simple "last-in-and-ignore-everything-else" scheduler
-      self.__scheduler = Scheduler()
+      # the (ref, callback) of our outstanding request to the imageloader, 
+      # or None if we aren't waiting for the imageloader to load anything.
+      self.__request = None
       
-      # our cache of loaded image objects. {(imageref,issuehint)->Image}
-      self.__image_cache = {}
+      # the ref of the image that we have acquired from the imagecache (and 
+      # are currently displaying), or None if we aren't displaying one. 
+      self.__acquired_ref = None
       
       # the image that gets displayed if we have nothing else to display
       self.__unknown_image = Resources.createComicVineLogo()
@@ -81,12 +84,11 @@ class DBPictureBox(PictureBox):
    #===========================================================================
    def free(self):
       ''' Explicitly frees all resources held by this object. '''
-      self.__scheduler.shutdown(True) # blocks; safer even if gui locks a little
+      self.__cancel_request()
+      self.Image = None
+      self.__release_image()
       self.__unknown_image.Dispose()
       self.__loading_image.Dispose()
-      for image in self.__image_cache.values():
-         image.Dispose()
-      self.__image_cache = {}
       PictureBox.Dispose(self, True)
       
 
@@ -127,52 +129,69 @@ class DBPictureBox(PictureBox):
       worker thread, so as not to lock up the UI.
       '''
        
-      # simple image setter that uses a blank image if 'image' is None 
-      def switchimage( image ):
-         if image: self.Image = image
-         else: self.Image = self.__unknown_image
-             
+      # simple image setter that displays the given image, which must have been
+      # acquired from the image cache for the given ref, or a blank image if 
+      # it is None.  the displayed image is kept acquired from the cache (so 
+      # it won't be disposed while we're displaying it.)  every lookup is 
+      # counted as a hit or miss exactly once, by the acquire() below.
+      def switchimage( ref, image ):
+         self.Image = image if image else self.__unknown_image
+         self.__release_image()
+         self.__acquired_ref = ref if image else None
+      
       ref = self.__current_image_ref
+      image = imagecache.acquire(ref) if ref or ref == 0 else None
       
       # 1. if the ref is empty, switch to display an empty image
       if not ref and ref != 0:
-         switchimage(None)
+         self.__cancel_request()
+         switchimage(None, None)
          
       # 2. if the ref is cached, switch to display the cached image
-      elif ref in self.__image_cache:
-         switchimage( self.__image_cache[ref] )
+      elif image:
+         self.__cancel_request()
+         switchimage(ref, image)
          
-      # 3. if the ref is unkown, the hard part begins.  create a download "task"
-      #    that downloads, caches, and then switches display to the needed 
-      #    image.  then invoke this task asyncrhonously on the off-thread.
+      # 3. if the ref is unkown, the hard part begins.  ask the imageloader
+      #    to download and cache the image in the background, and when it is
+      #    done, switch display to the needed image.
       else:
          self.Image = self.__loading_image
-         def download_task():
+         self.__release_image()
+         if not self.__request or self.__request[0] != ref:
             
-            # 3a. load the image. 
-            new_image = db.query_image(ref) # disposed later
-               
-            # 3b. now that we've loaded a new image, the following method is
-            #     passed back to the gui thread and run to update our gui 
-            def update_image():
-               
-               # if somehow the image we just loaded is already in the cache,
-               # take it out and dispose it.  this should be rare.    
-               if ref in self.__image_cache:
-                  old_image = self.__image_cache[ref]
-                  del self.__image_cache[ref]
-                  if old_image:
-                     old_image.Dispose()
+            # 3a. this method gets called (on a loader thread) after the 
+            #     imageloader has put the image into the imagecache.  it passes
+            #     the following method back to the gui thread to update our gui 
+            def loaded():
+               def update_image():
+                  # if the __current_image_ref hasn't changed, switch this 
+                  # PictureBox to display that image.  otherwise, we already 
+                  # loading a new one, so don't do a pointless visual update.
+                  if self.__request and self.__request[1] == loaded:
+                     self.__request = None
+                  if ref == self.__current_image_ref:
+                     # our miss was already counted, so don't count this
+                     switchimage(ref, imagecache.acquire(ref, False))
+               utils.invoke(self, update_image, False) 
                
-               # cache the new image, so we never have to load it again
-               if new_image:
-                  self.__image_cache[ref] = new_image
-               
-               # if the __current_image_ref hasn't changed, switch this 
-               # PictureBox to display that image.  otherwise, we already 
-               # loading a new one, so don't do a pointless visual update.
-               if ref == self.__current_image_ref:
-                  switchimage(new_image)
-                  
-            utils.invoke(self, update_image, False) 
-         self.__scheduler.submit(download_task)
\ No newline at end of file
+            # 3b. we don't need whatever we were waiting for before anymore
+            self.__cancel_request()
+            self.__request = (ref, loaded)
+            imageloader.request(ref, loaded)
+   
+   
+   #===========================================================================
+   def __cancel_request(self):
+      ''' Cancels our outstanding request to the imageloader, if we have one. '''
+      if self.__request:
+         imageloader.cancel(self.__request[0], self.__request[1])
+      self.__request = None
+   
+   
+   #===========================================================================
+   def __release_image(self):
+      ''' Releases the image (if any) that we acquired from the imagecache. '''
+      if self.__acquired_ref or self.__acquired_ref == 0:
+         imagecache.release(self.__acquired_ref)
+      self.__acquired_ref = None
@@ -5,11 +5,13 @@ This module is home to the IssueCoverPanel class.
 '''
 import clr
 from dbmodels import IssueRef, SeriesRef
+from dberrors import DatabaseOfflineError
 from dbpicturebox import DBPictureBox
-from scheduler import Scheduler
 from utils import sstr
 import db
 import i18n
+import imageloader
+import taskqueue
 import utils
 
 clr.AddReference('System.Drawing')
@@ -83,15 +85,13 @@ class IssueCoverPanel(Panel):
       # next/prev button state for each ref.
       self.__button_cache = {}
       
-      # a mapping of SeriesRefs to IssueRefs (or SeriesRefs).  this cache lets
-      # us avoid querying the database twice for the same SeriesRef.
-      self.__series_cache = {}
+      # the key for our 'set new ref' tasks in the shared taskqueue.  each
+      # new one of these tasks supersedes the last one, if it hasn't started.
+      self.__setter_key = object()
       
-      # a scheduler (thread) for finding cover images...
-      self.__finder_scheduler = Scheduler()
-      
-      # a scheduler (thread) for setting new refs...
-      self.__setter_scheduler = Scheduler()
+      # the CancelTokens for the tasks that we've submitted to the shared
+      # taskqueue (for setting new refs, and finding cover images)
+      self.__tokens = []
       
       # a tuple containing the user's alternate cover art choice (a url) for 
       # a specific IssueRef i.e. (IssuRef, url). none if no alt choice was made.
@@ -202,8 +202,9 @@ class IssueCoverPanel(Panel):
                if utils.is_string(image_ref):
                   self.__alt_cover_choice = (issue_ref, image_ref)
       
-      self.__finder_scheduler.shutdown(False)
-      self.__setter_scheduler.shutdown(False)
+      for token in self.__tokens:
+         token.cancel()
+      self.__tokens = []
       self.set_ref(None)
       self.__coverpanel.free()
       self.__prevbutton = None
@@ -222,21 +223,23 @@ class IssueCoverPanel(Panel):
       run_in_background = type(ref) == SeriesRef and self.__issue_num_hint_s       
       if run_in_background:
          # 1a. our ref is a SeriesRef.  use our issue num hint to try to convert
-         #     it into an IssueRef.  use a simple cache to avoid requerying
+         #     it into an IssueRef.  the db caches these conversions for us, 
+         #     so we don't have to worry about requerying.
          def maybe_convert_seriesref_to_issue_ref(ref):
-            if not ref in self.__series_cache:
+            try:
                issue_ref = db.query_issue_ref(ref, self.__issue_num_hint_s)
-               self.__series_cache[ref] = issue_ref if issue_ref else ref
+            except DatabaseOfflineError:
+               issue_ref = None # not cached, so just show the series' cover
                   
             # 1b. go back to the application thread to do the actual ref change
             def change_ref():  
-               self.__ref = self.__series_cache[ref]
+               self.__ref = issue_ref if issue_ref else ref
                self.__update()
             utils.invoke(self.__coverpanel, change_ref, True)
             
          def dummy(): # I don't know why this is needed 
             maybe_convert_seriesref_to_issue_ref(ref)
-         self.__setter_scheduler.submit(dummy)
+         self.__submit(dummy, self.__setter_key)
          
       else:
          # 2. our ref is an IssueRef
@@ -245,6 +248,30 @@ class IssueCoverPanel(Panel):
          self.__update()
             
 
+   # ==========================================================================
+   def prefetch(self, refs):
+      '''
+      Starts loading (at low priority, in the background) the cover art that 
+      this panel would display for each of the given IssueRefs or SeriesRefs, 
+      so that it can be displayed instantly if one of them is set on this panel
+      later on.  This replaces the refs given to any previous prefetch call.
+      '''
+      image_refs = []
+      if self.__config.show_covers_b:
+         for ref in refs:
+            if type(ref) == SeriesRef and self.__issue_num_hint_s:
+               # we only know which image to show for this SeriesRef if we've
+               # already converted it to an IssueRef.  don't query for that!
+               hint_s = self.__issue_num_hint_s
+               if db.is_issue_ref_cached(ref, hint_s):
+                  ref = db.query_issue_ref(ref, hint_s) or ref
+               else:
+                  ref = None
+            if ref:
+               image_refs.append(ref)
+      imageloader.prefetch(image_refs)
+      
+
    # ==========================================================================
    def get_alt_issue_cover_choice(self):
       '''
@@ -281,7 +308,6 @@ class IssueCoverPanel(Panel):
       nextbutton = self.__nextbutton
       prevbutton = self.__prevbutton
       label = self.__label
-      scheduler = self.__finder_scheduler
       
       
       if ref is None or cache is None:
@@ -347,7 +373,7 @@ class IssueCoverPanel(Panel):
          # 4. search to see if there are any more covers to find
          search_for_more_covers = cache[ref].get_status()=='searching'
          if search_for_more_covers:
-            def update_cache(): #runs on scheduler thread
+            def update_cache(): #runs on a taskqueue thread
                issue = db.query_issue(ref, True) \
                   if type(ref) == IssueRef else None 
                   
@@ -359,9 +385,20 @@ class IssueCoverPanel(Panel):
                   bmodel.set_status('searched')
                   self.__update() # recurse!
                utils.invoke(self, update_bmodel, True)
-            scheduler.submit(update_cache)
+            self.__submit(update_cache)
        
          
+   # ==========================================================================
+   def __submit(self, task, key=None):
+      '''
+      Submits the given task to the shared taskqueue (as a USER priority task,
+      since it's for something the user is looking at), making sure that it 
+      will be cancelled if it hasn't started by the time this panel is freed.
+      '''
+      # forget the tokens of tasks that are finished or cancelled already
+      self.__tokens = [t for t in self.__tokens if not t.done_b]
+      self.__tokens.append( taskqueue.submit(task, taskqueue.USER, key) )
+         
    # ==========================================================================
    def __button_click_fired(self, sender, args):
       ''' This method is called when the next/prev buttons are clicked '''
@@ -354,6 +354,7 @@ class IssueForm(CVForm):
          self.__chosen_index = selected_rows[0].Cells[3].Value
          self.__coverpanel.set_ref(
             self.__issue_refs[self.__chosen_index] )
+         self.__prefetch_covers(selected_rows[0].Index)
       else:
          self.__chosen_index = None
          self.__coverpanel.set_ref( None ) 
@@ -361,6 +362,23 @@ class IssueForm(CVForm):
       # don't let the user click 'ok' if no row is selected!
       self.__ok_button.Enabled = selected_rows.Count == 1
       
+   # ==========================================================================
+   def __prefetch_covers(self, row_index):
+      ''' 
+      Prefetches the cover art for the rows that are near the given (selected)
+      row in the table, nearest rows first, so that they are probably ready
+      by the time the user arrows up or down to look at them.
+      '''
+      rows_n = self.__table.Rows.Count
+      refs = []
+      for i in range(1, self.__config.prefetch_radius_n + 1):
+         for j in [row_index + i, row_index - i]:
+            if 0 <= j < rows_n:
+               index = self.__table.Rows[j].Cells[3].Value
+               refs.append(self.__issue_refs[index])
+      self.__coverpanel.prefetch(refs)
+      
+      
    # ==========================================================================
    def __sort_compare_fired(self, sender, args):
       ''' this method is called whenever the table is resorted '''
@@ -10,19 +10,20 @@ from cvform import CVForm
 from utils import sstr
 from matchscore import MatchScore
 import i18n
+import log
 from issuecoverpanel import IssueCoverPanel
  
 clr.AddReference('System')
-from System.ComponentModel import ListSortDirection
+from System import DateTime
 
 clr.AddReference('System.Drawing')
 from System.Drawing import Point, Size
 
 clr.AddReference('System.Windows.Forms')
 from System.Windows.Forms import AutoScaleMode, Button, \
-   DataGridViewAutoSizeColumnMode, DataGridViewContentAlignment, \
-   DataGridViewSelectionMode, DataGridViewTriState, DialogResult, \
-   Keys, Label
+   DataGridViewAutoSizeColumnMode, DataGridViewColumnSortMode, \
+   DataGridViewContentAlignment, DataGridViewSelectionMode, \
+   DataGridViewTriState, DialogResult, Keys, Label, SortOrder
 
 #==============================================================================
 class SeriesForm(CVForm):
@@ -56,6 +57,17 @@ class SeriesForm(CVForm):
       # the MatchScore object that we use to compute series match scores
       self.__matchscore = MatchScore()
       
+      # the match score for each SeriesRef in self.__series_refs (same order)
+      self.__scores = None
+      
+      # the indices (in self.__series_refs) of the SeriesRefs that are shown in
+      # each of the table's rows, in the order that the rows are displayed.  
+      # the table is in virtual mode, so it gets all its cell values from here.
+      self.__rows = None
+      
+      # the index of the column that the user last sorted the table by, if any
+      self.__sorted_column_n = None
+      
       # true when the user is pressing the control key, false otherwise
       self.__pressing_controlkey = False;
       
@@ -82,7 +94,11 @@ class SeriesForm(CVForm):
       if len(series_refs) <= 0:
          raise Exception("do not invoke the SeriesForm with no series!")
       CVForm.__init__(self, scraper.comicrack.MainWindow, "seriesformLocation")
+      start_ms = (DateTime.Now-DateTime(1970,1,1)).TotalMilliseconds
       self.__build_gui(book, search_terms_s);
+      log.debug("built the series dialog (", len(self.__series_refs), 
+         " rows) in ", int((DateTime.Now-DateTime(1970,1,1)).TotalMilliseconds
+         - start_ms), " ms")
       scraper.cancel_listeners.append(self.Close)
       
       
@@ -150,6 +166,7 @@ class SeriesForm(CVForm):
       table.AllowUserToAddRows = False
       table.AllowUserToResizeRows = False
       table.AllowUserToResizeColumns = False
+      table.VirtualMode = True
       table.DefaultCellStyle.NullValue = "--"
       table.AutoResizeColumns
 
@@ -210,23 +227,46 @@ class SeriesForm(CVForm):
       table.Columns[6].AutoSizeMode =\
          DataGridViewAutoSizeColumnMode.AllCells
 
-      # 3. --- copy model data into the table, each series is a row
-      for i in range(len(series_refs)):
-         table.Rows.Add()
-         ref = series_refs[i] 
-         table.Rows[i].Cells[0].Value = ref.series_name_s
-         if ref.volume_year_n >= 0:
-            table.Rows[i].Cells[1].Value = ref.volume_year_n
-         table.Rows[i].Cells[2].Value = ref.issue_count_n
-         table.Rows[i].Cells[3].Value = ref.publisher_s
-         table.Rows[i].Cells[4].Value = ref.series_key
-         table.Rows[i].Cells[5].Value = self.__matchscore.compute_n(book, ref)
-         table.Rows[i].Cells[6].Value = i
+      # the table is in virtual mode, so we sort it ourselves
+      for column in table.Columns:
+         column.SortMode = DataGridViewColumnSortMode.Programmatic
 
-      # 4. --- sort on the "match" colum
-      table.Sort( table.Columns[5], ListSortDirection.Descending )
+      # 3. --- compute the match scores, and sort the rows on them.  in 
+      #        virtual mode, the table only asks for the cell values that it
+      #        is actually displaying, so that's all we need to do up front.
+      self.__scores = [self.__matchscore.compute_n(book, ref) \
+         for ref in series_refs]
+      self.__rows = sorted(range(len(series_refs)), 
+         key=lambda i: self.__scores[i], reverse=True)
+      table.CellValueNeeded += self.__cell_value_needed_fired
+      table.ColumnHeaderMouseClick += self.__column_header_clicked_fired
+      table.RowCount = len(self.__rows)
+      
       table.SelectionChanged += self.__change_table_selection_fired
       return table
+   
+   
+   # ==========================================================================
+   def __cell_value(self, index, column_n):
+      ''' 
+      Returns the value to display in the given column of the table for the 
+      SeriesRef at the given index in self.__series_refs.
+      '''
+      ref = self.__series_refs[index]
+      if column_n == 0:
+         return ref.series_name_s
+      elif column_n == 1:
+         return ref.volume_year_n if ref.volume_year_n >= 0 else None
+      elif column_n == 2:
+         return ref.issue_count_n
+      elif column_n == 3:
+         return ref.publisher_s
+      elif column_n == 4:
+         return ref.series_key
+      elif column_n == 5:
+         return self.__scores[index]
+      else:
+         return index
 
 
    # ==========================================================================
@@ -371,9 +411,10 @@ class SeriesForm(CVForm):
       # and then also use it to update the displayed cover image.
       selected_rows = self.__table.SelectedRows
       if selected_rows.Count == 1:
-         self.__chosen_index = selected_rows[0].Cells[6].Value
+         self.__chosen_index = self.__rows[selected_rows[0].Index]
          self.__coverpanel.set_ref(
             self.__series_refs[self.__chosen_index])
+         self.__prefetch_covers(selected_rows[0].Index)
       else:
          self.__chosen_index = None
          self.__coverpanel.set_ref(None) 
@@ -383,6 +424,71 @@ class SeriesForm(CVForm):
       self.__issues_button.Enabled = selected_rows.Count == 1
       
                
+   #===========================================================================         
+   def __prefetch_covers(self, row_index):
+      ''' 
+      Prefetches the cover art for the rows that are near the given (selected)
+      row in the table, nearest rows first, followed by the cover art for the
+      top rows in the table (i.e. the series with the best match scores.)  
+      This way, the covers are probably ready by the time the user looks. 
+      '''
+      radius_n = self.__config.prefetch_radius_n
+      rows_n = len(self.__rows)
+      indices = []
+      for i in range(1, radius_n + 1):
+         indices += [row_index + i, row_index - i]
+      indices += range(radius_n + 1) if radius_n > 0 else []
+      
+      refs = []
+      for i in indices:
+         if 0 <= i < rows_n and i != row_index:
+            ref = self.__series_refs[self.__rows[i]]
+            if ref not in refs:
+               refs.append(ref)
+      self.__coverpanel.prefetch(refs)
+      
+      
+   #===========================================================================         
+   def __cell_value_needed_fired(self, sender, args):
+      ''' this method is called whenever the table needs a cell's value. '''
+      
+      if 0 <= args.RowIndex < len(self.__rows):
+         args.Value = self.__cell_value(
+            self.__rows[args.RowIndex], args.ColumnIndex)
+         
+   
+   #===========================================================================         
+   def __column_header_clicked_fired(self, sender, args):
+      ''' 
+      This method is called whenever the user clicks on a column header in the
+      table.  It sorts the rows on that column (or reverses the sort, if the
+      rows are already sorted on it), keeping the current selection.
+      '''
+      
+      column_n = args.ColumnIndex
+      header = self.__table.Columns[column_n].HeaderCell
+      ascending_b = column_n != self.__sorted_column_n or \
+         header.SortGlyphDirection != SortOrder.Ascending
+      if self.__sorted_column_n is not None:
+         self.__table.Columns[self.__sorted_column_n].HeaderCell\
+            .SortGlyphDirection = getattr(SortOrder, "None")
+      
+      def sort_key(index):
+         value = self.__cell_value(index, column_n)
+         return value.lower() if isinstance(value, basestring) else value
+      chosen_index = self.__chosen_index
+      self.__rows.sort(key=sort_key, reverse=not ascending_b)
+      self.__sorted_column_n = column_n
+      header.SortGlyphDirection = \
+         SortOrder.Ascending if ascending_b else SortOrder.Descending
+      self.__table.Invalidate()
+      
+      if chosen_index is not None:
+         row_n = self.__rows.index(chosen_index)
+         self.__table.CurrentCell = self.__table.Rows[row_n].Cells[0]
+         self.__change_table_selection_fired(None, None)
+      
+      
    #===========================================================================         
    def __key_was_pressed(self, sender, args):
       ''' Called whenever the user presses any key on this form. '''
@@ -0,0 +1,206 @@
+'''
+This module contains a size-limited cache for the (.NET) cover images that are
+displayed by DBPictureBoxes.  The cache is shared by all of the forms that
+are shown during a single scrape operation, so an image that was downloaded
+for one form never has to be downloaded again for the next one.
+
+Decoded images are expensive (both in memory and in GDI handles) so this
+cache has a byte budget.  When the budget is exceeded, the least recently used
+images are evicted and disposed.  Images that are 'acquired' (i.e. currently
+being displayed) are never evicted until they are 'released' again.
+
+@author: Cory Banack
+'''
+
+import clr
+import log
+from collections import OrderedDict
+
+clr.AddReference('System')
+from System.Threading import Monitor
+
+clr.AddReference('System.Drawing')
+from System.Drawing import Image
+
+# the maximum number of bytes of decoded image data that this cache will hold
+# before it starts evicting (and disposing) the least recently used images.
+__BUDGET_BYTES = 48 * 1024 * 1024
+
+# the lock that protects all of the module state below
+__lock = object()
+
+# the cached images, in least to most recently used order.  maps each ref
+# (the key that the image was added with) to a [image, bytes, pins] list.
+# this is None whenever this module isn't initialized.
+__entries = None
+
+# the total number of bytes of (decoded) image data in the cache right now
+__resident_bytes_n = 0
+
+# statistics for the debug log: cache hits, misses, and evicted images
+__hits_n = 0
+__misses_n = 0
+__evictions_n = 0
+
+
+# =============================================================================
+def initialize():
+   '''
+   Initializes this module.  Call this method once at the start of a scrape
+   (before using this module for anything else) and remember to call
+   "shutdown()" when the scrape is over.
+   '''
+   global __entries, __resident_bytes_n, __hits_n, __misses_n, __evictions_n
+   Monitor.Enter(__lock)
+   try:
+      __entries = OrderedDict()
+      __resident_bytes_n = 0
+      __hits_n = 0
+      __misses_n = 0
+      __evictions_n = 0
+   finally:
+      Monitor.Exit(__lock)
+
+
+# =============================================================================
+def shutdown():
+   '''
+   Undoes the "initialize()" method, disposing every image in the cache
+   (including acquired ones, so make sure nothing is still displaying them!)
+   and writing the cache statistics to the debug log.
+   '''
+   global __entries, __resident_bytes_n
+   Monitor.Enter(__lock)
+   try:
+      if __entries != None:
+         log.debug("image cache: ", __stats_s())
+         for entry in __entries.values():
+            entry[0].Dispose()
+         __entries = None
+         __resident_bytes_n = 0
+   finally:
+      Monitor.Exit(__lock)
+
+
+# =============================================================================
+def acquire(ref, counted_b=True):
+   '''
+   Returns the cached image for the given ref, or None if there isn't one.
+   A returned image will NOT be disposed by this cache until it is given back
+   via release(ref), so be sure to call that method when you're done with it.
+   Don't dispose of the returned image yourself!
+   
+   If 'counted_b' is False, this lookup doesn't count as a cache hit or miss
+   (i.e. when acquiring an image that was just loaded after a counted miss.)
+   '''
+   global __hits_n, __misses_n
+   Monitor.Enter(__lock)
+   try:
+      __check_initialized()
+      entry = __entries.pop(ref, None)
+      if entry:
+         __entries[ref] = entry # now it's the most recently used
+         entry[2] += 1
+         if counted_b:
+            __hits_n += 1
+            log.count("imagecache.hit")
+         return entry[0]
+      else:
+         if counted_b:
+            __misses_n += 1
+            log.count("imagecache.miss")
+         return None
+   finally:
+      Monitor.Exit(__lock)
+
+
+# =============================================================================
+def contains(ref):
+   '''
+   Returns True iff this cache currently contains an image for the given ref.
+   This doesn't count as a cache hit or miss, and doesn't acquire anything.
+   '''
+   Monitor.Enter(__lock)
+   try:
+      return __entries != None and ref in __entries
+   finally:
+      Monitor.Exit(__lock)
+
+
+# =============================================================================
+def release(ref):
+   '''
+   Gives back an image that was obtained for the given ref by acquire(ref).
+   Once an image has been released as many times as it has been acquired,
+   this cache is free to dispose of it (if it needs the room.)
+   '''
+   Monitor.Enter(__lock)
+   try:
+      if __entries != None and ref in __entries:
+         entry = __entries[ref]
+         entry[2] = max(0, entry[2] - 1)
+         __evict()
+   finally:
+      Monitor.Exit(__lock)
+
+
+# =============================================================================
+def add(ref, image):
+   '''
+   Adds the given (not None) image to this cache, keyed by the given ref.
+   From now on, this cache owns the given image and will dispose of it when
+   it is evicted, so don't dispose of it yourself.  If an image for the given
+   ref is already cached, the given image is disposed immediately instead.
+   '''
+   global __resident_bytes_n
+   Monitor.Enter(__lock)
+   try:
+      __check_initialized()
+      if ref in __entries:
+         if __entries[ref][0] != image:
+            image.Dispose()
+      else:
+         bytes_n = image.Width * image.Height * \
+            max(1, Image.GetPixelFormatSize(image.PixelFormat) / 8)
+         __entries[ref] = [image, bytes_n, 0]
+         __resident_bytes_n += bytes_n
+         __evict()
+   finally:
+      Monitor.Exit(__lock)
+
+
+# =============================================================================
+def __evict():
+   '''
+   Evicts (and disposes) least recently used, unacquired images from the cache
+   until the cache fits into its byte budget again.  Caller must hold the lock.
+   '''
+   global __resident_bytes_n, __evictions_n
+   if __resident_bytes_n > __BUDGET_BYTES:
+      for ref in list(__entries.keys()):
+         if __resident_bytes_n <= __BUDGET_BYTES:
+            break
+         entry = __entries[ref]
+         if entry[2] == 0:
+            del __entries[ref]
+            entry[0].Dispose()
+            __resident_bytes_n -= entry[1]
+            __evictions_n += 1
+      log.debug("image cache: ", __stats_s())
+
+
+# =============================================================================
+def __stats_s():
+   ''' Returns a debug string summarizing the state of the cache. '''
+   lookups_n = __hits_n + __misses_n
+   return "{0} images ({1:.1f} MB of {2:.1f} MB), {3:.0%} hit rate, "\
+      "{4} evicted".format(len(__entries), __resident_bytes_n / 1048576.0,
+      __BUDGET_BYTES / 1048576.0,
+      __hits_n / float(lookups_n) if lookups_n else 0.0, __evictions_n)
+
+
+# =============================================================================
+def __check_initialized():
+   ''' Raises an exception if this module isn't initialized. '''
+   if __entries == None:
+      raise Exception(__name__ + " module isn't initialized!")
@@ -0,0 +1,230 @@
+'''
+This module contains a shared service for loading cover images from the comic
+book database in the background.  The images are downloaded on the threads of
+the shared taskqueue (which it shares with the script's other background 
+tasks) and put into the shared imagecache.
+
+Requests for the same image are coalesced (an image is only ever downloaded
+once, no matter how many controls ask for it) and requests that nobody is
+waiting for anymore are cancelled before they are downloaded.  Regular 
+requests are USER priority tasks.  Images can also be 'prefetched', which 
+means they are loaded as PREFETCH priority tasks, only when there are no 
+regular requests waiting.  The downloads all go through the database module, 
+so they respect its request rate limit.
+
+@author: Cory Banack
+'''
+
+import clr
+import db
+import imagecache
+import log
+import taskqueue
+
+clr.AddReference('System')
+from System.Threading import Monitor
+
+# the lock that protects all of the module state below
+__lock = object()
+
+# the images that are waiting to be loaded.  maps each ref to its request, a 
+# [callbacks, CancelToken, priority] list, where 'callbacks' is the list of 
+# callback functions (empty for a prefetch) and the CancelToken and priority 
+# belong to the request's task in the taskqueue.  this is None whenever this
+# module isn't initialized.
+__waiting = None
+
+# the images that are being downloaded right now.  maps each ref to a list
+# of its callback functions (more callbacks can be added while downloading.)
+__loading = None
+
+# the number of downloads that are running right now (see shutdown())
+__running_n = 0
+
+
+# =============================================================================
+def initialize():
+   '''
+   Initializes this module.  Call this method once at the start of a scrape 
+   (after initializing the imagecache and the taskqueue) and remember to call
+   "shutdown()" when the scrape is over.
+   '''
+   global __waiting, __loading
+   Monitor.Enter(__lock)
+   try:
+      __waiting = {}
+      __loading = {}
+   finally:
+      Monitor.Exit(__lock)
+
+
+# =============================================================================
+def shutdown():
+   '''
+   Undoes the "initialize()" method.  Requests that haven't started yet are
+   dropped, and this method blocks until any downloads that are in progress
+   have finished.  Call this BEFORE shutting down the imagecache.
+   '''
+   global __waiting, __loading
+   Monitor.Enter(__lock)
+   try:
+      if __waiting:
+         for request in __waiting.values():
+            request[1].cancel()
+      __waiting = None
+      __loading = None
+      while __running_n > 0:
+         Monitor.Wait(__lock)
+   finally:
+      Monitor.Exit(__lock)
+
+
+# =============================================================================
+def request(ref, callback):
+   '''
+   Asks for the cover image for the given ref (a SeriesRef, IssueRef, or URL)
+   to be loaded into the imagecache in the background.  When that is done (or
+   if the image can't be loaded) the given no-argument callback function will
+   be called ON A TASKQUEUE THREAD, at which point the image, if there is one,
+   can be acquired from the imagecache.
+
+   If an image is requested more than once before it is loaded, it will only
+   be loaded once, and all the callbacks will be called.
+   '''
+   Monitor.Enter(__lock)
+   try:
+      if __waiting == None:
+         raise Exception(__name__ + " module isn't initialized!")
+      request = __waiting.get(ref)
+      if ref in __loading:
+         __loading[ref].append(callback)
+      elif request and request[2] == taskqueue.USER:
+         request[0].append(callback)
+      else:
+         if request:
+            request[1].cancel() # no longer just a prefetch
+         __submit(ref, [callback], taskqueue.USER)
+   finally:
+      Monitor.Exit(__lock)
+
+
+# =============================================================================
+def prefetch(refs):
+   '''
+   Asks for the cover images for all of the given refs (SeriesRefs, IssueRefs,
+   or URLs) to be loaded into the imagecache in the background, in the given 
+   order, but only when there are no regular requests waiting to be loaded.  
+   This replaces any refs that were given to this method previously but that
+   haven't been loaded yet (so they will NOT be loaded unless they are given
+   again.)  Refs that are already in the imagecache are ignored.
+   '''
+   Monitor.Enter(__lock)
+   try:
+      if __waiting != None:
+         for ref, request in __waiting.items():
+            if request[2] == taskqueue.PREFETCH:
+               request[1].cancel()
+               del __waiting[ref]
+         for ref in refs:
+            if (ref or ref == 0) and ref not in __waiting and \
+                  ref not in __loading and not imagecache.contains(ref):
+               __submit(ref, [], taskqueue.PREFETCH)
+   finally:
+      Monitor.Exit(__lock)
+
+
+# =============================================================================
+def cancel(ref, callback):
+   '''
+   Cancels an earlier request(ref, callback), so that the given callback will
+   not be called.  If nobody else has requested the same image, and it isn't
+   already being downloaded, then it won't be downloaded at all.
+   '''
+   Monitor.Enter(__lock)
+   try:
+      if __waiting != None:
+         request = __waiting.get(ref)
+         for callbacks in (request[0] if request else [], 
+               __loading.get(ref, [])):
+            if callback in callbacks:
+               callbacks.remove(callback)
+         if request and request[2] == taskqueue.USER and not request[0]:
+            request[1].cancel()
+            del __waiting[ref]
+   finally:
+      Monitor.Exit(__lock)
+
+
+# =============================================================================
+def __submit(ref, callbacks, priority_n):
+   '''
+   Submits a task with the given priority to the taskqueue, which loads the 
+   image for the given ref and then calls the given callbacks.  Caller must 
+   hold the lock.
+   '''
+   request = [callbacks, None, priority_n]
+   request[1] = taskqueue.submit(lambda: __load(ref, request), priority_n)
+   __waiting[ref] = request
+
+
+# =============================================================================
+def __load(ref, request):
+   '''
+   The taskqueue task for the given request (see __submit).  It downloads the
+   image for the given ref into the imagecache, and then calls the request's
+   callbacks, unless the request has been superseded or cancelled.
+   '''
+   global __running_n
+   Monitor.Enter(__lock)
+   try:
+      if __waiting == None or __waiting.get(ref) is not request:
+         return # we've been shut down, or superseded by a newer request
+      del __waiting[ref]
+      callbacks = request[0]
+      __loading[ref] = callbacks
+      __running_n += 1
+   finally:
+      Monitor.Exit(__lock)
+   
+   try:
+      if not callbacks and imagecache.contains(ref):
+         image = None # a prefetch that something else already loaded 
+      else:
+         image = __load_image(ref)
+
+      Monitor.Enter(__lock)
+      try:
+         callbacks = []
+         if __loading != None:
+            callbacks = __loading.pop(ref, [])
+            if image:
+               imagecache.add(ref, image) # the cache owns the image now
+         elif image:
+            image.Dispose() # we were shut down while we were loading
+      finally:
+         Monitor.Exit(__lock)
+   finally:
+      Monitor.Enter(__lock)
+      try:
+         __running_n -= 1
+         Monitor.PulseAll(__lock)
+      finally:
+         Monitor.Exit(__lock)
+
+   for callback in callbacks:
+      try: callback()
+      except Exception as ex:
+         try: log.handle_error(ex)
+         except: pass
+
+
+# =============================================================================
+def __load_image(ref):
+   ''' Loads the image for the given ref, or returns None if we can't. '''
+   try:
+      return db.query_image(ref, True)
+   except Exception as ex:
+      # our tasks should NEVER fail as the result of an exception!
+      try: log.handle_error(ex)
+      except: pass
+      return None
@@ -15,11 +15,16 @@ from progressbarform import ProgressBarForm
 from searchform import SearchForm
 import utils
 import db
+import imagecache
+import imageloader
+import taskqueue
 from welcomeform import WelcomeForm
 from finishform import FinishForm
 import i18n
 from matchscore import MatchScore
+from pendingqueue import PendingQueue
 from comicbook import ComicBook
+from dberrors import DatabaseOfflineError
 import automatcher
 import dbutils
 from configform import ConfigForm
@@ -84,10 +89,23 @@ class ScrapeEngine(object):
       # it becomes valid as soon as the main processing loop starts running.
       self.__status = [0,0]
       
+      # the number of book values that this scrape engine did NOT have to 
+      # write back to ComicRack, because they were already up-to-date.
+      self.__unchanged_n = 0
+      
       # an object that we use to keep (and add to) a persistent list of which 
       # series' the user has chosen while scraping.  it can then be used to
       # help present better sorted choices to the user in the future.
       self.__matchscore = MatchScore()
+      
+      # the persistent list of books that couldn't be scraped while we were
+      # working offline.  they are scraped first once we are online again.
+      self.__pending = None
+      
+      # maps each book's unique series key to the number of books in the 
+      # current scrape that share that key.  books that are part of a larger
+      # group can find their issues in a single, shared list of IssueRefs.
+      self.__series_sizes = {}
 
 
 
@@ -121,6 +139,8 @@ class ScrapeEngine(object):
       '''
       
       try:
+         log.reset_spans()
+         
          # a litte bit of logging to help make our debug logs more useful
          log.debug()
          log.debug("-"*80)
@@ -144,6 +164,12 @@ class ScrapeEngine(object):
             
          log.debug("Scraper terminated normally (scraped {0}, skipped {1})."\
             .format(self.__status[0], self.__status[1]))
+         log.debug("Skipped writing {0} unchanged values to ComicRack."\
+            .format(self.__unchanged_n))
+         if self.__pending and self.__pending.book_ids_sl:
+            log.debug("{0} books are pending until we're online again."\
+               .format(len(self.__pending.book_ids_sl)))
+         log.report_spans()
             
       except Exception, ex:
          log.handle_error(ex)
@@ -169,6 +195,7 @@ class ScrapeEngine(object):
       # from now on (so that it can be used to report the status of this 
       # scrape, even if an error occurs.)
       self.__status = [0, len(books)];
+      self.__unchanged_n = 0
       
       # 1. load the currently saved configuration settings from disk
       self.config = Configuration()
@@ -200,13 +227,30 @@ class ScrapeEngine(object):
       log.debug(self.config)
       log.debug()
       
-      # 4. fire up our database connection
-      db.initialize(**{'cv_apikey':self.config.api_key_s}) 
+      # 4. fire up our database connection, the (shared) cover image cache
+      #    and loader, and the shared queue for background tasks
+      db.initialize(**{'cv_apikey':self.config.api_key_s,
+         'cv_offline':self.config.offline_mode_b,
+         'cv_auto_offline':self.config.auto_offline_b,
+         'cv_config':self.config}) 
+      imagecache.initialize()
+      taskqueue.initialize()
+      imageloader.initialize() # loads its images on the taskqueue
       
       # 5. sort the ComicBooks in the order that we're gonna loop them in
       #    (sort AFTER config is loaded cause config affects the sort!)
+      #    wrapping books is cheap; each ComicBook only reads the ComicRack
+      #    fields that are actually used (by the sort, etc.) from its book.
       books = [ ComicBook(book, self) for book in books ]
       books = self.__sort_books(books) 
+      self.__pending = PendingQueue()
+      if not db.is_offline():
+         books = self.__add_pending_books(books)
+         self.__status[1] = len(books)
+      self.__series_sizes = {}
+      for book in books:
+         key = book.unique_series_s
+         self.__series_sizes[key] = self.__series_sizes.get(key, 0) + 1
 
       # 6. display the ComicForm dialog.  it is a special dialog that stays 
       #    around for the entire time that the this scrape operation is running.
@@ -229,7 +273,7 @@ class ScrapeEngine(object):
             #     don't do this for books that have been delayed or for the 
             #     first book that the user scrapes.
             delayed_b = i >= orig_length # book was delayed until the end
-            if i != 0 and not delayed_b:
+            if i != 0 and not delayed_b and not db.is_offline():
                self.__wait_until_ready()
                if self.__cancelled_b: break  # user cancelled while we waited
                
@@ -254,8 +298,19 @@ class ScrapeEngine(object):
                
             while not self.__cancelled_b:
                
-               bookstatus = self.__scrape_book(book, scrape_cache,
-                 manual_search_b, fast_rescrape_b, autoscrape_b, bookstatus)
+               try:
+                  bookstatus = self.__scrape_book(book, scrape_cache,
+                    manual_search_b, fast_rescrape_b, autoscrape_b, bookstatus)
+               except DatabaseOfflineError:
+                  log.debug_exc("Can't scrape this book while offline:")
+                  bookstatus = BookStatus("PENDING")
+               
+               # a SCRAPED book is done even if the user cancels right after
+               # it was scraped, but cancelling also returns SKIPPED, and that
+               # doesn't mean that the user chose to skip the book. 
+               if bookstatus.equals("SCRAPED") or \
+                     (bookstatus.equals("SKIPPED") and not self.__cancelled_b):
+                  self.__pending.remove(book) # the user is done with it
                
                if bookstatus.equals("UNSCRAPED"):
                   # this return code means 'no series could be found using 
@@ -278,6 +333,12 @@ class ScrapeEngine(object):
                   if not delayed_b: 
                      books.append(book)
                   break;
+               elif bookstatus.equals("PENDING"):
+                  # we're offline, and the data for this book isn't cached.
+                  # skip it for now, and scrape it first when we're online.
+                  log.debug("we'll scrape this book when we're online again.")
+                  self.__pending.add(book)
+                  break;
             
             # keep memory usage from getting out of control!
             GC.Collect()
@@ -290,6 +351,9 @@ class ScrapeEngine(object):
       finally:
          self.comicrack.MainWindow.Activate() # fixes issue 159
          if comic_form: comic_form.close_threadsafe()
+         taskqueue.shutdown()
+         imageloader.shutdown() # blocks until downloads finish
+         imagecache.shutdown()
          
 
 
@@ -353,6 +417,9 @@ class ScrapeEngine(object):
        BookStatus("DELAYED"): if we attempted to automatically scrape the book,
           but failed.  the book has not been scraped successfully.
           
+       If we are working offline, and the book can't be scraped from the 
+       local caches, this method throws a DatabaseOfflineError.
+          
        
       '''
 
@@ -380,8 +447,11 @@ class ScrapeEngine(object):
             sstr(issue_ref), "'");
          try:
             issue = db.query_issue(issue_ref, self.config.update_rating_b)
-            book.update(issue)
+            with log.span("ComicBook.update"):
+               self.__unchanged_n += book.update(issue)
             return BookStatus("SCRAPED")
+         except DatabaseOfflineError:
+            raise # we'll scrape this book later, when we're online
          except:
             log.debug_exc("Error rescraping details:")
             log.debug("we'll retry scraping this book again at the end.")
@@ -423,7 +493,8 @@ class ScrapeEngine(object):
          if self.config.confirm_issue_b:
             raise Exception("can't confirm issues while autoscraping")
          log.debug("trying to match this book automatically...")
-         auto_series_ref = automatcher.find_series_ref(book, self.config) 
+         with log.span("automatcher.find_series_ref"):
+            auto_series_ref = automatcher.find_series_ref(book, self.config) 
          if auto_series_ref:
             log.debug("...found a suitable match:  ", auto_series_ref)
             scraped_series = ScrapedSeries( auto_series_ref )
@@ -532,6 +603,9 @@ class ScrapeEngine(object):
                   refs = self.__query_issue_refs(series_ref)
                   if len(refs) == 1: issue_ref = list(refs)[0]
             else:
+               # the db finds the issue in the series' IssueRefs if we loaded
+               # them, and falls back to querying for it if it's not there.
+               self.__load_series_group(book, scraped_series)
                issue_ref = db.query_issue_ref( series_ref, book.issue_num_s )
                
             if issue_ref == None:
@@ -543,6 +617,8 @@ class ScrapeEngine(object):
                
          else:            
             # 5b. ...otherwise, try to find the issue interactively         
+            if not force_issue_dialog_b:
+               self.__load_series_group(book, scraped_series)
             issue_form_result = self.__choose_issue_ref( book, 
                scraped_series.series_ref, scraped_series.issue_refs, 
                force_issue_dialog_b)
@@ -569,7 +645,8 @@ class ScrapeEngine(object):
             # we've found the right issue!  copy it's data into the book.
             log.debug("querying comicvine for issue details...")
             issue = db.query_issue( issue_ref, self.config.update_rating_b )
-            book.update(issue)
+            with log.span("ComicBook.update"):
+               self.__unchanged_n += book.update(issue)
             
             # record the users choice.  this allows the SeriesForm to give this
             # choice a higher priority (sort order) in the future
@@ -580,6 +657,60 @@ class ScrapeEngine(object):
       raise Exception("should never get here")
 
 
+   # ==========================================================================
+   def __load_series_group(self, book, scraped_series):
+      '''
+      If the given book shares its series with other books in this scrape, 
+      this method makes sure that the given ScrapedSeries (the series for that
+      book) is populated with ALL of the IssueRefs in that series.  That way 
+      we only have to query the database once for the whole group of books, 
+      rather than once for each book in the group.  The db then finds each
+      book's issue in those IssueRefs (see db.query_issue_ref).
+      
+      This is only done when it is cheaper, i.e. when the series' issues take 
+      fewer pages (of 100 issues each) to load than there are books in the 
+      group, since each book would otherwise cost one filtered query.
+      '''
+      
+      group_n = self.__series_sizes.get(book.unique_series_s, 0)
+      pages_n = max(1, (scraped_series.series_ref.issue_count_n + 99) // 100)
+      if len(scraped_series.issue_refs) == 0 and book.issue_num_s and \
+            group_n > 1 and pages_n < group_n:
+         log.debug("this series is shared by ", group_n, " books")
+         for ref in self.__query_issue_refs(scraped_series.series_ref):
+            scraped_series.issue_refs.add(ref) # do NOT make a new set here!
+
+
+   # ==========================================================================
+   def __add_pending_books(self, books):
+      '''
+      Returns a new list that contains the given ComicBooks, plus all of the
+      books that are waiting in our PendingQueue (i.e. books that couldn't be
+      scraped the last time we were offline.)  The pending books come first,
+      and any of them that are still in the ComicRack library are included,
+      even if they weren't in the given list.
+      '''
+      pending_ids_sl = self.__pending.book_ids_sl
+      if not pending_ids_sl:
+         return books
+      
+      books_by_id = dict( (book.id_s, book) for book in books )
+      pending_books = [ books_by_id[id_s] 
+         for id_s in pending_ids_sl if id_s in books_by_id ]
+      missing_ids_sl = set(pending_ids_sl) - set(books_by_id.keys())
+      if missing_ids_sl:
+         for crbook in self.comicrack.App.GetLibraryBooks():
+            if sstr(crbook.Id) in missing_ids_sl:
+               pending_books.append( ComicBook(crbook, self) )
+               
+      log.debug("scraping ", len(pending_books), 
+         " books that were pending since we were last offline.")
+      pending_books = self.__sort_books(pending_books)
+      pending_ids_sl = set(pending_ids_sl)
+      return pending_books + \
+         [ book for book in books if book.id_s not in pending_ids_sl ]
+
+
    # ==========================================================================
    def __sort_books(self, books):
       '''
@@ -591,23 +722,10 @@ class ScrapeEngine(object):
       the beginning of the list.
       '''
       
-      # this is the comparator we'll use for sorting this list
-      def __compare_books(book1, book2):
-         result = book1.unique_series_s.CompareTo(book2.unique_series_s)
-         if result == 0:
-            num1 = '' if not book1.issue_num_s else book1.issue_num_s
-            num2 = '' if not book2.issue_num_s else book2.issue_num_s
-            def pad(num):
-               try:
-                  f = float(num.lower().strip('abcdefgh'))
-                  if f < 10: return "000" + num
-                  elif f < 100: return "00" + num
-                  elif f < 1000: return "0" + num
-                  else: return num
-               except:
-                  return num
-            result = pad(num1).CompareTo(pad(num2))
-         return result
+      # this is the sort key we'll use for sorting this list.  it is computed 
+      # exactly once per book (instead of once per comparison.)
+      def __book_key(book):
+         return utils.issue_sort_key(book.unique_series_s, book.issue_num_s)
 
       # divide the books up into the ones that will scrape quickly ('cause they
       # are rescrapes) and ones that have never been scraped before.  sort each
@@ -625,8 +743,8 @@ class ScrapeEngine(object):
       else:
          slow_scrape_books = list(books)
       
-      slow_scrape_books.sort(cmp=__compare_books)     
-      fast_scrape_books.sort(cmp=__compare_books)     
+      slow_scrape_books.sort(key=__book_key)     
+      fast_scrape_books.sort(key=__book_key)     
       
       return fast_scrape_books+slow_scrape_books
 
@@ -649,7 +767,8 @@ class ScrapeEngine(object):
       result = SeriesFormResult("SEARCH") # default
       if series_refs:
          log.debug('displaying the series selection dialog...')
-         with  SeriesForm(self, book, series_refs, search_terms_s) as sform:
+         with  SeriesForm(self, book, series_refs, search_terms_s) as sform,\
+               log.span("dialog.series"):
             result = sform.show_form() 
          log.debug('   ...user chose to ', result.get_debug_string())
       return result
@@ -739,7 +858,8 @@ class ScrapeEngine(object):
                log.debug("   ...could not identify issue number automatically")
             hint = result.get_ref() if result else None
             log.debug("displaying the issue selection dialog...")
-            with IssueForm(self, hint, issue_refs, series_ref) as issue_form:
+            with IssueForm(self, hint, issue_refs, series_ref) as issue_form,\
+                  log.span("dialog.issue"):
                result = issue_form.show_form()
                result = result if result else IssueFormResult("BACK")
             log.debug('   ...user chose to ', result.get_debug_string())
@@ -868,15 +988,15 @@ class BookStatus(object):
       
       id -> the status ID.  Must be one of "SCRAPED" (book was successfully 
             scraped), "SKIPPED" (user chose to skip this book), "UNSCRAPED" 
-            (hasn't been scraped yet) or "DELAYED" (hasn't been scraped, try
-            again later).
+            (hasn't been scraped yet), "DELAYED" (hasn't been scraped, try
+            again later) or "PENDING" (can't be scraped until we're online.)
       failed_search_terms_s -> (optional) the series search terms that couldn't 
             be found, if there are any.  This only makes sense in certain cases
             where the id is "UNSCRAPED". 
       '''  
             
       if id != "SCRAPED" and id != "SKIPPED" and \
-            id != "UNSCRAPED" and id != "DELAYED":
+            id != "UNSCRAPED" and id != "DELAYED" and id != "PENDING":
          raise Exception();
       
       self.__id = id
@@ -891,7 +1011,7 @@ class BookStatus(object):
    def equals(self, id):
       ''' 
       Returns True iff this BookStatus has the given ID (i.e. one of "SCRAPED",
-      "UNSCRAPED", "SKIPPED", or "DELAYED").
+      "UNSCRAPED", "SKIPPED", "DELAYED" or "PENDING").
       '''
       return self.__id == id
 
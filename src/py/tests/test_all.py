@@ -11,6 +11,10 @@ import log
 import test_fnameparser 
 import test_bookdata
 import test_utils
+import test_taskqueue
+import test_cvjson
+import test_singleflight
+import test_throttle
 
 #==============================================================================
 class AllTests(unittest.TestSuite):
@@ -25,6 +29,10 @@ class AllTests(unittest.TestSuite):
          loader.loadTestsFromModule(test_bookdata),
          loader.loadTestsFromModule(test_fnameparser),
          loader.loadTestsFromModule(test_utils), 
+         loader.loadTestsFromModule(test_taskqueue),
+         loader.loadTestsFromModule(test_cvjson),
+         loader.loadTestsFromModule(test_singleflight),
+         loader.loadTestsFromModule(test_throttle),
          # corylow: can we make a test_cleanupsearchterms?
          ] 
       )
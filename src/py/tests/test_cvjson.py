@@ -0,0 +1,97 @@
+'''
+This module contains all unittests for the cvjson module.  Each test checks
+that a recorded ComicVine XML response (from tools/testdata/cvfixtures) and
+the equivalent JSON response are parsed into exactly the same DOM.  The 
+fixtures in tools/testdata/cvjson are written by hand in the shapes that the
+real ComicVine sends (details objects, '*_credits' arrays, integer ids, nulls)
+rather than generated by the stand-in server, so they check that cvjson 
+copes with the real thing.
+
+@author: Cory Banack
+'''
+import clr
+import cvjson
+import utils
+import xml2py
+from unittest import TestCase, TestSuite
+
+clr.AddReference('System')
+from System.IO import Directory, File, Path, SearchOption
+from System.Text import Encoding
+
+#==============================================================================
+def load_tests(loader, tests, pattern):
+   ''' Returns all of the testcases in this module as a testsuite '''
+   testdata_dir_s = __file__[:-(len(__name__) + len('.py'))] + \
+      r"..\..\..\tools\testdata"
+   testdata = __load_testdata(testdata_dir_s + r"\cvfixtures\api") + \
+      __load_testdata(testdata_dir_s + r"\cvjson")
+   return TestSuite( [ TestCvJson(x) for x in testdata ] )
+
+#==============================================================================
+def __load_testdata(dir_s):
+   '''
+   Reads the testdata out of the given fixture directory.  Each recorded
+   response consists of a '.key' file (the query), an '.xml' file (the XML
+   response), and a '.json' file (the JSON response, see the stand-in
+   server's 'jsonify' command.)  Returns a list of [key, xml, json] lists.
+   '''
+   retval = []
+   dir_s = Path.GetFullPath(dir_s)
+   if Directory.Exists(dir_s):
+      for key_file_s in sorted(Directory.GetFiles(dir_s, "*.key",
+            SearchOption.AllDirectories)):
+         base_s = key_file_s[:-len(".key")]
+         if File.Exists(base_s + ".xml") and File.Exists(base_s + ".json"):
+            retval.append( [ File.ReadAllText(key_file_s, Encoding.UTF8),
+               File.ReadAllText(base_s + ".xml", Encoding.UTF8),
+               File.ReadAllText(base_s + ".json", Encoding.UTF8) ] )
+   return retval
+
+
+#==============================================================================
+class TestCvJson(TestCase):
+
+   # --------------------------------------------------------------------------
+   def __init__(self, testdata):
+      '''
+      Constructs a new testcase, based on the given testdata list:
+          [ query key, xml response, json response ]
+      '''
+      super(TestCvJson, self).__init__()
+      self.__testdata = testdata
+
+   # --------------------------------------------------------------------------
+   def runTest(self):
+      ''' Checks that both responses for this test parse into the same DOM. '''
+      key_s, xml_s, json_s = self.__testdata
+      # cvconnection html decodes xml responses before it parses them
+      xml_dom = xml2py.parseString(utils.html_decode(xml_s))
+      json_dom = cvjson.parseString(json_s, key_s.split('?')[0].split('/')[0])
+      self.__assert_same(xml_dom, json_dom, key_s + " -> response")
+
+   # --------------------------------------------------------------------------
+   def __assert_same(self, xml_dom, json_dom, path_s):
+      '''
+      Asserts that the given parts of the xml and json DOMs (at the given
+      path, for the error message) are the same, all the way down.
+      '''
+      if isinstance(xml_dom, list):
+         self.assertTrue(isinstance(json_dom, list), path_s + " isn't a list")
+         self.assertEquals(len(xml_dom), len(json_dom), path_s + " length")
+         for i in range(len(xml_dom)):
+            self.__assert_same(xml_dom[i], json_dom[i],
+               path_s + "[" + str(i) + "]")
+      elif utils.is_string(xml_dom):
+         self.assertTrue(utils.is_string(json_dom), path_s+" isn't a string")
+         self.assertEquals(xml_dom, json_dom, path_s + " value")
+      else:
+         self.assertFalse(utils.is_string(json_dom) or
+            isinstance(json_dom, list), path_s + " isn't an element")
+         names_sl = sorted(n for n in xml_dom.__dict__ if n != "_nodetype")
+         self.assertEquals(names_sl,
+            sorted(n for n in json_dom.__dict__ if n != "_nodetype"),
+            path_s + " children")
+         for name_s in names_sl:
+            self.__assert_same(getattr(xml_dom, name_s),
+               getattr(json_dom, name_s), path_s + "." + name_s)
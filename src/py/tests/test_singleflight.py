@@ -0,0 +1,234 @@
+'''
+This module contains all unittests for the singleflight module.
+
+@author: Cory Banack
+'''
+
+from unittest import TestCase
+from unittest.loader import TestLoader
+from singleflight import SingleFlight
+import random
+import sys
+import threading
+import time
+import traceback
+
+#==============================================================================
+def load_tests(loader, tests, pattern):
+   ''' Returns all of the testcases in this module as a testsuite '''
+   return TestLoader().loadTestsFromTestCase(TestSingleFlight)
+
+#==============================================================================
+class TestSingleFlight(TestCase):
+
+   # --------------------------------------------------------------------------
+   def setUp(self):
+      ''' Creates fresh lists for callers to record their calls and results. '''
+      self.calls = []
+      self.results = []
+      self.tracebacks = []
+      self.lock = threading.Lock()
+
+   # --------------------------------------------------------------------------
+   def call(self, flight, key, function):
+      '''
+      Returns a thread that calls the given function through the given
+      SingleFlight, and records the result (or exception) that it gets.
+      '''
+      def run():
+         try:
+            result = flight.do(key, function)
+         except BaseException, ex:
+            result = ex
+            self.tracebacks.append(traceback.extract_tb(sys.exc_info()[2]))
+         with self.lock:
+            self.results.append(result)
+      thread = threading.Thread(target=run)
+      thread.setDaemon(True)
+      return thread
+
+   # --------------------------------------------------------------------------
+   def slow(self, value, release):
+      '''
+      Returns a function that records that it was called, waits until the
+      given event is set, and then returns the given value (or raises it,
+      if it is an exception.)
+      '''
+      def function():
+         with self.lock:
+            self.calls.append(value)
+         release.wait(30)
+         if isinstance(value, BaseException):
+            raise value
+         return value
+      return function
+
+   # --------------------------------------------------------------------------
+   def wait_for_waiters(self, flight, waiting_n):
+      ''' Waits until the given number of callers are waiting in flight. '''
+      for i in range(1000):
+         if flight.waiting_n == waiting_n:
+            break
+         time.sleep(0.01)
+      self.assertEquals(waiting_n, flight.waiting_n)
+
+   # --------------------------------------------------------------------------
+   def join(self, threads):
+      ''' Waits for all of the given threads to finish. '''
+      for thread in threads:
+         thread.join(30)
+         self.assertFalse(thread.isAlive())
+
+
+   # --------------------------------------------------------------------------
+   def test_shared_result(self):
+      ''' Checks that concurrent callers for one key share a single call. '''
+
+      flight = SingleFlight("test")
+      release = threading.Event()
+      result = object()
+      threads = [ self.call(flight, "key", self.slow(result, release))
+         for i in range(20) ]
+      try:
+         for thread in threads:
+            thread.start()
+         self.wait_for_waiters(flight, 19)
+      finally:
+         release.set()
+      self.join(threads)
+      self.assertEquals(1, len(self.calls))
+      self.assertEquals([result] * 20, self.results)
+      self.assertEquals(0, flight.waiting_n)
+
+   # --------------------------------------------------------------------------
+   def test_shared_exception(self):
+      ''' Checks that concurrent callers all get a failed call's exception. '''
+
+      flight = SingleFlight("test")
+      release = threading.Event()
+      error = ValueError("failed")
+      threads = [ self.call(flight, "key", self.slow(error, release))
+         for i in range(5) ]
+      try:
+         for thread in threads:
+            thread.start()
+         self.wait_for_waiters(flight, 4)
+      finally:
+         release.set()
+      self.join(threads)
+      self.assertEquals(1, len(self.calls))
+      self.assertEquals([error] * 5, self.results)
+
+      # the failed call is over, so the next call runs again
+      self.assertEquals("ok", flight.do("key", lambda: "ok"))
+
+   # --------------------------------------------------------------------------
+   def test_shared_failure(self):
+      '''
+      Checks that callers who shared a call get its failure even when it 
+      isn't an Exception (i.e. a thread abort), with the original traceback.
+      '''
+
+      class Abort(BaseException): pass
+      flight = SingleFlight("test")
+      release = threading.Event()
+      error = Abort("aborted")
+      threads = [ self.call(flight, "key", self.slow(error, release))
+         for i in range(5) ]
+      try:
+         for thread in threads:
+            thread.start()
+         self.wait_for_waiters(flight, 4)
+      finally:
+         release.set()
+      self.join(threads)
+      self.assertEquals(1, len(self.calls))
+      self.assertEquals([error] * 5, self.results)
+      # every caller's traceback ends where the shared call raised the error
+      self.assertEquals(5, len(self.tracebacks))
+      for tb in self.tracebacks:
+         self.assertEquals("function", tb[-1][2])
+
+   # --------------------------------------------------------------------------
+   def test_distinct_keys(self):
+      ''' Checks that calls with different keys run independently. '''
+
+      flight = SingleFlight("test")
+      release = threading.Event()
+      threads = [ self.call(flight, key, self.slow(key, release))
+         for key in ("a", "b", "c") ]
+      try:
+         for thread in threads:
+            thread.start()
+         for i in range(1000):
+            if len(self.calls) == 3:
+               break
+            time.sleep(0.01)
+         self.assertEquals(["a", "b", "c"], sorted(self.calls))
+         self.assertEquals(0, flight.waiting_n)
+      finally:
+         release.set()
+      self.join(threads)
+      self.assertEquals(["a", "b", "c"], sorted(self.results))
+
+   # --------------------------------------------------------------------------
+   def test_no_caching(self):
+      ''' Checks that calls that don't overlap are never shared. '''
+
+      flight = SingleFlight("test")
+      counter = [0]
+      def function():
+         counter[0] += 1
+         return counter[0]
+      self.assertEquals(1, flight.do("key", function))
+      self.assertEquals(2, flight.do("key", function))
+
+   # --------------------------------------------------------------------------
+   def test_recursive_call(self):
+      ''' Checks that a call can make a nested call with its own key. '''
+
+      flight = SingleFlight("test")
+      outer = lambda: flight.do("key", lambda: "inner") + "+outer"
+      self.assertEquals("inner+outer", flight.do("key", outer))
+
+   # --------------------------------------------------------------------------
+   def test_stress(self):
+      ''' Checks many threads calling with a few keys, over and over. '''
+
+      flight = SingleFlight("test")
+      keys = range(5)
+      runs = dict( (key, [0]) for key in keys )
+      errors = []
+      def error(message):
+         with self.lock:
+            errors.append(message)
+
+      def function(key):
+         with self.lock:
+            runs[key][0] += 1
+         time.sleep(random.random() * 0.002)
+         if random.random() < 0.1:
+            raise ValueError(key)
+         return key * 10
+
+      def caller():
+         for i in range(200):
+            key = random.choice(keys)
+            try:
+               result = flight.do(key, lambda: function(key))
+               if result != key * 10:
+                  error("wrong result for " + str(key))
+            except ValueError, ex:
+               if ex.args != (key,):
+                  error("wrong exception for " + str(key))
+            except Exception, ex:
+               error(str(ex))
+
+      threads = [ threading.Thread(target=caller) for i in range(16) ]
+      for thread in threads:
+         thread.setDaemon(True)
+         thread.start()
+      self.join(threads)
+      self.assertEquals([], errors)
+      self.assertEquals(0, flight.waiting_n)
+      self.assertTrue(sum(r[0] for r in runs.values()) <= 16 * 200)
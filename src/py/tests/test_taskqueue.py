@@ -0,0 +1,204 @@
+'''
+This module contains all unittests for the taskqueue module.
+
+@author: Cory Banack
+'''
+
+from unittest import TestCase
+from unittest.loader import TestLoader
+from taskqueue import TaskQueue, USER, PREFETCH, BACKGROUND
+import threading
+
+#==============================================================================
+def load_tests(loader, tests, pattern):
+   ''' Returns all of the testcases in this module as a testsuite '''
+   return TestLoader().loadTestsFromTestCase(TestTaskQueue)
+
+#==============================================================================
+class TestTaskQueue(TestCase):
+
+   # --------------------------------------------------------------------------
+   def setUp(self):
+      ''' Creates a fresh list for tasks to record that they've been run. '''
+      self.ran = []
+      self.lock = threading.Lock()
+
+   # --------------------------------------------------------------------------
+   def record(self, name):
+      ''' Returns a task that records the given name when it is run. '''
+      def task():
+         with self.lock:
+            self.ran.append(name)
+      return task
+
+   # --------------------------------------------------------------------------
+   def block(self, queue, thread_count_n=1):
+      '''
+      Submits tasks that occupy all the threads of the given TaskQueue until
+      the returned event is set, and waits for those tasks to start.
+      '''
+      release = threading.Event()
+      for i in range(thread_count_n):
+         started = threading.Event()
+         def task(started=started):
+            started.set()
+            release.wait(30)
+         queue.submit(task)
+         self.assertTrue(started.wait(10))
+      return release
+
+   # --------------------------------------------------------------------------
+   def drain(self, queue):
+      ''' Waits until the given TaskQueue has run all of its waiting tasks. '''
+      done = threading.Event()
+      queue.submit(done.set, BACKGROUND)
+      self.assertTrue(done.wait(10))
+
+
+   # --------------------------------------------------------------------------
+   def test_priority_order(self):
+      ''' Checks that tasks run by priority, and in submission order. '''
+
+      queue = TaskQueue(1)
+      try:
+         release = self.block(queue)
+         queue.submit(self.record("b1"), BACKGROUND)
+         queue.submit(self.record("p1"), PREFETCH)
+         queue.submit(self.record("u1"), USER)
+         queue.submit(self.record("b2"), BACKGROUND)
+         queue.submit(self.record("u2"), USER)
+         queue.submit(self.record("p2"), PREFETCH)
+         release.set()
+         self.drain(queue)
+         self.assertEquals(["u1", "u2", "p1", "p2", "b1", "b2"], self.ran)
+      finally:
+         queue.shutdown(True)
+
+   # --------------------------------------------------------------------------
+   def test_supersede_by_key(self):
+      ''' Checks that a task supersedes a waiting task with the same key. '''
+
+      queue = TaskQueue(1)
+      try:
+         release = self.block(queue)
+         first = queue.submit(self.record("a1"), USER, "a")
+         queue.submit(self.record("b1"), USER, "b")
+         queue.submit(self.record("a2"), USER, "a")
+         queue.submit(self.record("none"), USER)
+         last = queue.submit(self.record("a3"), PREFETCH, "a")
+         release.set()
+         self.drain(queue)
+         self.assertEquals(["b1", "none", "a3"], self.ran)
+         self.assertTrue(first.cancelled_b)
+         self.assertFalse(last.cancelled_b)
+
+         # a key can be reused once its task has started
+         queue.submit(self.record("a4"), USER, "a")
+         self.drain(queue)
+         self.assertEquals(["b1", "none", "a3", "a4"], self.ran)
+      finally:
+         queue.shutdown(True)
+
+   # --------------------------------------------------------------------------
+   def test_cancel(self):
+      ''' Checks that cancelled tasks are never run. '''
+
+      queue = TaskQueue(1)
+      try:
+         release = self.block(queue)
+         queue.submit(self.record("1"))
+         queue.submit(self.record("2")).cancel()
+         queue.submit(self.record("3"), BACKGROUND)
+         queue.submit(self.record("4"), BACKGROUND).cancel()
+         release.set()
+         self.drain(queue)
+         self.assertEquals(["1", "3"], self.ran)
+      finally:
+         queue.shutdown(True)
+
+   # --------------------------------------------------------------------------
+   def test_done(self):
+      ''' Checks that tokens are done once their tasks are run or cancelled. '''
+
+      queue = TaskQueue(1)
+      try:
+         release = self.block(queue)
+         ran = queue.submit(self.record("ran"))
+         cancelled = queue.submit(self.record("cancelled"))
+         self.assertFalse(ran.done_b)
+         self.assertFalse(cancelled.done_b)
+         cancelled.cancel()
+         self.assertTrue(cancelled.done_b)
+         release.set()
+         self.drain(queue)
+         self.assertTrue(ran.done_b)
+         self.assertFalse(ran.cancelled_b)
+      finally:
+         queue.shutdown(True)
+
+   # --------------------------------------------------------------------------
+   def test_shutdown(self):
+      ''' Checks that no tasks are run after a TaskQueue is shut down. '''
+
+      queue = TaskQueue(1)
+      release = self.block(queue)
+      waiting = queue.submit(self.record("waiting"))
+      release.set()
+      queue.shutdown(True)
+      late = queue.submit(self.record("late"))
+      self.assertTrue(late.cancelled_b)
+      self.assertTrue(waiting.cancelled_b or self.ran == ["waiting"])
+      self.assertTrue("late" not in self.ran)
+
+   # --------------------------------------------------------------------------
+   def test_contention(self):
+      '''
+      Checks that when many threads submit and cancel tasks at the same time,
+      every task that isn't cancelled or superseded is run exactly once, and
+      no other task is run at all.
+      '''
+
+      queue = TaskQueue(3)
+      expected = []
+      expected_lock = threading.Lock()
+      try:
+         # hold the queue's threads while submitting, so that we know exactly
+         # which tasks were cancelled before they could start
+         release = self.block(queue, 3)
+         def submitter(id_n):
+            for i in range(200):
+               name = "{0}-{1}".format(id_n, i)
+               priority_n = (USER, PREFETCH, BACKGROUND)[i % 3]
+               token = queue.submit(self.record(name), priority_n)
+               if i % 4 == 0:
+                  token.cancel()
+                  with expected_lock:
+                     expected.append("cancelled " + name)
+               else:
+                  with expected_lock:
+                     expected.append(name)
+            # a run of superseding tasks; only the last one should run
+            for i in range(50):
+               queue.submit(self.record("key-{0}".format(id_n)),
+                  PREFETCH, "key-{0}".format(id_n))
+
+         threads = [ threading.Thread(target=submitter, args=(n,)) \
+            for n in range(6) ]
+         for thread in threads: thread.start()
+         for thread in threads: thread.join(30)
+         release.set()
+         self.drain(queue)
+         queue.shutdown(True)
+
+         for name in expected:
+            if name.startswith("cancelled "):
+               self.assertFalse(name[10:] in self.ran, name)
+            else:
+               self.assertEquals(1, self.ran.count(name), name)
+         for n in range(6):
+            self.assertEquals(1, self.ran.count("key-{0}".format(n)))
+         self.assertEquals(
+            len([x for x in expected if not x.startswith("cancelled ")]),
+            len([x for x in self.ran if not x.startswith("key-")]) )
+      finally:
+         queue.shutdown(True)
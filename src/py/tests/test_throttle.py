@@ -0,0 +1,133 @@
+'''
+This module contains all unittests for the throttle module.
+
+@author: Cory Banack
+'''
+
+from unittest import TestCase
+from unittest.loader import TestLoader
+from throttle import Throttle
+import clr
+import threading
+import time
+
+clr.AddReference('System')
+from System.Diagnostics import Stopwatch
+
+#==============================================================================
+def load_tests(loader, tests, pattern):
+   ''' Returns all of the testcases in this module as a testsuite '''
+   return TestLoader().loadTestsFromTestCase(TestThrottle)
+
+#==============================================================================
+class TestThrottle(TestCase):
+
+   # --------------------------------------------------------------------------
+   def setUp(self):
+      ''' Creates a fresh list for callers to record when they got through. '''
+      self.passed = []
+      self.lock = threading.Lock()
+
+   # --------------------------------------------------------------------------
+   def now_ms(self):
+      ''' Returns the current time (ms) on the same clock as the Throttle. '''
+      return Stopwatch.GetTimestamp() * 1000.0 / Stopwatch.Frequency
+
+   # --------------------------------------------------------------------------
+   def waiter(self, throttle, name):
+      '''
+      Returns a started thread that waits on the given Throttle, and then
+      records the given name and the time that it got through.
+      '''
+      def run():
+         throttle.wait()
+         with self.lock:
+            self.passed.append( (name, self.now_ms()) )
+      thread = threading.Thread(target=run)
+      thread.setDaemon(True)
+      thread.start()
+      return thread
+
+   # --------------------------------------------------------------------------
+   def join(self, threads):
+      ''' Waits for all of the given threads to finish. '''
+      for thread in threads:
+         thread.join(30)
+         self.assertFalse(thread.isAlive())
+
+
+   # --------------------------------------------------------------------------
+   def test_first_call(self):
+      ''' Checks that a call doesn't wait if no one called before it. '''
+
+      throttle = Throttle("test", 5000)
+      start_ms = self.now_ms()
+      throttle.wait()
+      self.assertTrue(self.now_ms() - start_ms < 2500)
+      self.assertEquals(0, throttle.waiting_n)
+
+   # --------------------------------------------------------------------------
+   def test_spacing(self):
+      ''' Checks that concurrent callers are kept the delay apart. '''
+
+      throttle = Throttle("test", 100)
+      start_ms = self.now_ms()
+      threads = [ self.waiter(throttle, i) for i in range(8) ]
+      self.join(threads)
+
+      times = sorted( t for name, t in self.passed )
+      for i in range(len(times)):
+         self.assertTrue(times[i] >= start_ms + i * 100,
+            "caller " + str(i) + " didn't wait long enough")
+      # nobody waited for more than their own turn
+      self.assertTrue(times[-1] < start_ms + 7 * 100 + 2000)
+      self.assertEquals(0, throttle.waiting_n)
+
+   # --------------------------------------------------------------------------
+   def test_fair_order(self):
+      ''' Checks that waiting callers get through first come first served. '''
+
+      # each caller is started only once the one before it is confirmed to 
+      # be waiting, and the delay is long enough that nobody gets through
+      # before all of them are queued up.
+      throttle = Throttle("test", 400)
+      throttle.wait() # so that everyone below has to wait
+      threads = []
+      for i in range(8):
+         threads.append(self.waiter(throttle, i))
+         for j in range(1000):
+            if throttle.waiting_n > i:
+               break
+            time.sleep(0.001)
+         self.assertEquals(i + 1, throttle.waiting_n)
+      self.join(threads)
+      self.assertEquals(range(8), [ name for name, t in self.passed ])
+      self.assertEquals(0, throttle.waiting_n)
+
+   # --------------------------------------------------------------------------
+   def test_queue_depth(self):
+      ''' Checks that waiting_n counts the callers that are waiting. '''
+
+      throttle = Throttle("test", 2000)
+      throttle.wait()
+      threads = [ self.waiter(throttle, i) for i in range(2) ]
+      for j in range(1000):
+         if throttle.waiting_n == 2:
+            break
+         time.sleep(0.01)
+      self.assertEquals(2, throttle.waiting_n)
+      throttle.delay_ms = 0 # doesn't affect the callers that are waiting
+      self.join(threads)
+      self.assertEquals(0, throttle.waiting_n)
+
+   # --------------------------------------------------------------------------
+   def test_no_delay(self):
+      ''' Checks that a Throttle with no delay never waits. '''
+
+      throttle = Throttle("test", 5000)
+      throttle.delay_ms = 0
+      start_ms = self.now_ms()
+      for i in range(20):
+         throttle.wait()
+      self.assertTrue(self.now_ms() - start_ms < 2500)
+      self.assertEquals(0, throttle.delay_ms)
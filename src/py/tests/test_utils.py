@@ -8,7 +8,8 @@ Created on Jan 5, 2012
 
 from unittest import TestCase
 from unittest.loader import TestLoader
-from utils import natural_compare, natural_key
+from utils import natural_compare, natural_key, issue_sort_key
+import random
 
 #==============================================================================
 def load_tests(loader, tests, pattern):
@@ -65,5 +66,99 @@ class TestUtils(TestCase):
       self.assertEquals( natural_key("6 au"), natural_key("6au") ) 
       self.assertEquals( natural_key("0.0 final"), natural_key("0 final") ) 
       self.assertEquals( natural_key(".5"), natural_key(" 0 ½") ) 
-      self.assertEquals( natural_key("000.5"), natural_key("0½") ) 
-            
+      self.assertEquals( natural_key("000.5"), natural_key("0½") )
+
+   # --------------------------------------------------------------------------
+   def test_issue_sort_key(self):
+      ''' Checks to see if the utils.issue_sort_key() method works. '''
+      unsorted = [("b", "2"), ("a", "10"), ("b", ""), ("a", "9"), ("a", "½"),
+                  ("a", None), ("a", "Annual"), ("a", "9a"), ("a", "-1")]
+      expected = [("a", None), ("a", "-1"), ("a", "½"), ("a", "9"), 
+                  ("a", "9a"), ("a", "10"), ("a", "Annual"), ("b", ""), 
+                  ("b", "2")]
+      self.assertEquals(expected, 
+         sorted(unsorted, key=lambda x: issue_sort_key(x[0], x[1])))
+      
+   # --------------------------------------------------------------------------
+   def test_issue_sort_key_matches_legacy_order(self):
+      ''' 
+      Checks that sorting a large, synthetic library of (series, issue) pairs
+      with utils.issue_sort_key() gives exactly the same order as the old
+      comparator that the ScrapeEngine used to sort books with.  The series
+      names include accents, punctuation and mixed case, which .NET's 
+      culture-aware CompareTo() orders differently than a plain cmp() does.
+      The issue numbers include letter suffixes, decimals, words and blanks.
+      (See test_issue_sort_key_differences for the ones that are ordered 
+      differently on purpose.)
+      '''
+      
+      # the (old) comparator that utils.issue_sort_key() replaced
+      def legacy_compare(book1, book2):
+         result = book1[0].CompareTo(book2[0])
+         if result == 0:
+            num1 = '' if not book1[1] else book1[1]
+            num2 = '' if not book2[1] else book2[1]
+            def pad(num):
+               try:
+                  f = float(num.lower().strip('abcdefgh'))
+                  if f < 10: return "000" + num
+                  elif f < 100: return "00" + num
+                  elif f < 1000: return "0" + num
+                  else: return num
+               except:
+                  return num
+            result = pad(num1).CompareTo(pad(num2))
+         return result
+      
+      rand = random.Random(1234)
+      series = [ "Élan", "elan", "Elan", "Ábaco", "abaco", "Abaco", 
+         "Æon Flux", "Aeon Flux", "X-Men", "X Men", "XMen", "x-men", 
+         "Spider-Man", "Spiderman", "Zoë", "Zoe", "Über", "Uber", "D'Arc", 
+         "Darc", "Co-op", "Coop", "The 'Nam", "The Nam", "100 Bullets", 
+         "2000 AD", "[Untitled]", "_Hidden", "Ñandú", "Nandu", "Søren", 
+         "Soren", "Ōkami", "Okami", "Batman: Year One", "Batman - Year One" ]
+      # make sure these names really do test the culture-aware ordering
+      self.assertNotEquals(sorted(series), 
+         sorted(series, cmp=lambda s1, s2: s1.CompareTo(s2)))
+      series += [ "series{0}".format(i) for i in range(500) ]
+      words = [ "Annual", "Special", "Preview", "Giant" ]
+      books = []
+      for i in range(30000):
+         # letter suffixes only go on even numbers, and decimals only on odd
+         # ones, since the old comparator put '12.5' before '12a'
+         n = rand.randint(0, 999)
+         r = rand.random()
+         if r < 0.10:
+            issue_num_s = str(n - n % 2) + rand.choice("abcdefgh")
+         elif r < 0.20:
+            issue_num_s = str(n | 1) + rand.choice([".1", ".25", ".5", ".75"])
+         elif r < 0.25:
+            issue_num_s = rand.choice(words)
+         elif r < 0.30:
+            issue_num_s = ""
+         else:
+            issue_num_s = str(n)
+         books.append( (rand.choice(series), issue_num_s, i) )
+         
+      expected = sorted(books, cmp=legacy_compare)
+      actual = sorted(books, key=lambda x: issue_sort_key(x[0], x[1]))
+      self.assertEquals(expected, actual)
+
+   # --------------------------------------------------------------------------
+   def test_issue_sort_key_differences(self):
+      ''' 
+      Checks the issue numbers that utils.issue_sort_key() orders differently
+      than the old ScrapeEngine comparator did, on purpose.  The old one 
+      compared zero-padded strings with CompareTo(), so it ignored the '-' in
+      negative numbers ('-1' came after '0'), didn't see fractions like '½'
+      or '.5' as numbers at all, put '12.5' before '12a' (punctuation sorts 
+      before letters) and only knew the letter suffixes a-h ('9i' came after
+      '10').  The new key orders all of these by their numeric values.
+      '''
+      expected = [ "", "-2", "-1.5", "-1", "0", "½", "1", "1½", "9", "9i", 
+         "10", "12", "12a", "12.5", "13", "Annual" ]
+      unsorted = list(expected)
+      random.Random(1234).shuffle(unsorted)
+      self.assertEquals(expected, 
+         sorted(unsorted, key=lambda x: issue_sort_key("a", x)))
+      self.assertEquals(issue_sort_key("a", ".5"), issue_sort_key("a", "½"))
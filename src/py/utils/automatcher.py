@@ -150,6 +150,8 @@ def __get_remote_hash(ref):
    '''  
    hash = None # matches nothing
    try:
+      # hash the original image, NOT the scaled down display copy, since our 
+      # similarity thresholds were tuned on hashes of the original images
       image = db.query_image(ref) if ref else None
       if image:
          image = utils.strip_back_cover(image)
@@ -67,6 +67,9 @@ class Configuration(object):
    __DEFAULT_FORCE_SERIES_ART = False
    __DEFAULT_NOTE_SCRAPE_DATE = False
    __DEFAULT_SCRAPE_DELAY = 1
+   __DEFAULT_PREFETCH_RADIUS = 3
+   __DEFAULT_OFFLINE_MODE = False
+   __DEFAULT_AUTO_OFFLINE = True
 
   
    #=========================================================================== 
@@ -134,6 +137,9 @@ class Configuration(object):
       self.__force_series_art_b = None # series dialog always shows series art?
       self.__note_scrape_date_b = None # put date when scraping the Notes field?
       self.__scrape_delay_n = None # num of seconds to wait between each scrape
+      self.__prefetch_radius_n = None # num of rows around selection to prefetch
+      self.__offline_mode_b = None # scrape from local caches only?
+      self.__auto_offline_b = None # go offline when database can't be reached?
       self.__set_advanced_settings_s("")
       
       return self
@@ -166,6 +172,9 @@ class Configuration(object):
       self.__force_series_art_b = c.__DEFAULT_FORCE_SERIES_ART
       self.__note_scrape_date_b = c.__DEFAULT_NOTE_SCRAPE_DATE
       self.__scrape_delay_n = c.__DEFAULT_SCRAPE_DELAY
+      self.__prefetch_radius_n = c.__DEFAULT_PREFETCH_RADIUS
+      self.__offline_mode_b = c.__DEFAULT_OFFLINE_MODE
+      self.__auto_offline_b = c.__DEFAULT_AUTO_OFFLINE
       
       # 2. scan through the string looking at each line for advanced settings
       lines_s = [ x.strip() for x in self.__advanced_settings_s.split("\n") \
@@ -264,6 +273,22 @@ class Configuration(object):
          if match and utils.is_number(match.group(1)):
             self.__scrape_delay_n = \
                min(3600, max(2, int(float(match.group(1)))))
+               
+         # 2p. parse the "PREFETCH_RADIUS=XXXX" line
+         match = re.match(pattern_s.format("PREFETCH_RADIUS"), line_s)
+         if match and utils.is_number(match.group(1)):
+            self.__prefetch_radius_n = \
+               min(20, max(0, int(float(match.group(1)))))
+               
+         # 2q. parse the "OFFLINE_MODE=XXXX" line
+         match = re.match(pattern_s.format("OFFLINE_MODE"), line_s)
+         if match:
+            self.__offline_mode_b = match.group(1).strip().lower()=="true"
+            
+         # 2r. parse the "AUTO_OFFLINE=XXXX" line
+         match = re.match(pattern_s.format("AUTO_OFFLINE"), line_s)
+         if match:
+            self.__auto_offline_b = match.group(1).strip().lower()=="true"
 
    advanced_settings_s = property( lambda self : self.__advanced_settings_s, 
       __set_advanced_settings_s, __set_advanced_settings_s,
@@ -329,6 +354,18 @@ class Configuration(object):
       lambda self : self.__scrape_delay_n, None, None,
       "How long to wait (in seconds) between each scrape.  Not None.")
    
+   prefetch_radius_n = property( 
+      lambda self : self.__prefetch_radius_n, None, None,
+      "How many rows around the selected one to prefetch covers for. Not None.")
+   
+   offline_mode_b = property( 
+      lambda self : self.__offline_mode_b, None, None,
+      "Whether to scrape from local caches only, without going online.")
+   
+   auto_offline_b = property( 
+      lambda self : self.__auto_offline_b, None, None,
+      "Whether to work offline if the database can't be reached.  Not None.")
+   
    
    #===========================================================================
    def load_defaults(self):
@@ -643,6 +680,16 @@ class Configuration(object):
       if self.scrape_delay_n != c.__DEFAULT_SCRAPE_DELAY:
          lines_sl.append("Using scrape delay of {0} seconds.\n"\
             .format(self.scrape_delay_n))
+         
+      if self.prefetch_radius_n != c.__DEFAULT_PREFETCH_RADIUS:
+         lines_sl.append("Prefetch covers for {0} rows around the selection.\n"\
+            .format(self.prefetch_radius_n))
+         
+      if self.offline_mode_b != c.__DEFAULT_OFFLINE_MODE:
+         lines_sl.append("Work offline, using only locally cached data.\n")
+         
+      if self.auto_offline_b != c.__DEFAULT_AUTO_OFFLINE:
+         lines_sl.append("Don't work offline if the database is down.\n")
        
       for publisher_s in self.ignored_publishers_sl:
          lines_sl.append("Ignore all series published by '{0}'\n"\
@@ -0,0 +1,202 @@
+'''
+This module is the shared HTTP client that all of our downloads (database
+queries and cover images) go through.  It keeps persistent (keep-alive)
+connections to each server and reuses them, accepts gzip/deflate compressed
+responses, limits the number of connections to each server, and times out
+requests that take too long.  It can also make conditional requests, which 
+only download a response if it has changed since the last time it was 
+downloaded.  Every request is timed (see log.span).
+
+@author: Cory Banack
+'''
+
+import clr
+import log
+from resources import Resources
+from utils import sstr
+
+clr.AddReference('System')
+from System import DateTime
+from System.Globalization import CultureInfo, DateTimeStyles
+from System.IO import MemoryStream, StreamReader
+from System.Net import DecompressionMethods, HttpStatusCode, WebException, \
+   WebRequest
+from System.Text import Encoding
+
+# the default maximum number of connections open to any one server
+__CONNECTION_LIMIT = 4
+
+# the default number of milliseconds to wait for a server to respond
+__TIMEOUT_MS = 30000
+
+# the default number of milliseconds to wait while reading a response
+__READ_TIMEOUT_MS = 60000
+
+# how long (in milliseconds) an idle connection stays open for reuse
+__MAX_IDLE_MS = 60000
+
+# the current settings (see configure)
+__connection_limit_n = __CONNECTION_LIMIT
+__timeout_ms = __TIMEOUT_MS
+__read_timeout_ms = __READ_TIMEOUT_MS
+
+
+# =============================================================================
+def configure(connection_limit_n=None, timeout_ms=None, read_timeout_ms=None):
+   '''
+   Changes the settings for all future requests.  Any setting that is None
+   goes back to its default value.
+
+   'connection_limit_n' -> the maximum number of connections to each server
+      (i.e. the size of each server's connection pool.)
+   'timeout_ms' -> how long to wait for a server to start responding.
+   'read_timeout_ms' -> how long to wait while reading a server's response.
+   '''
+   global __connection_limit_n, __timeout_ms, __read_timeout_ms
+   __connection_limit_n = __CONNECTION_LIMIT if connection_limit_n is None \
+      else max(1, int(connection_limit_n))
+   __timeout_ms = __TIMEOUT_MS if timeout_ms is None \
+      else max(1000, int(timeout_ms))
+   __read_timeout_ms = __READ_TIMEOUT_MS if read_timeout_ms is None \
+      else max(1000, int(read_timeout_ms))
+   if connection_limit_n is not None or timeout_ms is not None or \
+         read_timeout_ms is not None:
+      log.debug("http client: ", __connection_limit_n, " connections/server, ",
+         __timeout_ms, " ms timeout, ", __read_timeout_ms, " ms read timeout")
+
+
+# =============================================================================
+def get_string(url_s):
+   '''
+   Downloads the contents of the given URL, and returns them as a (UTF-8
+   decoded) string.
+
+   This method will throw an WebException or IOException if anything goes
+   wrong, including if the response code is not valid (i.e. 200).
+   '''
+   return __get(url_s, __read_string)
+
+
+# =============================================================================
+def get_string_if_modified(url_s, etag_s, modified_s):
+   '''
+   Like get_string, but if an ETag or Last-Modified value (strings, from an
+   earlier response for the same URL) are given, this makes a conditional 
+   request, so the server only sends the contents of the given URL if they
+   have changed since then.
+
+   Returns a tuple containing the downloaded string (or None if the server 
+   says that the contents haven't changed), and the ETag and Last-Modified 
+   values for the contents (the given ones if they haven't changed; either
+   may be None.)
+   '''
+   def read(response):
+      return ( __read_string(response), response.Headers["ETag"], 
+         response.Headers["Last-Modified"] )
+   result = __get(url_s, read, etag_s, modified_s)
+   return result if result else (None, etag_s, modified_s)
+
+
+# =============================================================================
+def get_bytes(url_s):
+   '''
+   Downloads the contents of the given URL (i.e. an image file), and returns
+   them as a .NET byte array.
+
+   This method will throw an WebException or IOException if anything goes
+   wrong, including if the response code is not valid (i.e. 200).
+   '''
+   def read(response):
+      stream = response.GetResponseStream()
+      try:
+         with MemoryStream() as memory_stream:
+            stream.CopyTo(memory_stream)
+            return memory_stream.ToArray()
+      finally:
+         stream.Close()
+   return __get(url_s, read)
+
+
+# =============================================================================
+def __read_string(response):
+   ''' Reads the given response's entire (UTF-8) stream into a string. '''
+   stream = response.GetResponseStream()
+   try:
+      with StreamReader(stream, Encoding.UTF8) as reader:
+         return reader.ReadToEnd()
+   finally:
+      stream.Close()
+
+
+# =============================================================================
+def __get(url_s, read, etag_s=None, modified_s=None):
+   '''
+   Makes a GET request for the given URL, and returns the result of passing
+   the response to the given 'read' function.  The response is always read
+   completely and closed, so that its connection can be reused.
+   
+   If an ETag or Last-Modified value is given, the request is conditional, 
+   and this method returns None if the server says that the response hasn't
+   changed (i.e. status code 304.)
+   '''
+   request = WebRequest.Create(url_s)
+   request.UserAgent = "[ComicVineScraper, version " + \
+      Resources.SCRIPT_VERSION + "]"
+   request.KeepAlive = True
+   request.AutomaticDecompression = \
+      DecompressionMethods.GZip | DecompressionMethods.Deflate
+   request.Timeout = __timeout_ms
+   request.ReadWriteTimeout = __read_timeout_ms
+   request.ServicePoint.ConnectionLimit = __connection_limit_n
+   request.ServicePoint.MaxIdleTime = __MAX_IDLE_MS
+   if etag_s:
+      request.Headers.Add("If-None-Match", etag_s)
+   if modified_s:
+      modified = __parse_http_date(modified_s)
+      if modified: request.IfModifiedSince = modified
+
+   log.count("http.requests")
+   response = None
+   try:
+      with log.span("http.response", host=request.RequestUri.Host):
+         try:
+            response = request.GetResponse()
+         except WebException, wex:
+            # .NET reports a "not modified" response as an error
+            if not __is_not_modified(wex.Response): raise
+            wex.Response.Close()
+            log.count("http.not_modified")
+            return None
+      if __is_not_modified(response):
+         log.count("http.not_modified")
+         return None
+      # if the response code is not "OK", throw a web exception immediately.
+      # this stops red-herring errors later on as we try to parse bad results.
+      # usually this only happens if the server is temporarily down.
+      if response.StatusCode != HttpStatusCode.OK:
+         raise WebException("server response code " +
+            sstr(int(response.StatusCode))+" ("+sstr(response.StatusCode)+")" )
+      with log.span("http.read", host=request.RequestUri.Host):
+         return read(response)
+   finally:
+      if response: response.Close()
+
+
+# =============================================================================
+def __is_not_modified(response):
+   ''' Returns True iff the given response (may be None) has status 304. '''
+   return response is not None and \
+      getattr(response, "StatusCode", None) == HttpStatusCode.NotModified
+
+
+# =============================================================================
+def __parse_http_date(date_s):
+   '''
+   Converts the given HTTP date string (i.e. a Last-Modified header) into a
+   DateTime, or returns None if it can't be parsed.
+   '''
+   try:
+      return DateTime.Parse(date_s, CultureInfo.InvariantCulture,
+         DateTimeStyles.AdjustToUniversal | DateTimeStyles.AssumeUniversal)
+   except:
+      return None
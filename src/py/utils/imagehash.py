@@ -26,7 +26,8 @@ def hash(image):
    
    The given images are not modified in any way, nor are they Disposed.
    '''
-   return __perceptual_hash(image)       
+   with log.span("imagehash.hash"):
+      return __perceptual_hash(image)       
          
          
 #==============================================================================
@@ -7,6 +7,10 @@ Once installed, this module also logs all text that is written to stderr or
 stdout (by this module, or any other mechanism).  This text can be written out 
 to a file in its entirety at any time by the save() method.
 
+Logging is cheap for the calling thread: the most recent lines are kept in a 
+fixed-size buffer in memory, and a background thread writes them out to stdout
+and to a rotating log file.
+
 USAGE
 
 To make the methods in this class usable, call install().  Use a 
@@ -23,20 +27,24 @@ module while either of those two methods are running.
 @author: Cory Banack
 """
 
+import random
 import sys, clr
 import utils
 import i18n
+from collections import deque
 from dberrors import DatabaseConnectionError
 
 clr.AddReference('System')
-from System.Threading import Mutex
+from System.Diagnostics import Stopwatch
+from System.Threading import Monitor, Thread, ThreadStart
 from System import DateTime
 
 clr.AddReference('System.Windows.Forms')
 from System.Windows.Forms import DialogResult, MessageBox, \
     MessageBoxButtons, MessageBoxIcon, SaveFileDialog
     
-from System.IO import FileInfo, StreamWriter
+from System.IO import Directory, File, FileAccess, FileInfo, FileMode, \
+   FileShare, FileStream, Path, StreamWriter
 from System.Text import UTF8Encoding 
 
 # a module global variable; an instance of the Logger class that will only be
@@ -48,22 +56,25 @@ __logger = None
 __app_window = None
 
 #==============================================================================
-def install(app_window=None):
+def install(app_window=None, log_dir_s=None):
    """
    Installs this module. This must be called before any other method in 
    this module is called.  You must take steps to GUARANTEE that this module's
    uninstall() method is called once you have called this method.
    
-   Takes a single parameter, which is the Form/Window object that all error 
+   The 'app_window' parameter is the Form/Window object that all error 
    dialogs should be attached to.  This parameter may be None, but if it is the
    'handle_error' method will not show any visible dialogs.
+   
+   The 'log_dir_s' parameter is the directory that the (rotating) log file 
+   gets written to.  If it is None, there is no log file.
    """
 
    global __logger, __app_window
    if __logger is not None or __app_window is not None:
       raise Exception("don't install '" + __name__+ "' module twice!")
    __app_window = app_window
-   __logger = __Logger() 
+   __logger = __Logger(log_dir_s) 
 
 
 
@@ -152,7 +163,7 @@ def handle_error(error):
    
    if __app_window:     
       handled = False
-      if type(error) == DatabaseConnectionError:  
+      if isinstance(error, DatabaseConnectionError):  
          # if this is a DatabaseConnectionError, then it is a semi-expected 
          # error that may get a special error message
          if error.get_error_code_s() == "100": # coryhigh: i18n
@@ -185,6 +196,88 @@ def handle_error(error):
 
 
 
+#==============================================================================
+def span(name_s, **attributes):
+   """
+   Returns a new timing span, which is meant to be used in a 'with' statement:
+   
+        with log.span("cv.download", url=url_s):
+           ...
+           
+   The time spent inside the 'with' block is recorded under the given name, 
+   for the performance report (see report_spans()).  The optional keyword 
+   attributes describe this particular span; they are reported if it turns 
+   out to be the slowest span with its name.
+   
+   Spans are cheap, threadsafe, and work whether or not this module has been
+   installed.
+   """
+   return __Span(__span_stats, name_s, attributes)
+
+
+
+#==============================================================================
+def count(name_s, n=1):
+   """
+   Adds 'n' to the named counter for the performance report (see 
+   report_spans()), i.e. count("imagecache.hit").  Counters are reset along 
+   with the timing spans.  Like spans, counters are cheap and threadsafe.
+   """
+   __span_stats.count(name_s, n)
+   
+   
+   
+#==============================================================================
+def observe(name_s, value):
+   """
+   Records a value in the named distribution for the performance report (see
+   report_spans()), i.e. observe("cv.throttle.queue", waiting_n).  Unlike a 
+   counter, the report shows the count, percentiles, and maximum of all the 
+   values recorded for each name.  Distributions are reset along with the 
+   timing spans.  Like spans, they are cheap and threadsafe.
+   """
+   __span_stats.observe(name_s, value)
+   
+   
+   
+#==============================================================================
+def reset_spans():
+   """ 
+   Forgets all recorded timing spans, counters and distributions, i.e. at the
+   start of a scrape. 
+   """
+   __span_stats.reset()
+   
+   
+   
+#==============================================================================
+def report_spans():
+   """
+   Writes a performance report to the debug log, with the count, total time,
+   and percentiles for each named timing span that was recorded since the
+   last call to reset_spans().
+   """
+   for line in __span_stats.report_lines():
+      debug(line)
+
+
+
+#==============================================================================
+def get_performance_data():
+   """
+   Returns the data behind the performance report (see report_spans()) as a
+   dict, for tools that want to analyze it:
+   
+      { "wall_ms" : time since the last reset_spans(),
+        "spans" : { name : { "count", "total_ms", "p50_ms", "p90_ms", 
+                             "max_ms" } },
+        "counters" : { name : count },
+        "values" : { name : { "count", "p50", "p90", "max" } } }
+   """
+   return __span_stats.get_data()
+
+
+
 #==============================================================================
 def save(show_error_message=False):
    """
@@ -229,21 +322,67 @@ def save(show_error_message=False):
 class __Logger(object):
    """ A hidden class that implements the public api of this module. """ 
 
+   # the maximum number of recent lines of output kept in memory
+   __BUFFER_LINES = 20000
+   
+   # the name of the log file, the size (in bytes) it can grow to before it 
+   # gets rotated, and how many log files (including rotated ones) to keep
+   __LOG_FILE_NAME = "cvs-debug.log"
+   __LOG_FILE_BYTES = 5 * 1024 * 1024
+   __LOG_FILE_COUNT = 3
 
    #==========================================================================
-   def __init__(self):
+   def __init__(self, log_dir_s):
       """ 
       Initializes this class.  Only one may be initialized at a time!
+      If 'log_dir_s' isn't None, the log is also written to a file there.
       """ 
    
       if ( sys.stdout != sys.__stdout__ or sys.stderr != sys.__stderr__):
          raise "do not instantiate two instances of this class!!"
       
-      # the log of all debugged output that this class creates
-      self._loglines = []
+      # the most recent lines of debugged output that this class has created.
+      # older lines fall off the front of this buffer once it is full.
+      self._loglines = deque(maxlen=self.__BUFFER_LINES)
+      
+      # the total number of lines that have ever been added to the buffer
+      self._lines_n = 0
+      
+      # the lines that haven't been written out to stdout (and the log file)
+      # yet.  the writer thread takes these in batches.
+      self._pending = []
+      
+      # a lock that protects all access to the two lists above
+      self._lock = object()
       
-      # a mutex that protects all access to the logLines (above)
-      self._mutex = Mutex()
+      # a lock that is held whenever the log file is being written to
+      self._file_lock = object()
+      
+      # the current log file, and a StreamWriter for it (None if there is no
+      # log file, or if we couldn't write to it)
+      self._file_s = None
+      self._writer = None
+      
+      # the number of times the log file has been rotated since we started
+      self._rotations_n = 0
+      
+      # true once the writer thread has been asked to stop
+      self._stopped_b = False
+      
+      if log_dir_s:
+         try:
+            if not Directory.Exists(log_dir_s):
+               Directory.CreateDirectory(log_dir_s)
+            self._file_s = Path.Combine(log_dir_s, self.__LOG_FILE_NAME)
+            self.__rotate() # start a fresh log file
+         except:
+            self._file_s = None
+            self._writer = None
+            
+      # the background thread that writes pending lines out
+      self._writer_thread = Thread(ThreadStart(self.__writer_loop))
+      self._writer_thread.IsBackground = True
+      self._writer_thread.Start()
       
       # co-op stdout and stderr so we can intercept everything going to them
       sys.stdout = self 
@@ -256,21 +395,32 @@ class __Logger(object):
    def free(self):
       """ Frees up all resources owned or co-opted by this class """
       
-      # protect access to the logLines by using the mutex.
-      self._mutex.WaitOne(-1)
+      # return stdout and stderr to their original state
+      sys.stdout = sys.__stdout__
+      sys.stderr = sys.__stderr__
+      
+      # let the writer thread write out anything that's still pending
+      Monitor.Enter(self._lock)
       try:
-         self._loglines = None
-         self.__app_window = None
+         self._stopped_b = True
+         Monitor.PulseAll(self._lock)
+      finally:
+         Monitor.Exit(self._lock)
+      self._writer_thread.Join()
       
-         # return stdout and stderr to their original state
-         sys.stdout = sys.__stdout__
-         sys.stderr = sys.__stderr__
+      Monitor.Enter(self._file_lock)
+      try:
+         if self._writer:
+            self._writer.Dispose()
+            self._writer = None
       finally:
-         self._mutex.ReleaseMutex()
+         Monitor.Exit(self._file_lock)
          
-      # not perfectly threadsafe, but close enough since this method is only
-      # really called when the app is completely finished running anyhow
-      self._mutex.Dispose() 
+      Monitor.Enter(self._lock)
+      try:
+         self._loglines = None
+      finally:
+         Monitor.Exit(self._lock)
       
 
     
@@ -309,24 +459,125 @@ class __Logger(object):
    
    #==========================================================================
    def __debug_raw(self, message=''):
-      """ Records the given message, and writes it out to the 'real' stdout. """
+      """ 
+      Records the given message, and queues it up to be written out to the 
+      'real' stdout (and the log file) by the writer thread.
+      """
          
-      # protect access to the logLines with a mutex (for multiple threads)
-      self._mutex.WaitOne(-1)
+      try:
+         output_line = utils.sstr(message)
+      except:
+         # shouldn't happen!
+         output_line = "***** LOGGING ERROR *****"
+         
+      # protect access to the loglines with a lock (for multiple threads)
+      Monitor.Enter(self._lock)
       try:
          if self._loglines == None:
             raise Exception("you must install the __Logger before using it")
+         self._loglines.append( output_line )
+         self._lines_n += 1
+         self._pending.append( output_line )
+         if len(self._pending) == 1:
+            Monitor.Pulse(self._lock) # wake up the writer thread
+      finally:
+         Monitor.Exit(self._lock)
+
+
+
+   #==========================================================================
+   def __writer_loop(self):
+      """ 
+      The main loop for the writer thread, which writes out pending lines 
+      (in batches) whenever there are any, until this class is freed.
+      """
+      
+      while True:
+         Monitor.Enter(self._lock)
+         try:
+            while not self._pending and not self._stopped_b:
+               Monitor.Wait(self._lock)
+            if not self._pending:
+               return # we've been stopped, and everything has been written
+         finally:
+            Monitor.Exit(self._lock)
+         self.__write_pending()
+         
          
+
+   #==========================================================================
+   def __write_pending(self):
+      """ 
+      Writes all pending lines out to the 'real' stdout and to the log file, 
+      rotating the log file if it has grown too big.
+      """
+      
+      Monitor.Enter(self._file_lock)
+      try:
+         Monitor.Enter(self._lock)
          try:
-            output_line = utils.sstr(message)
+            text = ''.join(self._pending)
+            self._pending = []
+         finally:
+            Monitor.Exit(self._lock)
+            
+         try:
+            sys.__stdout__.write(text)
          except:
-            # shouldn't happen!
-            output_line = "***** LOGGING ERROR *****"
-             
-         self._loglines.append( output_line )
-         sys.__stdout__.write(output_line)
+            pass # nothing we can do about it, and the log file may be fine
+         
+         if self._writer:
+            try:
+               self._writer.Write(text)
+               self._writer.Flush()
+               if self._writer.BaseStream.Length > self.__LOG_FILE_BYTES:
+                  self.__rotate()
+                  self._rotations_n += 1
+            except:
+               # give up on the log file; we've still got the ring buffer
+               try: self._writer.Dispose()
+               except: pass
+               self._writer = None
       finally:
-         self._mutex.ReleaseMutex()
+         Monitor.Exit(self._file_lock)
+         
+
+
+   #==========================================================================
+   def __rotate(self):
+      """ 
+      Closes the current log file (if it is open), renames it and the older 
+      log files (deleting the oldest one), and opens a fresh log file.  Caller 
+      must hold the file lock.
+      """
+      
+      if self._writer:
+         self._writer.Dispose()
+         self._writer = None
+         
+      for i in range(self.__LOG_FILE_COUNT - 1, 0, -1):
+         old_file_s = self.__file_name_s(i - 1)
+         new_file_s = self.__file_name_s(i)
+         if File.Exists(old_file_s):
+            if File.Exists(new_file_s):
+               File.Delete(new_file_s)
+            File.Move(old_file_s, new_file_s)
+      
+      # let other processes (and our 'save' method) read the file while it's
+      # open.  UTF8Encoding() doesn't write a byte order mark.
+      stream = FileStream(self._file_s, FileMode.Create, FileAccess.Write, 
+         FileShare.ReadWrite)
+      self._writer = StreamWriter(stream, UTF8Encoding())
+
+
+
+   #==========================================================================
+   def __file_name_s(self, i):
+      """ 
+      Returns the name of the log file that has been rotated 'i' times 
+      (0 for the current log file.) 
+      """
+      return self._file_s if i == 0 else self._file_s + "." + str(i)
 
 
 
@@ -364,20 +615,53 @@ class __Logger(object):
    
    #==========================================================================
    def save(self, filename):
-      """ Implements the module-level save() method by writing the 
-          debug log information to the given file. """
+      """ 
+      Implements the module-level save() method by writing the debug log 
+      information to the given file.  If we've got a log file, the log is 
+      copied out of that (and any files that it was rotated into since we
+      started), otherwise it is whatever is still in the ring buffer.
+      """
       
-      # protect access to the logLines with a mutex (for multiple threads)
-      self._mutex.WaitOne(-1)
+      # make sure everything has been written out, and then stop the writer
+      # thread from touching the log file until we're done with it.
+      self.__write_pending()
+      Monitor.Enter(self._file_lock)
+      try:
+         if self._writer:
+            out = FileStream(filename, FileMode.Create, FileAccess.Write)
+            try:
+               for i in range(min(self._rotations_n, 
+                     self.__LOG_FILE_COUNT - 1), -1, -1):
+                  file_s = self.__file_name_s(i)
+                  if File.Exists(file_s):
+                     stream = FileStream(file_s, FileMode.Open, 
+                        FileAccess.Read, FileShare.ReadWrite)
+                     try:
+                        stream.CopyTo(out)
+                     finally:
+                        stream.Dispose()
+            finally:
+               out.Dispose()
+            return
+      finally:
+         Monitor.Exit(self._file_lock)
+         
+      # no log file, so fall back on the ring buffer
+      Monitor.Enter(self._lock)
       try:
          if self._loglines == None:
             raise Exception("you must install the __Logger before using it")
          loglines_copy = list(self._loglines)
+         dropped_n = self._lines_n - len(loglines_copy)
       finally:
-         self._mutex.ReleaseMutex()
+         Monitor.Exit(self._lock)
          
+      writer = None
       try:
          writer = StreamWriter(filename, False, UTF8Encoding())
+         if dropped_n > 0:
+            writer.Write("(... " + str(dropped_n) + " older lines of this " +
+               "log are no longer available ...)\n")
          for line in loglines_copy:
             writer.Write(line)
       finally:
@@ -393,3 +677,231 @@ class __Logger(object):
       """
       
       self.__debug_raw(obj)
+
+      
+      
+#==============================================================================
+class __SpanStats(object):
+   """ A hidden class that records timing spans and reports on them. """
+   
+   #==========================================================================
+   def __init__(self):
+      """ Initializes this class, with no recorded spans. """
+      
+      # a lock that protects all of the members below
+      self._lock = object()
+      
+      # maps each span name to a _Reservoir of its durations (in ms)
+      self._times = {}
+      
+      # maps each span name to a (duration, attributes) tuple for the slowest
+      # span with that name
+      self._slowest = {}
+      
+      # maps each counter name to its current count
+      self._counters = {}
+      
+      # maps each distribution name to a _Reservoir of its recorded values
+      self._values = {}
+      
+      # the Stopwatch timestamp when we started recording
+      self._start_ticks = Stopwatch.GetTimestamp()
+      
+      
+   #==========================================================================
+   def reset(self):
+      """ Implements the module-level reset_spans() method. """
+      Monitor.Enter(self._lock)
+      try:
+         self._times = {}
+         self._slowest = {}
+         self._counters = {}
+         self._values = {}
+         self._start_ticks = Stopwatch.GetTimestamp()
+      finally:
+         Monitor.Exit(self._lock)
+         
+         
+   #==========================================================================
+   def count(self, name_s, n):
+      """ Implements the module-level count() method. """
+      Monitor.Enter(self._lock)
+      try:
+         self._counters[name_s] = self._counters.get(name_s, 0) + n
+      finally:
+         Monitor.Exit(self._lock)
+         
+         
+   #==========================================================================
+   def observe(self, name_s, value):
+      """ Implements the module-level observe() method. """
+      Monitor.Enter(self._lock)
+      try:
+         reservoir = self._values.get(name_s)
+         if not reservoir:
+            reservoir = self._values[name_s] = _Reservoir()
+         reservoir.add(value)
+      finally:
+         Monitor.Exit(self._lock)
+         
+         
+   #==========================================================================
+   def record(self, name_s, ms, attributes):
+      """ Records a finished span with the given name, duration (ms), etc. """
+      Monitor.Enter(self._lock)
+      try:
+         reservoir = self._times.get(name_s)
+         if not reservoir:
+            reservoir = self._times[name_s] = _Reservoir()
+         reservoir.add(ms)
+         if ms > self._slowest.get(name_s, (-1, None))[0]:
+            self._slowest[name_s] = (ms, attributes)
+      finally:
+         Monitor.Exit(self._lock)
+   
+   
+   #==========================================================================
+   def __snapshot(self):
+      """ 
+      Returns copies of our times, slowest spans, counters, samples, and wall
+      ms.  The times and samples map each name to a _Reservoir.summary() 
+      tuple for its durations or values. 
+      """
+      Monitor.Enter(self._lock)
+      try:
+         times = dict( (k, v.summary()) for k, v in self._times.items() )
+         slowest = dict(self._slowest)
+         counters = dict(self._counters)
+         samples = dict( (k, v.summary()) for k, v in self._values.items() )
+         wall_ms = (Stopwatch.GetTimestamp() - self._start_ticks) \
+            * 1000.0 / Stopwatch.Frequency
+         return times, slowest, counters, samples, wall_ms
+      finally:
+         Monitor.Exit(self._lock)
+         
+         
+   #==========================================================================
+   def get_data(self):
+      """ Implements the module-level get_performance_data() method. """
+      times, slowest, counters, samples, wall_ms = self.__snapshot()
+      spans = {}
+      for name_s, (count_n, total_ms, p50, p90, max_ms) in times.items():
+         spans[name_s] = { "count" : count_n, "total_ms" : total_ms,
+            "p50_ms" : p50, "p90_ms" : p90, "max_ms" : max_ms }
+      distributions = {}
+      for name_s, (count_n, total, p50, p90, largest) in samples.items():
+         distributions[name_s] = { "count" : count_n, 
+            "p50" : p50, "p90" : p90, "max" : largest }
+      return { "wall_ms" : wall_ms, "spans" : spans, "counters" : counters,
+         "values" : distributions }
+      
+      
+   #==========================================================================
+   def report_lines(self):
+      """ Returns the lines of the report for report_spans(). """
+      times, slowest, counters, samples, wall_ms = self.__snapshot()
+         
+      lines = ["-------------------- PERFORMANCE REPORT -------------------",
+         "total time: {0:.1f} s (spans on different threads overlap)"\
+            .format(wall_ms / 1000.0),
+         "{0:<26}{1:>7}{2:>10}{3:>7}{4:>9}{5:>9}{6:>9}".format("span", 
+            "count", "total s", "%", "p50 ms", "p90 ms", "max ms")]
+      names = sorted(times.keys(), key=lambda k: -times[k][1])
+      for name_s in names:
+         count_n, total_ms, p50, p90, max_ms = times[name_s]
+         lines.append("{0:<26}{1:>7}{2:>10.1f}{3:>7.1f}{4:>9.0f}{5:>9.0f}"\
+            "{6:>9.0f}".format(name_s, count_n, total_ms / 1000.0, 
+            100.0 * total_ms / wall_ms if wall_ms > 0 else 0.0, 
+            p50, p90, max_ms))
+      for name_s in names:
+         ms, attributes = slowest[name_s]
+         if attributes:
+            lines.append("slowest {0}: {1:.0f} ms ({2})".format(name_s, ms,
+               ", ".join( [k + "=" + utils.sstr(v) 
+                  for k, v in sorted(attributes.items())] )))
+      if counters:
+         lines.append("counters: " + ", ".join( [k + "=" + utils.sstr(v) 
+            for k, v in sorted(counters.items())] ))
+      for name_s, summary in sorted(samples.items()):
+         count_n, total, p50, p90, largest = summary
+         lines.append("{0}: count={1}, p50={2:.0f}, p90={3:.0f}, max={4:.0f}"\
+            .format(name_s, count_n, p50, p90, largest))
+      lines.append("-"*59)
+      return lines
+         
+         
+         
+#==============================================================================
+class _Reservoir(object):
+   """
+   A hidden class that summarizes all of the numbers that are added to it 
+   (i.e. the durations of one kind of span) in a fixed amount of memory.  The
+   count, total and maximum are exact, but the percentiles are estimated from
+   a fixed-size, uniformly random sample of the numbers (reservoir sampling.)
+   This class is NOT threadsafe; __SpanStats' lock protects it.
+   """
+   
+   # the maximum number of numbers that each reservoir keeps for percentiles
+   SIZE = 1024
+   
+   #==========================================================================
+   def __init__(self):
+      """ Initializes this class, with no numbers in it. """
+      self.__count_n = 0
+      self.__total = 0
+      self.__max = None
+      self.__samples = []
+      
+   #==========================================================================
+   def add(self, value):
+      """ Adds the given number to this reservoir. """
+      self.__count_n += 1
+      self.__total += value
+      if self.__max is None or value > self.__max:
+         self.__max = value
+      if len(self.__samples) < _Reservoir.SIZE:
+         self.__samples.append(value)
+      else:
+         # keep each of the numbers so far with the same probability
+         i = random.randint(0, self.__count_n - 1)
+         if i < _Reservoir.SIZE:
+            self.__samples[i] = value
+            
+   #==========================================================================
+   def summary(self):
+      """ Returns a (count, total, p50, p90, max) tuple for this reservoir. """
+      samples = sorted(self.__samples)
+      percentile = lambda fraction : \
+         samples[int(round(fraction * (len(samples) - 1)))]
+      return (self.__count_n, self.__total, percentile(0.5), 
+         percentile(0.9), self.__max)
+         
+         
+         
+#==============================================================================
+class __Span(object):
+   """ A hidden class that implements the spans returned by span(). """
+   
+   #==========================================================================
+   def __init__(self, stats, name_s, attributes):
+      """ Initializes a span that will be recorded in the given __SpanStats. """
+      self._stats = stats
+      self._name_s = name_s
+      self._attributes = attributes
+      self._start_ticks = 0
+      
+   #==========================================================================
+   def __enter__(self):
+      self._start_ticks = Stopwatch.GetTimestamp()
+      return self
+   
+   #==========================================================================
+   def __exit__(self, type, value, traceback):
+      ms = (Stopwatch.GetTimestamp() - self._start_ticks) \
+         * 1000.0 / Stopwatch.Frequency
+      self._stats.record(self._name_s, ms, self._attributes)
+      return False # don't swallow exceptions
+   
+   
+# the one and only __SpanStats, which records all timing spans
+__span_stats = __SpanStats()
@@ -0,0 +1,57 @@
+'''
+This module contains the PendingQueue class, which keeps track of the books
+that couldn't be scraped because the database was offline.
+
+@author: Cory Banack
+'''
+from resources import Resources
+from time import strftime
+import utils
+
+#==============================================================================
+class PendingQueue(object):
+   '''
+   A persistent list of the books that couldn't be scraped while we were
+   working offline (see db.is_offline()), because the data for them wasn't
+   in the local caches.  The next scrape that is online scrapes these books
+   first, and removes them from this list as it does.  Books are identified
+   by their 'id_s' property.
+
+   Like the MatchScore class, this class reads its state out of a file on the
+   file system, and writes it back every time it changes.  Therefore, only ONE
+   instance of this class should ever be changed at a time.
+   '''
+
+   #===========================================================================
+   def __init__(self):
+      ''' Initializes a new PendingQueue with the books that were saved. '''
+      # maps each pending book's id to the date it was added to this queue
+      self.__pending_sm = utils.load_map(Resources.PENDING_FILE)
+
+
+   #===========================================================================
+   # the ids of all the books in this queue, oldest first.  not None.
+   book_ids_sl = property( lambda self : sorted(self.__pending_sm.keys(),
+      key=lambda id_s : utils.sstr(self.__pending_sm[id_s])) )
+
+
+   #===========================================================================
+   def add(self, book):
+      ''' Adds the given ComicBook to this queue, if it isn't already in it. '''
+      if book.id_s and not book.id_s in self.__pending_sm:
+         self.__pending_sm[book.id_s] = strftime(r'%Y.%m.%d')
+         self.__persist()
+
+
+   #===========================================================================
+   def remove(self, book):
+      ''' Removes the given ComicBook from this queue, if it is in it. '''
+      if book.id_s in self.__pending_sm:
+         del self.__pending_sm[book.id_s]
+         self.__persist()
+
+
+   #===========================================================================
+   def __persist(self):
+      ''' Writes the contents of this queue out to the file system. '''
+      utils.persist_map(self.__pending_sm, Resources.PENDING_FILE)
@@ -0,0 +1,140 @@
+'''
+This module contains the SingleFlight class, which makes concurrent calls
+for the same thing share a single call.
+
+@author: Cory Banack
+'''
+
+import clr
+import log
+import sys
+
+clr.AddReference('System')
+from System.Threading import Monitor, Thread
+
+#==============================================================================
+class SingleFlight(object):
+   '''
+   Coalesces concurrent calls that are made with the same key.  While a call
+   for a key is running on one thread, any other thread that makes a call for
+   the same key just waits for that call to finish, and then gets its result
+   (or its exception) instead of making the call again.
+
+   Only calls that overlap are ever shared; this class doesn't cache
+   anything, so a call that is made after the last one for its key has
+   finished always runs.  This class is thread-safe.
+   '''
+
+   #===========================================================================
+   def __init__(self, name_s):
+      '''
+      Initializes this SingleFlight.  Its name is used for its counters, i.e.
+      "<name>.shared" counts the calls that shared another call's result.
+      '''
+      self.__name_s = name_s
+
+      # maps the key of each running call to its _Call object
+      self.__calls = {}
+
+      # the number of threads that are waiting for another thread's call
+      self.__waiting_n = 0
+
+
+   #===========================================================================
+   # the number of threads waiting for another thread's call to finish
+   waiting_n = property( lambda self : self.__waiting_n )
+
+
+   #===========================================================================
+   def do(self, key, function):
+      '''
+      Calls the given function (which takes no arguments) and returns its
+      result, unless a call with the given key is already running, in which
+      case this method waits for that call and returns its result instead.
+      Either way, if the call throws an exception, so does this method.
+      '''
+      Monitor.Enter(self)
+      try:
+         call = self.__calls.get(key)
+         leader_b = call is None
+         # a nested call with the same key (on the same thread) just runs
+         nested_b = not leader_b and \
+            call.thread_id_n == Thread.CurrentThread.ManagedThreadId
+         if leader_b:
+            call = _Call()
+            self.__calls[key] = call
+         elif not nested_b:
+            self.__waiting_n += 1
+      finally:
+         Monitor.Exit(self)
+
+      if nested_b:
+         return function()
+      elif leader_b:
+         try:
+            call.result = function()
+            return call.result
+         except:
+            # record EVERY failure (not just Exceptions, i.e. a thread abort)
+            # so that the waiting threads never mistake it for a success
+            call.exc_info = sys.exc_info()
+            raise
+         finally:
+            Monitor.Enter(self)
+            try:
+               del self.__calls[key]
+            finally:
+               Monitor.Exit(self)
+            call.finish()
+      else:
+         log.count(self.__name_s + ".shared")
+         try:
+            call.wait()
+         finally:
+            Monitor.Enter(self)
+            try:
+               self.__waiting_n -= 1
+            finally:
+               Monitor.Exit(self)
+         if call.exc_info:
+            # re-raise the call's failure, with its original traceback
+            raise call.exc_info[0], call.exc_info[1], call.exc_info[2]
+         return call.result
+
+
+#==============================================================================
+class _Call(object):
+   '''
+   A call that is running in a SingleFlight.  Once it is finished, it has
+   the call's result, or the sys.exc_info() of whatever the call threw.
+   '''
+
+   #===========================================================================
+   def __init__(self):
+      ''' Initializes this _Call, which runs on the current thread. '''
+      self.thread_id_n = Thread.CurrentThread.ManagedThreadId
+      self.result = None
+      self.exc_info = None
+      self.__finished_b = False
+
+
+   #===========================================================================
+   def finish(self):
+      ''' Marks this call as finished, and wakes up the threads waiting on it.'''
+      Monitor.Enter(self)
+      try:
+         self.__finished_b = True
+         Monitor.PulseAll(self)
+      finally:
+         Monitor.Exit(self)
+
+
+   #===========================================================================
+   def wait(self):
+      ''' Blocks until this call is finished. '''
+      Monitor.Enter(self)
+      try:
+         while not self.__finished_b:
+            Monitor.Wait(self)
+      finally:
+         Monitor.Exit(self)
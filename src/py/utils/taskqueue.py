@@ -0,0 +1,240 @@
+'''
+This module is home to the TaskQueue and CancelToken classes, and to the
+shared (process-wide) TaskQueue that the rest of the script submits its
+background tasks to.
+
+@author: Cory Banack
+'''
+
+import clr
+import log
+from collections import deque
+
+clr.AddReference('System')
+from System.Threading import Monitor, Thread, ThreadStart
+
+# the priority classes for submitted tasks.  when a thread is free, it always
+# runs the oldest waiting task from the highest (i.e. lowest numbered) class.
+USER = 0        # something that the user is looking at, and waiting for
+PREFETCH = 1    # something the user will probably want to look at soon
+BACKGROUND = 2  # anything else
+
+# the number of threads that the shared TaskQueue runs tasks on
+__THREAD_COUNT = 2
+
+# the shared TaskQueue, or None if this module isn't initialized
+__queue = None
+
+
+# =============================================================================
+def initialize():
+   '''
+   Initializes this module's shared TaskQueue.  Call this method once at the
+   start of a scrape, and remember to call "shutdown()" when it is over.
+   '''
+   global __queue
+   __queue = TaskQueue(__THREAD_COUNT)
+
+
+# =============================================================================
+def shutdown():
+   '''
+   Undoes the "initialize()" method.  Tasks that haven't started yet will
+   never be run; tasks that are running right now are allowed to finish (but
+   this method doesn't wait for that.)
+   '''
+   global __queue
+   if __queue:
+      __queue.shutdown(False)
+      __queue = None
+
+
+# =============================================================================
+def submit(task, priority_n=USER, key=None):
+   '''
+   Submits the given task to the shared TaskQueue.  See TaskQueue.submit().
+   '''
+   if not __queue:
+      raise Exception(__name__ + " module isn't initialized!")
+   return __queue.submit(task, priority_n, key)
+
+
+# =============================================================================
+class CancelToken(object):
+   '''
+   Every task that is submitted to a TaskQueue gets a CancelToken.  Calling
+   'cancel' on that token guarantees that its task will never be started (if
+   it hasn't been already.)  A task that is already running can't be stopped,
+   but it can check the 'cancelled_b' property of its token to see if it
+   should give up early.  Once a task has finished running (or has been 
+   cancelled) the 'done_b' property of its token is True.
+   '''
+
+   # ==========================================================================
+   def __init__(self):
+      ''' Initializes this CancelToken (not cancelled). '''
+      self.__cancelled_b = False
+      self.__finished_b = False
+
+   # ==========================================================================
+   def cancel(self):
+      ''' Cancels the task that owns this token. '''
+      self.__cancelled_b = True
+
+   # ==========================================================================
+   cancelled_b = property( lambda self : self.__cancelled_b )
+
+   # ==========================================================================
+   def _finish(self):
+      ''' Called by the TaskQueue once the task that owns this token has run. '''
+      self.__finished_b = True
+
+   # ==========================================================================
+   done_b = property( lambda self : self.__cancelled_b or self.__finished_b )
+
+
+# =============================================================================
+class TaskQueue(object):
+   '''
+   A class that maintains a fixed number of its own threads, which are used
+   to invoke "tasks" (methods that take no arguments) in priority order.
+
+   Tasks can be submitted with a 'key'.  A newly submitted task supersedes
+   (cancels) any task with the same key that is still waiting to be run, so
+   if a lot of tasks with the same key are submitted in a short period of time,
+   only the last one is guaranteed to be run.  Tasks without a key are never
+   superseded, so they are always run (unless they are cancelled.)
+
+   Do not forget to call the 'shutdown' method on any instance of this class
+   once it will no longer be used, so that its threads can be disposed of.
+   '''
+
+   # ==========================================================================
+   def __init__(self, thread_count_n):
+      '''
+      Initializes this TaskQueue, which will run up to 'thread_count_n' tasks
+      at the same time.
+      '''
+
+      # one queue of waiting tasks for each priority class, highest first.
+      # each task is stored as a (task, CancelToken, key) tuple.  this is
+      # None once this TaskQueue has been shut down.
+      self.__waiting = [ deque() for i in range(BACKGROUND + 1) ]
+
+      # maps each key to the CancelToken of the waiting task with that key
+      self.__keyed_tokens = {}
+
+      # the threads that run our tasks
+      self.__threads = []
+      for i in range(max(1, thread_count_n)):
+         thread = Thread(ThreadStart(self.__thread_loop))
+         thread.IsBackground = True
+         thread.Start()
+         self.__threads.append(thread)
+
+
+   # ==========================================================================
+   def submit(self, task, priority_n=USER, key=None):
+      '''
+      Submits the given task (a method handle) to this TaskQueue, to be run
+      on one of its threads, after all the waiting tasks with the same or a
+      higher priority (USER, PREFETCH or BACKGROUND) have been started.
+
+      If a 'key' is given, the given task supersedes any waiting task that was
+      submitted with the same key, so that that task will never be run.
+
+      Returns the new task's CancelToken.  If this TaskQueue has been shut
+      down, the task will never be run (and its token is already cancelled.)
+      '''
+
+      if priority_n not in (USER, PREFETCH, BACKGROUND):
+         raise Exception("bad task priority: " + str(priority_n))
+      token = CancelToken()
+      Monitor.Enter(self)
+      try:
+         if self.__waiting is None:
+            token.cancel()
+         else:
+            if key is not None:
+               if key in self.__keyed_tokens:
+                  self.__keyed_tokens[key].cancel()
+               self.__keyed_tokens[key] = token
+            self.__waiting[priority_n].append( (task, token, key) )
+            Monitor.Pulse(self)
+      finally:
+         Monitor.Exit(self)
+      return token
+
+
+   # ==========================================================================
+   def shutdown(self, block):
+      '''
+      Shuts down this TaskQueue.  Tasks that are waiting to be run are
+      cancelled, and no tasks that are submitted later will be run, ever.
+      You MUST call this method in order to clean up this TaskQueue properly.
+
+      The 'block' boolean parameter indicates whether this method should block
+      until the TaskQueue's threads have finished running the tasks they are
+      running right now (true), or should return immediately (false).
+      '''
+
+      Monitor.Enter(self)
+      try:
+         if self.__waiting is not None:
+            for tasks in self.__waiting:
+               for task, token, key in tasks:
+                  token.cancel()
+            self.__waiting = None
+            self.__keyed_tokens = None
+         Monitor.PulseAll(self)
+      finally:
+         Monitor.Exit(self)
+      if block:
+         for thread in self.__threads:
+            thread.Join()
+
+
+   # ==========================================================================
+   def __next_task(self):
+      '''
+      Blocks until there is a (non-cancelled) task waiting to be run, and then
+      removes that task from the queue and returns it (and its CancelToken) 
+      as a tuple.  Returns None if this TaskQueue has been shut down.
+      '''
+      Monitor.Enter(self)
+      try:
+         while self.__waiting is not None:
+            for tasks in self.__waiting:
+               while tasks:
+                  task, token, key = tasks.popleft()
+                  if key is not None and \
+                        self.__keyed_tokens.get(key) is token:
+                     del self.__keyed_tokens[key]
+                  if not token.cancelled_b:
+                     return task, token
+            Monitor.Wait(self)
+         return None
+      finally:
+         Monitor.Exit(self)
+
+
+   # ==========================================================================
+   def __thread_loop(self):
+      '''
+      The main loop for each of our threads, which runs tasks that are
+      submitted via the 'submit' method, until this TaskQueue is shut down.
+      '''
+
+      next_task = self.__next_task()
+      while next_task:
+         task, token = next_task
+         try:
+            task()
+         except Exception as ex:
+            # slightly odd error handling, cause this thread should NEVER
+            # die as the result of an exception!
+            try: log.handle_error(ex)
+            except: pass
+         finally:
+            token._finish()
+         next_task = self.__next_task()
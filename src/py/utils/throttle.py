@@ -0,0 +1,107 @@
+'''
+This module contains the Throttle class, which paces calls from any number of
+threads so that they happen a fixed amount of time apart.
+
+@author: Cory Banack
+'''
+
+import clr
+import log
+
+clr.AddReference('System')
+from System.Diagnostics import Stopwatch
+from System.Threading import Monitor, Thread, ThreadStart
+
+#==============================================================================
+class Throttle(object):
+   '''
+   Paces calls (i.e. requests to a web server) so that no two of them happen
+   less than a fixed delay apart, no matter which threads they come from.
+
+   Each call to wait() reserves the next free time slot and then sleeps until
+   that slot comes, so waiting threads are served fairly, in the order that
+   they arrived, and no lock is held while they sleep.  Time is measured with
+   a monotonic clock (Stopwatch), so changes to the system clock don't affect
+   the pacing.  This class is thread-safe.
+
+   For tuning, each wait() records how many threads were already waiting
+   (in the "<name>.queue" distribution) and how long it had to wait (in the
+   "<name>.wait_ms" distribution) for the performance report; see
+   log.observe().
+   '''
+
+   #===========================================================================
+   def __init__(self, name_s, delay_ms):
+      '''
+      Initializes this Throttle, which keeps calls at least 'delay_ms'
+      milliseconds apart.  Its name is used for its distributions (see above.)
+      '''
+      self.__name_s = name_s
+      self.__delay_ms = max(0, delay_ms)
+
+      # the (monotonic) time in ms of the next free time slot
+      self.__next_slot_ms = 0
+
+      # the number of threads that are waiting for their time slot right now
+      self.__waiting_n = 0
+
+
+   #===========================================================================
+   def __set_delay_ms(self, delay_ms):
+      ''' Sets the delay (ms) between calls, starting with the next wait(). '''
+      Monitor.Enter(self)
+      try:
+         self.__delay_ms = max(0, delay_ms)
+      finally:
+         Monitor.Exit(self)
+
+
+   #===========================================================================
+   # the minimum amount of time (in ms) between calls
+   delay_ms = property( lambda self : self.__delay_ms, __set_delay_ms )
+
+   # the number of threads waiting for their time slot (the queue depth)
+   waiting_n = property( lambda self : self.__waiting_n )
+
+
+   #===========================================================================
+   def wait(self):
+      '''
+      Blocks until the calling thread's time slot comes, i.e. at least
+      'delay_ms' after the previous caller's slot.  Returns immediately if
+      that much time has already passed.
+      '''
+      Monitor.Enter(self)
+      try:
+         now_ms = self.__now_ms()
+         slot_ms = max(now_ms, self.__next_slot_ms)
+         self.__next_slot_ms = slot_ms + self.__delay_ms
+         queue_n = self.__waiting_n
+         if slot_ms > now_ms:
+            self.__waiting_n += 1
+      finally:
+         Monitor.Exit(self)
+
+      log.observe(self.__name_s + ".queue", queue_n)
+      log.observe(self.__name_s + ".wait_ms", slot_ms - now_ms)
+      if slot_ms > now_ms:
+         try:
+            wait_ms = slot_ms - now_ms
+            while wait_ms > 0:
+               t = Thread(ThreadStart(
+                  lambda x=0: Thread.CurrentThread.Sleep(int(wait_ms) + 1)))
+               t.Start()
+               t.Join()
+               wait_ms = slot_ms - self.__now_ms()
+         finally:
+            Monitor.Enter(self)
+            try:
+               self.__waiting_n -= 1
+            finally:
+               Monitor.Exit(self)
+
+
+   #===========================================================================
+   def __now_ms(self):
+      ''' Returns the current time (ms) on our monotonic clock. '''
+      return Stopwatch.GetTimestamp() * 1000.0 / Stopwatch.Frequency
@@ -7,14 +7,13 @@ This module contains a variety of generally useful utility methods.
 
 import clr
 from time import strftime
-from resources import Resources
 import re
 import sys
 
 clr.AddReference('System')
+from System.Globalization import CultureInfo
 from System.IO import File, StreamReader, StreamWriter, StringWriter
 from System.Text import Encoding
-from System.Net import HttpStatusCode, WebException, WebRequest
 
 clr.AddReference('System.Drawing')
 from System.Drawing import Graphics, Bitmap
@@ -118,6 +117,27 @@ def natural_key(s):
 
 
 
+# ==========================================================================
+def issue_sort_key(series_s, issue_num_s):
+   '''
+   Calculates a key for sorting comic books by the given series string, 
+   and then (for books where the series strings are identical) in natural
+   order by the given issue number string.  Issue numbers that are None or 
+   empty sort before all others.  This key is meant to be computed once per 
+   book, i.e. as the 'key' argument to list.sort().
+   
+   Series strings are ordered the same way that .NET's String.CompareTo() 
+   orders them (i.e. using the current culture's rules for accents, case and
+   punctuation) rather than by their raw character codes. 
+   '''
+   # the bytes of a culture's SortKey compare (in order) exactly the same way 
+   # that CompareInfo.Compare() compares the strings they came from.
+   series_key = CultureInfo.CurrentCulture.CompareInfo.GetSortKey(series_s)
+   return (tuple(series_key.KeyData), 
+      natural_key(issue_num_s if issue_num_s else ''))
+
+
+
 # ==========================================================================
 def invoke(control, delegate, synchronous = True): 
    '''
@@ -359,35 +379,24 @@ def strip_back_cover(image):
 
 
 #==============================================================================
-def get_html_string(url):
+def get_html_string(url, decode_b=True):
    '''
    This method takes a url (string) of a webpage, and connects to the URL,
    then downloads, htmldecodes, and returns the contents of that page as 
-   an html string.
+   an html string.  If 'decode_b' is False, the page is returned exactly as
+   it was downloaded (see html_decode.)
    
    This method will throw an WebException or IOException if anything goes wrong,
    including if the response code is not valid (i.e. 200).
    '''
-   
-   try:
-      request = WebRequest.Create(url) 
-      request.UserAgent = "[ComicVineScraper, version " + \
-         Resources.SCRIPT_VERSION + "]" 
-      response = request.GetResponse()
-      # if the response code is not "OK", throw a web exception immediately.
-      # this stops red-herring errors later on as we try to parse bad results.
-      # usually this only happens if the CV server is temporarily down.
-      if response.StatusCode != HttpStatusCode.OK:
-         raise WebException("server response code " + 
-            sstr(int(response.StatusCode))+" ("+sstr(response.StatusCode)+")" )
-      responseStream = response.GetResponseStream()
-      reader = StreamReader(responseStream, Encoding.UTF8)
-      page = reader.ReadToEnd()
-      with StringWriter() as writer: 
-         HttpUtility.HtmlDecode(page, writer)
-         page = writer.ToString()
-      return page
-   finally:
-      if 'reader' in vars(): reader.Close()
-      if 'responseStream' in vars(): responseStream.Close()
-      if 'response' in vars(): response.Close()
+   import httpclient
+   page = httpclient.get_string(url)
+   return html_decode(page) if decode_b else page
+
+
+#==============================================================================
+def html_decode(page):
+   ''' Returns an htmldecoded copy of the given html string. '''
+   with StringWriter() as writer: 
+      HttpUtility.HtmlDecode(page, writer)
+      return writer.ToString()
@@ -19,6 +19,9 @@ class Resources(object):
    # the location of our scraper 'cache' files. 
    LOCAL_CACHE_DIRECTORY = None
    
+   # the location of the app's debug log files. 
+   LOG_DIRECTORY = None
+   
    # the location of the app's settings file.
    SETTINGS_FILE = None
    
@@ -31,6 +34,10 @@ class Resources(object):
    # the location of the app's chosen series file.
    SERIES_FILE = None
    
+   # the location of the app's file of books that are waiting to be scraped
+   # until the database is online again.
+   PENDING_FILE = None
+   
    # the location of the app's localization default strings file
    I18N_DEFAULTS_FILE = None
    
@@ -102,7 +109,9 @@ class Resources(object):
       cls.ADVANCED_FILE = profile_dir + r'\advanced.dat'
       cls.GEOMETRY_FILE = profile_dir + r'\geometry.dat'
       cls.SERIES_FILE = profile_dir + r'\series.dat'
+      cls.PENDING_FILE = profile_dir + r'\pending.dat'
       cls.LOCAL_CACHE_DIRECTORY = profile_dir + r'\localCache'
+      cls.LOG_DIRECTORY = profile_dir + r'\logs'
       cls.I18N_DEFAULTS_FILE = script_dir + r"\en.zip"
       
       # do a special trick to things run from within the IDE,
@@ -0,0 +1,808 @@
+'''
+This module is a local stand-in for the ComicVine api server.  It serves
+recorded ComicVine XML responses (for the 'search', 'volume', 'issues' and
+'issue' queries that the scraper makes) and cover images from a fixture
+directory, so that the scraper can be tested and benchmarked repeatably,
+offline, and without hammering the real ComicVine.
+
+This module is a development tool; it is NOT part of the regular
+ComicVineScraper distributable and will not be run by regular users.  It runs
+on a regular (CPython 2.7 or 3.x) interpreter, not in ComicRack:
+
+   python cvstandin.py serve ../testdata/cvfixtures --port 8642
+
+To point the scraper at it, set these environment variables before starting
+ComicRack (or the Launcher):
+
+   CVS_API_URL=http://localhost:8642/api/
+   CVS_QUERY_DELAY_MS=0
+
+You can also tune the scraper's HTTP connection pool with the (optional)
+CVS_HTTP_CONNECTIONS and CVS_HTTP_TIMEOUT_MS environment variables, and its
+cached responses with CVS_RESPONSE_TTL_MS and CVS_STALE_WHILE_REVALIDATE.
+Set CVS_FORMAT=json to make it ask for JSON responses instead of XML.
+
+A fixture directory looks like this:
+
+   api/<resource>/<md5 of key>.xml   a recorded response for one query
+   api/<resource>/<md5 of key>.key   the key of that query (see fixture_key_s)
+   images/<md5 of url>.<ext>         a recorded cover image, for its real url
+
+You can record a fixture directory from the real ComicVine by setting the
+CVS_RECORD_DIR environment variable (see cvconnection._initialize), or make a
+synthetic one with the 'synthesize' command.
+
+Queries for JSON responses (format=json) are answered with the JSON version
+of the XML response that the same query would get.  The 'jsonify' command
+writes the JSON version of every recorded response in a fixture directory
+next to it (as api/<resource>/<md5 of key>.json), for cvjson's unit tests.
+
+Queries that don't match a recorded response exactly are answered anyway,
+if possible, with responses that are built from all of the volumes and issues
+that appear anywhere in the fixture directory.  Queries for volumes or issues
+that aren't in the fixture directory get ComicVine's "Object Not Found" error,
+and images that aren't in the fixture directory get a generated placeholder.
+
+The server can also simulate a slow (--latency-ms, --jitter-ms), unreliable
+(--error-rate) or grumpy (--rate-limit, --rate-window-s) ComicVine.  It
+counts what it serves; GET /stats to see the counts as JSON, and GET
+/stats/reset to zero them.
+
+@author: Cory Banack
+'''
+
+from __future__ import print_function
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import struct
+import sys
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+try:
+   from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+   from SocketServer import ThreadingMixIn
+   from urlparse import urlsplit, parse_qsl
+except ImportError:
+   from http.server import BaseHTTPRequestHandler, HTTPServer
+   from socketserver import ThreadingMixIn
+   from urllib.parse import urlsplit, parse_qsl
+
+# the number of results on each page of a 'search' or 'issues' response
+PAGE_SIZE = 100
+
+# the image url tags that appear in the 'image' element of volumes and issues
+IMAGE_URL_RE = re.compile(r'<((?:icon|medium|screen|small|super|thumb|tiny)'
+   r'_url)>\s*(?:<!\[CDATA\[)?\s*(https?://[^<\]\s]+)\s*(?:\]\]>)?\s*</\1>')
+
+# the volume and issue ids in 'volume/4050-X' and 'issue/4000-X' resources
+DETAILS_RE = re.compile(r'^(volume|issue)/40[05]0-(\d+)$')
+
+# the elements that contain html, which ComicVine sends as CDATA sections
+CDATA_RE = re.compile(r'<(description)>(.*?)</\1>', re.DOTALL)
+
+# the elements whose (integer) values ComicVine sends as JSON numbers
+JSON_INT_TAGS = set(['id', 'status_code', 'limit', 'offset',
+   'number_of_page_results', 'number_of_total_results', 'count_of_issues'])
+
+
+# =============================================================================
+def fixture_key_s(url):
+   '''
+   Returns the key that identifies the response for the given api url in a
+   fixture directory:  the api resource path (i.e. "issue/4000-123") and the
+   sorted query parameters, minus the api key.  This MUST compute exactly the
+   same keys as cvconnection._fixture_key_s in the scraper.
+   '''
+   parts = urlsplit(url)
+   path_s = parts.path[parts.path.find('/api/') + 5:].strip('/') \
+      if '/api/' in parts.path else parts.path.strip('/')
+   params = [ p for p in parse_qsl(parts.query)
+      if p[0] not in ('api_key', 'client') ]
+   return path_s + '?' + '&'.join(sorted(k + '=' + v for k, v in params))
+
+
+# =============================================================================
+def md5_s(text_s):
+   ''' Returns the md5 hex digest of the given (unicode or ascii) string. '''
+   return hashlib.md5(text_s.encode('utf-8')).hexdigest()
+
+
+# =============================================================================
+def placeholder_bmp(seed_s, width_n=100, height_n=150):
+   '''
+   Returns the bytes of a plain, 24-bit BMP image file whose colour is picked
+   from the given seed string, for use as a cover image that wasn't recorded.
+   '''
+   digest = hashlib.md5(seed_s.encode('utf-8')).digest()
+   colour = bytearray(digest[:3])
+   row = bytes(colour * width_n) + b'\0' * ((4 - width_n * 3 % 4) % 4)
+   pixels = row * height_n
+   header = struct.pack('<2sIHHI', b'BM', 54 + len(pixels), 0, 0, 54)
+   info = struct.pack('<IiiHHIIiiII', 40, width_n, height_n, 1, 24, 0,
+      len(pixels), 2835, 2835, 0, 0)
+   return header + info + pixels
+
+
+# =============================================================================
+class Fixtures(object):
+   '''
+   All of the recorded responses and images in a fixture directory, plus an
+   index of every volume and issue that appears in those responses, which is
+   used to answer queries that weren't recorded exactly.
+   '''
+
+   # ==========================================================================
+   def __init__(self, directory_s):
+      ''' Loads (and indexes) the given fixture directory. '''
+
+      self.directory_s = directory_s
+
+      # maps each recorded response key to the file that the response is in
+      self.responses = {}
+
+      # maps each volume id to the (most detailed) 'volume' Element we have
+      self.volumes = {}
+
+      # maps each issue id to the (most detailed) 'issue' Element we have
+      self.issues = {}
+
+      # maps each volume id to the set of ids of the issues in that volume
+      self.volume_issues = {}
+
+      api_dir_s = os.path.join(directory_s, 'api')
+      for root_s, dirs, files in os.walk(api_dir_s):
+         for file_s in sorted(files):
+            if file_s.endswith('.key'):
+               with open(os.path.join(root_s, file_s), 'rb') as f:
+                  key_s = f.read().decode('utf-8').strip()
+               xml_file_s = os.path.join(root_s, file_s[:-4] + '.xml')
+               if os.path.exists(xml_file_s):
+                  self.responses[key_s] = xml_file_s
+                  self.__index(key_s, xml_file_s)
+      print("loaded {0} responses, {1} volumes, {2} issues from {3}".format(
+         len(self.responses), len(self.volumes), len(self.issues),
+         directory_s))
+
+
+   # ==========================================================================
+   def __index(self, key_s, xml_file_s):
+      ''' Adds the volumes and issues in the given response to our index. '''
+      try:
+         root = ET.parse(xml_file_s).getroot()
+      except Exception as ex:
+         print("skipping unreadable response {0}: {1}".format(xml_file_s, ex))
+         return
+      results = root.find('results')
+      if results is None:
+         return
+
+      details = DETAILS_RE.match(key_s.split('?')[0])
+      if details:
+         # the results element IS the volume or issue
+         element = ET.Element(details.group(1))
+         element.extend(list(results))
+         self.__add(element, True)
+      else:
+         volume_id_s = None
+         match = re.search(r'filter=volume:(\d+)', key_s)
+         if match:
+            volume_id_s = match.group(1)
+         for element in results:
+            if element.tag == 'issue' and volume_id_s and \
+                  element.find('volume') is None:
+               volume = ET.SubElement(element, 'volume')
+               ET.SubElement(volume, 'id').text = volume_id_s
+            self.__add(element, False)
+
+
+   # ==========================================================================
+   def __add(self, element, details_b):
+      '''
+      Adds the given 'volume' or 'issue' element to our index, unless we
+      already have a more detailed version of it.
+      '''
+      id_s = (element.findtext('id') or '').strip()
+      if not id_s or element.tag not in ('volume', 'issue'):
+         return
+      index = self.volumes if element.tag == 'volume' else self.issues
+      if details_b or id_s not in index:
+         index[id_s] = element
+      if element.tag == 'issue':
+         volume_id_s = (element.findtext('volume/id') or '').strip()
+         if volume_id_s:
+            self.volume_issues.setdefault(volume_id_s, set()).add(id_s)
+            if volume_id_s not in self.volumes:
+               # a bare bones volume, so that the issue can be found
+               volume = ET.Element('volume')
+               ET.SubElement(volume, 'id').text = volume_id_s
+               ET.SubElement(volume, 'name').text = \
+                  element.findtext('volume/name') or ''
+               self.volumes[volume_id_s] = volume
+
+
+   # ==========================================================================
+   def image_bytes(self, name_s):
+      '''
+      Returns the recorded image file with the given name, or a placeholder
+      image if there isn't one.  Returns (bytes, content type, recorded_b).
+      '''
+      name_s = os.path.basename(name_s)
+      file_s = os.path.join(self.directory_s, 'images', name_s)
+      if os.path.isfile(file_s):
+         with open(file_s, 'rb') as f:
+            data = f.read()
+         ext_s = os.path.splitext(name_s)[1].lower()
+         type_s = {'.png':'image/png', '.gif':'image/gif',
+            '.bmp':'image/bmp'}.get(ext_s, 'image/jpeg')
+         return data, type_s, True
+      return placeholder_bmp(name_s), 'image/bmp', False
+
+
+   # ==========================================================================
+   def response_xml(self, key_s):
+      '''
+      Returns the XML response (a unicode string) for the given key, and
+      whether it was recorded (True) or built from our index (False).
+      '''
+      if key_s in self.responses:
+         with open(self.responses[key_s], 'rb') as f:
+            return f.read().decode('utf-8'), True
+
+      path_s, _, query_s = key_s.partition('?')
+      params = dict(parse_qsl(query_s))
+      details = DETAILS_RE.match(path_s)
+      if details:
+         index = self.volumes if details.group(1) == 'volume' else self.issues
+         element = index.get(details.group(2))
+         if element is None:
+            return error_xml(101, 'Object Not Found'), False
+         fields = params.get('field_list')
+         fields = set(fields.split(',')) if fields else None
+         return envelope_xml([child for child in element 
+            if fields is None or child.tag in fields], 1, 1, 0, 1), False
+      elif path_s == 'search':
+         return self.__search_xml(params), False
+      elif path_s == 'issues':
+         return self.__issues_xml(params), False
+      else:
+         return error_xml(102, 'Error in URL Format'), False
+
+
+   # ==========================================================================
+   def __search_xml(self, params):
+      '''
+      Returns a 'search' response for volumes, built from our index.  A 
+      volume matches if every search term appears in its name (ignoring case
+      and punctuation.)
+      '''
+      simplify = lambda s: re.sub(r'\W|_', '', s.lower())
+      terms = [ simplify(t)
+         for t in re.split(r'\s+AND\s+|\s+', params.get('query', '')) ]
+      terms = [ t for t in terms if t ]
+      matches = []
+      for id_s in sorted(self.volumes, key=int):
+         volume = self.volumes[id_s]
+         name_s = simplify(volume.findtext('name') or '')
+         if terms and all(t in name_s for t in terms):
+            matches.append(volume)
+      page_n = max(1, int(params.get('page', 1)))
+      offset_n = (page_n - 1) * PAGE_SIZE
+      return self.__page_xml(matches, offset_n)
+
+
+   # ==========================================================================
+   def __issues_xml(self, params):
+      ''' Returns an 'issues' response (for a volume) built from our index. '''
+      filters = dict( f.split(':', 1)
+         for f in params.get('filter', '').split(',') if ':' in f )
+      volume_id_s = filters.get('volume', '').strip()
+      number_s = filters.get('issue_number')
+      matches = []
+      for id_s in sorted(self.volume_issues.get(volume_id_s, ()), key=int):
+         issue = self.issues[id_s]
+         if number_s is None or same_number(number_s,
+               issue.findtext('issue_number') or ''):
+            summary = ET.Element('issue')
+            for tag_s in ('id', 'name', 'issue_number', 'image'):
+               child = issue.find(tag_s)
+               if child is not None:
+                  summary.append(child)
+            matches.append(summary)
+      offset_n = max(0, int(params.get('offset', 0)))
+      if 'page' in params and 'offset' not in params:
+         offset_n = (max(1, int(params['page'])) - 1) * PAGE_SIZE
+      return self.__page_xml(matches, offset_n)
+
+
+   # ==========================================================================
+   def __page_xml(self, matches, offset_n):
+      ''' Returns a response with one page of the given result elements. '''
+      page = matches[offset_n:offset_n + PAGE_SIZE]
+      return envelope_xml(page, len(page), len(matches), offset_n,
+         PAGE_SIZE)
+
+
+# =============================================================================
+def same_number(a_s, b_s):
+   ''' Returns whether the two given issue numbers are (loosely) the same. '''
+   normalize = lambda s: s.strip().lower().lstrip('0') or '0'
+   return normalize(a_s) == normalize(b_s)
+
+
+# =============================================================================
+def envelope_xml(results, page_n, total_n, offset_n, limit_n):
+   '''
+   Returns a successful ComicVine XML response (a unicode string) for the
+   given result elements.
+   '''
+   root = ET.Element('response')
+   ET.SubElement(root, 'error').text = 'OK'
+   ET.SubElement(root, 'limit').text = str(limit_n)
+   ET.SubElement(root, 'offset').text = str(offset_n)
+   ET.SubElement(root, 'number_of_page_results').text = str(page_n)
+   ET.SubElement(root, 'number_of_total_results').text = str(total_n)
+   ET.SubElement(root, 'status_code').text = '1'
+   ET.SubElement(root, 'results').extend(results)
+   ET.SubElement(root, 'version').text = '1.0'
+   return __to_xml(root)
+
+
+# =============================================================================
+def error_xml(status_code_n, error_s):
+   ''' Returns a failed ComicVine XML response (a unicode string). '''
+   root = ET.Element('response')
+   ET.SubElement(root, 'error').text = error_s
+   for tag_s in ('limit', 'offset', 'number_of_page_results',
+         'number_of_total_results'):
+      ET.SubElement(root, tag_s).text = '0'
+   ET.SubElement(root, 'status_code').text = str(status_code_n)
+   ET.SubElement(root, 'results')
+   ET.SubElement(root, 'version').text = '1.0'
+   return __to_xml(root)
+
+
+# =============================================================================
+def __to_xml(root):
+   ''' Serializes the given Element into a (unicode) XML document string. '''
+   def cdata(match):
+      text_s = match.group(2).replace('&lt;', '<').replace('&gt;', '>') \
+         .replace('&quot;', '"').replace('&amp;', '&')
+      return '<{0}><![CDATA[{1}]]></{0}>'.format(match.group(1),
+         text_s.replace(']]>', ']]]]><![CDATA[>'))
+   return '<?xml version="1.0" encoding="utf-8"?>' + \
+      CDATA_RE.sub(cdata, ET.tostring(root).decode('ascii'))
+
+
+# =============================================================================
+def json_response(xml_s, details_b):
+   '''
+   Converts the given ComicVine XML response (a unicode string) into the
+   JSON response (a unicode string) that ComicVine sends for the same query.
+   'details_b' says whether the response is for a details query (i.e.
+   'volume/4050-X'), whose results are one object instead of a list.
+   '''
+   root = ET.fromstring(xml_s.encode('utf-8'))
+   response = {}
+   for element in root:
+      if element.tag != 'results':
+         response[element.tag] = __to_json(element)
+      elif details_b and len(element):
+         response[element.tag] = __to_json(element)
+      else:
+         response[element.tag] = [__to_json(child) for child in element]
+   return json.dumps(response, sort_keys=True)
+
+
+# =============================================================================
+def __to_json(element):
+   ''' Converts the given (non-'results') Element into a JSON value. '''
+   if not len(element):
+      text_s = element.text or ''
+      if not text_s.strip():
+         return None
+      elif element.tag in JSON_INT_TAGS and text_s.strip().isdigit():
+         return int(text_s)
+      else:
+         return text_s
+   elif element.tag.endswith('_credits'):
+      return [__to_json(child) for child in element]
+   else:
+      return dict((child.tag, __to_json(child)) for child in element)
+
+
+# =============================================================================
+class Stats(object):
+   ''' Thread-safe counters for everything that the server has served. '''
+
+   # ==========================================================================
+   def __init__(self):
+      self.__lock = threading.Lock()
+      self.reset()
+
+   # ==========================================================================
+   def reset(self):
+      ''' Zeroes all of the counters. '''
+      with self.__lock:
+         self.__counts = {}
+         self.__started_s = time.time()
+
+   # ==========================================================================
+   def count(self, *names):
+      ''' Adds one to each of the counters with the given names. '''
+      with self.__lock:
+         for name_s in names:
+            self.__counts[name_s] = self.__counts.get(name_s, 0) + 1
+
+   # ==========================================================================
+   def as_json(self):
+      ''' Returns all of the counters as a JSON string. '''
+      with self.__lock:
+         stats = dict(self.__counts)
+         stats['seconds'] = round(time.time() - self.__started_s, 3)
+      return json.dumps(stats, indent=2, sort_keys=True)
+
+
+# =============================================================================
+class RateLimiter(object):
+   '''
+   Decides which requests exceed ComicVine's rate limit, which is simulated as
+   a maximum number of api requests in any sliding window of time.
+   '''
+
+   # ==========================================================================
+   def __init__(self, limit_n, window_s):
+      ''' A limit of 0 means that there is no limit. '''
+      self.__limit_n = limit_n
+      self.__window_s = window_s
+      self.__times = []
+      self.__lock = threading.Lock()
+
+   # ==========================================================================
+   def allow(self):
+      ''' Returns whether a request that is made right now is allowed. '''
+      if self.__limit_n <= 0:
+         return True
+      with self.__lock:
+         now_s = time.time()
+         self.__times = [t for t in self.__times if now_s - t<self.__window_s]
+         if len(self.__times) >= self.__limit_n:
+            return False
+         self.__times.append(now_s)
+         return True
+
+
+# =============================================================================
+class StandInHandler(BaseHTTPRequestHandler):
+   ''' Handles one HTTP request to the stand-in server. '''
+
+   # all of these are set up by 'serve()'
+   fixtures = None
+   stats = None
+   rate_limiter = None
+   options = None
+
+   protocol_version = 'HTTP/1.1'
+
+   # ==========================================================================
+   def do_GET(self):
+      path_s = urlsplit(self.path).path
+      if path_s.rstrip('/') == '/stats':
+         self.__send(200, self.stats.as_json(), 'application/json')
+      elif path_s.rstrip('/') == '/stats/reset':
+         self.stats.reset()
+         self.__send(200, '{}', 'application/json')
+      elif path_s.startswith('/images/'):
+         self.__simulate_latency()
+         data, type_s, recorded_b = self.fixtures.image_bytes(path_s[8:])
+         self.stats.count('images',
+            'images_recorded' if recorded_b else 'images_placeholder')
+         self.__send(200, data, type_s)
+      elif path_s.startswith('/api/'):
+         self.__simulate_latency()
+         key_s = fixture_key_s(self.path)
+         resource_s = key_s.split('?')[0].split('/')[0]
+         self.stats.count('api', 'api_' + resource_s)
+         # json responses are converted from the same query's xml response
+         json_b = dict(parse_qsl(key_s.partition('?')[2])).get('format') \
+            == 'json'
+         if json_b:
+            self.stats.count('api_json')
+            key_s = key_s.replace('format=json', 'format=xml')
+         type_s = 'application/json' if json_b else 'text/xml'
+         def body(xml_s):
+            return json_response(xml_s, DETAILS_RE.match(
+               key_s.split('?')[0]) is not None) if json_b else xml_s
+         if random.random() < self.options.error_rate:
+            self.stats.count('injected_errors')
+            self.__send(500, 'Internal Server Error (injected)', 'text/plain')
+         elif not self.rate_limiter.allow():
+            self.stats.count('rate_limited')
+            self.__send(200, body(error_xml(107,
+               'Rate limit exceeded.  Slow down cowboy.')), type_s)
+         else:
+            xml_s, recorded_b = self.fixtures.response_xml(key_s)
+            self.stats.count('api_recorded' if recorded_b else 'api_built')
+            body_s = body(self.__rewrite_images(xml_s))
+            etag_s = '"{0}"'.format(md5_s(body_s))
+            if self.headers.get('If-None-Match') == etag_s:
+               self.stats.count('api_not_modified')
+               self.__send(304, b'', type_s, etag_s)
+            else:
+               self.__send(200, body_s, type_s, etag_s)
+      else:
+         self.stats.count('not_found')
+         self.__send(404, 'Not Found', 'text/plain')
+
+
+   # ==========================================================================
+   def __simulate_latency(self):
+      ''' Sleeps for the configured latency (plus random jitter.) '''
+      delay_ms = self.options.latency_ms + \
+         random.uniform(0, self.options.jitter_ms)
+      if delay_ms > 0:
+         time.sleep(delay_ms / 1000.0)
+
+
+   # ==========================================================================
+   def __rewrite_images(self, xml_s):
+      ''' Points every image url in the given XML at this server. '''
+      host_s = self.headers.get('Host') or 'localhost:{0}'.format(
+         self.server.server_address[1])
+      def rewrite(match):
+         url_s = match.group(2)
+         ext_s = os.path.splitext(urlsplit(url_s).path)[1].lower() or '.jpg'
+         return '<{0}>http://{1}/images/{2}{3}</{0}>'.format(
+            match.group(1), host_s, md5_s(url_s), ext_s)
+      return IMAGE_URL_RE.sub(rewrite, xml_s)
+
+
+   # ==========================================================================
+   def __send(self, code_n, body, type_s, etag_s=None):
+      ''' 
+      Sends a complete response with the given body (unicode or bytes), and
+      the given ETag header (if there is one.)
+      '''
+      if not isinstance(body, bytes):
+         body = body.encode('utf-8')
+         type_s += '; charset=utf-8'
+      self.send_response(code_n)
+      self.send_header('Content-Type', type_s)
+      self.send_header('Content-Length', str(len(body)))
+      if etag_s:
+         self.send_header('ETag', etag_s)
+      self.end_headers()
+      self.wfile.write(body)
+      self.stats.count('http_{0}'.format(code_n))
+
+
+   # ==========================================================================
+   def log_message(self, format, *args):
+      if self.options.verbose:
+         BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+# =============================================================================
+class StandInServer(ThreadingMixIn, HTTPServer):
+   ''' The stand-in server, which handles each request on its own thread. '''
+   daemon_threads = True
+   allow_reuse_address = True
+
+
+# =============================================================================
+def serve(options):
+   ''' Runs the stand-in server (forever) with the given options. '''
+   StandInHandler.fixtures = Fixtures(options.directory)
+   StandInHandler.stats = Stats()
+   StandInHandler.rate_limiter = RateLimiter(options.rate_limit,
+      options.rate_window_s)
+   StandInHandler.options = options
+   server = StandInServer((options.host, options.port), StandInHandler)
+   print("serving on http://{0}:{1}/api/".format(options.host, options.port))
+   try:
+      server.serve_forever()
+   except KeyboardInterrupt:
+      pass
+   finally:
+      server.server_close()
+
+
+# =============================================================================
+def synthesize(options):
+   '''
+   Writes a synthetic fixture directory with the given options:  volume and
+   issue details responses for made up series (or the series names in the
+   given names file), which is enough for the server to answer any query.
+   
+   Each line of a names file is a series name, optionally followed by a tab
+   and a comma separated list of the issue numbers that series should have.
+   '''
+   rng = random.Random(options.seed)
+   if options.names:
+      with open(options.names, 'rb') as f:
+         lines = [n.strip() for n in f.read().decode('utf-8').splitlines()]
+      names = [n for n in lines if n and not n.startswith('#')]
+   else:
+      words = ['Amazing', 'Astonishing', 'Dark', 'Doom', 'Patrol', 'Legion',
+         'Spider', 'Knight', 'Planet', 'Tales', 'Mystery', 'Star', 'Swamp',
+         'Thing', 'Iron', 'Fist', 'Atomic', 'Robo', 'Ghost', 'Rider']
+      names = set()
+      while len(names) < options.series:
+         names.add(' '.join(rng.sample(words, rng.choice((2, 2, 3)))))
+      names = sorted(names)
+   publishers = ['DC Comics', 'Marvel', 'Image', 'Dark Horse Comics', 'IDW']
+   roles = ['writer', 'penciler', 'inker', 'colorist', 'letterer', 'cover']
+
+   issue_id_n = 100000
+   for volume_id_n, name_s in enumerate(names, 1000):
+      name_s, _, numbers_s = name_s.partition('\t')
+      name_s = name_s.strip()
+      year_n = rng.randint(1960, 2015)
+      numbers = [n.strip() for n in numbers_s.split(',') if n.strip()]
+      if not numbers:
+         numbers = [str(n) for n in range(1, rng.randint(1,options.issues)+1)]
+      count_n = len(numbers)
+      volume = ET.Element('volume')
+      __sub(volume, 'count_of_issues', count_n)
+      __sub(volume, 'id', volume_id_n)
+      __image(volume, 'volume', volume_id_n)
+      __sub(volume, 'name', name_s)
+      __sub(__sub(volume, 'publisher'), 'name', rng.choice(publishers))
+      __sub(volume, 'start_year', year_n)
+      __write_fixture(options.directory,
+         'volume/4050-{0}?field_list=name,start_year,publisher,image,'
+         'count_of_issues,id&format=xml'.format(volume_id_n), [volume])
+
+      for number_n, number_s in enumerate(numbers, 1):
+         issue_id_n += 1
+         month_n = (number_n - 1) % 12 + 1
+         year_n2 = year_n + (number_n - 1) // 12
+         issue = ET.Element('issue')
+         for tag_s in ('character', 'location', 'story_arc', 'team'):
+            credits = __sub(issue, tag_s + '_credits')
+            for i in range(rng.randint(0, 3)):
+               __sub(__sub(credits, tag_s), 'name',
+                  '{0} {1}'.format(tag_s.replace('_', ' ').title(),
+                  rng.randint(1, 40)))
+         __sub(issue, 'cover_date', '{0}-{1:02d}-01'.format(year_n2, month_n))
+         __sub(issue, 'description', '<p>Issue #{0} of {1}.</p>'.format(
+            number_s, name_s))
+         __sub(issue, 'id', issue_id_n)
+         __image(issue, 'issue', issue_id_n)
+         __sub(issue, 'issue_number', number_s)
+         __sub(issue, 'name', 'Chapter {0}'.format(number_s))
+         people = __sub(issue, 'person_credits')
+         for role_s in roles:
+            person = __sub(people, 'person')
+            __sub(person, 'name', 'Creator {0}'.format(rng.randint(1, 60)))
+            __sub(person, 'role', role_s)
+         __sub(issue, 'site_detail_url',
+            'http://comicvine.gamespot.com/issue/4000-{0}/'.format(issue_id_n))
+         __sub(issue, 'store_date', '{0}-{1:02d}-15'.format(year_n2, month_n))
+         volume_ref = __sub(issue, 'volume')
+         __sub(volume_ref, 'id', volume_id_n)
+         __sub(volume_ref, 'name', name_s)
+         __write_fixture(options.directory,
+            'issue/4000-{0}?format=xml'.format(issue_id_n), [issue])
+   print("wrote {0} volumes and {1} issues to {2}".format(
+      len(names), issue_id_n - 100000, options.directory))
+
+
+# =============================================================================
+def jsonify(options):
+   '''
+   Writes the JSON version (see json_response) of every recorded response in
+   the given fixture directory next to it, as a '.json' file.
+   '''
+   count_n = 0
+   for root_s, dirs, files in os.walk(os.path.join(options.directory, 'api')):
+      for file_s in sorted(files):
+         if file_s.endswith('.key'):
+            with open(os.path.join(root_s, file_s), 'rb') as f:
+               key_s = f.read().decode('utf-8').strip()
+            xml_file_s = os.path.join(root_s, file_s[:-4] + '.xml')
+            if os.path.exists(xml_file_s):
+               with open(xml_file_s, 'rb') as f:
+                  xml_s = f.read().decode('utf-8')
+               details_b = DETAILS_RE.match(key_s.split('?')[0]) is not None
+               with open(xml_file_s[:-4] + '.json', 'wb') as f:
+                  f.write(json_response(xml_s, details_b).encode('utf-8'))
+               count_n += 1
+   print("wrote {0} json responses to {1}".format(count_n, options.directory))
+
+
+# =============================================================================
+def __sub(parent, tag_s, text=None):
+   ''' Adds a new child element (with the given text) to the given element. '''
+   child = ET.SubElement(parent, tag_s)
+   if text is not None:
+      child.text = str(text) if not isinstance(text, type(u'')) else text
+   return child
+
+
+# =============================================================================
+def __image(parent, kind_s, id_n):
+   ''' Adds a made up 'image' element to the given volume or issue element. '''
+   image = __sub(parent, 'image')
+   for size_s in ('icon', 'medium', 'screen', 'small', 'super', 'thumb',
+         'tiny'):
+      __sub(image, size_s + '_url',
+         'http://static.comicvine.com/uploads/{0}/{1}/{2}-{3}.jpg'.format(
+         size_s, kind_s, id_n, size_s))
+
+
+# =============================================================================
+def __write_fixture(directory_s, key_s, results):
+   ''' Writes a fixture response (and its key) for the given key. '''
+   dir_s = os.path.join(directory_s, 'api', key_s.split('/')[0])
+   if not os.path.isdir(dir_s):
+      os.makedirs(dir_s)
+   name_s = md5_s(key_s)
+   with open(os.path.join(dir_s, name_s + '.key'), 'wb') as f:
+      f.write(key_s.encode('utf-8'))
+   # the results element IS the volume or issue, in a details response
+   with open(os.path.join(dir_s, name_s + '.xml'), 'wb') as f:
+      f.write(envelope_xml(list(results[0]), 1, 1, 0, 1).encode('utf-8'))
+
+
+# =============================================================================
+def main(argv):
+   ''' Parses the given command line arguments, and runs the command. '''
+   parser = argparse.ArgumentParser(description=
+      'A local stand-in for the ComicVine api server.')
+   commands = parser.add_subparsers(dest='command')
+
+   server = commands.add_parser('serve', help='serve a fixture directory')
+   server.add_argument('directory', help='the fixture directory')
+   server.add_argument('--host', default='localhost')
+   server.add_argument('--port', type=int, default=8642)
+   server.add_argument('--latency-ms', type=float, default=0.0,
+      help='delay every response by this long')
+   server.add_argument('--jitter-ms', type=float, default=0.0,
+      help='plus a random delay of up to this long')
+   server.add_argument('--error-rate', type=float, default=0.0,
+      help='the fraction (0.0 to 1.0) of api requests that fail with a 500')
+   server.add_argument('--rate-limit', type=int, default=0,
+      help='the number of api requests allowed per window (0 = no limit)')
+   server.add_argument('--rate-window-s', type=float, default=60.0,
+      help='the length of the rate limit window')
+   server.add_argument('--seed', type=int, default=None,
+      help='a random seed, for repeatable error injection')
+   server.add_argument('--verbose', action='store_true',
+      help='log every request')
+
+   synth = commands.add_parser('synthesize',
+      help='write a synthetic fixture directory')
+   synth.add_argument('directory', help='the fixture directory')
+   synth.add_argument('--series', type=int, default=6,
+      help='the number of made up series')
+   synth.add_argument('--issues', type=int, default=8,
+      help='the maximum number of issues in each series')
+   synth.add_argument('--names', default=None,
+      help='a file of series names (and issue numbers) to use instead')
+   synth.add_argument('--seed', type=int, default=1)
+
+   jsonify_cmd = commands.add_parser('jsonify',
+      help='write the json version of every response in a fixture directory')
+   jsonify_cmd.add_argument('directory', help='the fixture directory')
+
+   options = parser.parse_args(argv)
+   if options.command == 'serve':
+      random.seed(options.seed)
+      serve(options)
+   elif options.command == 'synthesize':
+      synthesize(options)
+   elif options.command == 'jsonify':
+      jsonify(options)
+   else:
+      parser.print_help()
+
+
+if __name__ == '__main__':
+   main(sys.argv[1:])
@@ -17,7 +17,7 @@ from System.Windows.Forms import Form
 
 # add a reference to a directory containing mockups of key comic rack dlls 
 sys.path.append( os.path.dirname(os.path.dirname(__file__))+r"\comicrack")
-
+
 #==============================================================================
 class ComicRack(object):
    ''' A static class that emulates the real ComicRack object. '''
@@ -27,6 +27,8 @@ class ComicRack(object):
             return None
       def SetCustomBookThumbnail(self, book, bitmap):
          return True
+      def GetLibraryBooks(self):
+         return []
    
    class MainForm(Form):
       pass
@@ -51,7 +53,11 @@ import ComicVineScraper
 ComicVineScraper.ComicRack = ComicRack
 
 # 2. now go ahead and start the ComicVineScraper plugin.
-if len(sys.argv) == 2:
+if len(sys.argv) >= 2 and sys.argv[1] == "benchmark":
+      # run the end-to-end benchmark harness; see benchmark.py for details
+      import benchmark
+      benchmark.main(ComicRack, sys.argv[2:])
+elif len(sys.argv) == 2:
       # note that this doesn't work (for highly mysterious reasons) if you
       # change the project source character encoding to anything other 
       # than US-ASCII 
@@ -59,6 +65,7 @@ if len(sys.argv) == 2:
       books = cPickle.load(f)
       ComicVineScraper.cvs_scrape(books)  
 else:
-      print "Usage: this script takes a single file as an argument."
+      print "Usage: this script takes a single file as an argument,"
+      print "       or 'benchmark' and the benchmark's arguments (try -h)."
       
       
\ No newline at end of file
@@ -0,0 +1,546 @@
+'''
+This module is an end-to-end benchmark harness for the ComicVineScraper
+plugin.  It is run by the Launcher, like so:
+
+   ipy Launcher.py benchmark --books 500 --out results.json
+
+It generates a synthetic library of fake ComicRack books (with file names
+based on the patterns in src/py/tests/test_fnameparser.data), starts the
+local ComicVine stand-in server (tools/cvstandin) with a matching synthetic
+database, and then scrapes the library against it, once per mode:
+
+   autoscrape -> scrape the (unscraped) library with 'autochoose series' on
+   rescrape   -> scrape the same library again, with 'fast rescrape' on
+
+Any dialogs that the scraper shows are answered automatically, the way that
+a user who knows the right answer would answer them.  For each mode, the
+harness reports books/sec, server requests per book, cache hit rates, and
+peak memory, and all of the results (plus the full timing span data, see
+log.get_performance_data) are saved as JSON, so that runs can be compared.
+
+This module is a development tool; it is NOT part of the regular
+ComicVineScraper distributable and will not be run by regular users.
+'''
+
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import time
+
+import ComicVineScraper
+import log
+import scrapeengine
+from configuration import Configuration
+from issueform import IssueFormResult
+from resources import Resources
+from searchform import SearchFormResult
+from seriesform import SeriesFormResult
+
+import clr
+clr.AddReference('System')
+from System import DateTime, Environment, GC, Guid
+from System.Diagnostics import Process, ProcessStartInfo, Stopwatch
+from System.IO import Path
+from System.Net import WebClient
+from System.Threading import Thread, ThreadStart
+
+clr.AddReference('System.Drawing')
+from System.Drawing import Bitmap, Color, Graphics
+
+# the root directory of the ComicVineScraper source tree
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(
+   os.path.abspath(__file__))))
+
+# the file name patterns that the synthetic libraries are generated from
+PATTERNS_FILE = os.path.join(ROOT_DIR, 'src', 'py', 'tests',
+   'test_fnameparser.data')
+
+# the ComicVine stand-in server script
+STANDIN_SCRIPT = os.path.join(ROOT_DIR, 'tools', 'cvstandin', 'cvstandin.py')
+
+# the modes that the harness knows how to benchmark, in their default order
+MODES = ('autoscrape', 'rescrape')
+
+# the prefix of the counters that count the (automatically answered) dialogs
+DIALOG_COUNTER = "benchmark.dialog."
+
+
+#==============================================================================
+def main(comicrack, argv):
+   '''
+   Runs the benchmark with the given command line arguments, using the given
+   (fake) ComicRack object from the Launcher.
+   '''
+   options = __parse_args(argv)
+
+   # 1. generate the synthetic library, and a matching database for it
+   books, series = create_library(options.books, options.seed)
+   print "generated {0} books in {1} series".format(len(books), len(series))
+
+   # 2. start the ComicVine stand-in, unless we've been given one
+   server = None
+   api_url_s = options.api_url
+   if not api_url_s:
+      server = StandIn(options.python, options.port, series,
+         options.latency_ms)
+      api_url_s = server.api_url_s
+
+   try:
+      # 3. point the scraper at the stand-in, and answer its dialogs for it
+      Environment.SetEnvironmentVariable("CVS_API_URL", api_url_s)
+      Environment.SetEnvironmentVariable("CVS_QUERY_DELAY_MS", "0")
+      # every run must ask the stand-in, not reuse responses from earlier runs
+      Environment.SetEnvironmentVariable("CVS_RESPONSE_TTL_MS", "0")
+      Environment.SetEnvironmentVariable("CVS_FORMAT", options.format)
+      comicrack.App = BenchmarkApp()
+      __install_auto_answers()
+
+      # 4. scrape the library, once for each mode
+      runs = []
+      for mode_s in options.modes.split(','):
+         mode_s = mode_s.strip()
+         if mode_s not in MODES:
+            raise Exception("unknown mode: " + mode_s)
+         runs.append(run(comicrack, books, mode_s, api_url_s))
+         __print_run(runs[-1])
+
+      # 5. save the results
+      results = {
+         "timestamp" : DateTime.Now.ToString("s"),
+         "machine" : Environment.MachineName,
+         "script_version" : Resources.SCRIPT_VERSION,
+         "options" : vars(options),
+         "runs" : runs }
+      out_s = options.out if options.out else "benchmark-{0}.json".format(
+         DateTime.Now.ToString("yyyyMMdd-HHmmss"))
+      with open(out_s, 'w') as f:
+         json.dump(results, f, indent=2, sort_keys=True)
+      print "saved results to", os.path.abspath(out_s)
+   finally:
+      if server: server.stop()
+
+
+#==============================================================================
+def __parse_args(argv):
+   ''' Parses the given benchmark command line arguments. '''
+   parser = argparse.ArgumentParser(prog='Launcher.py benchmark',
+      description='Benchmarks end-to-end scrapes against a local ComicVine.')
+   parser.add_argument('--books', type=int, default=200,
+      help='the number of books in the synthetic library')
+   parser.add_argument('--modes', default=','.join(MODES),
+      help='the comma separated scrape modes to run, in order')
+   parser.add_argument('--seed', type=int, default=1,
+      help='the random seed for generating the library')
+   parser.add_argument('--out', default=None,
+      help='the JSON results file (default: benchmark-<timestamp>.json)')
+   parser.add_argument('--api-url', default=None,
+      help='use an already running stand-in (or real!) ComicVine api url')
+   parser.add_argument('--python', default='python',
+      help='the python interpreter that runs the stand-in server')
+   parser.add_argument('--port', type=int, default=8642,
+      help='the port that the stand-in server runs on')
+   parser.add_argument('--latency-ms', type=float, default=0.0,
+      help='the simulated latency of the stand-in server')
+   parser.add_argument('--format', default='xml', choices=['xml', 'json'],
+      help='the format that the scraper asks for its api responses in')
+   return parser.parse_args(argv)
+
+
+#==============================================================================
+def load_patterns():
+   '''
+   Returns a list of (file name, series name, issue number) tuples, one for
+   each line of the file name parser's test data that has a series name.
+   '''
+   patterns = []
+   with open(PATTERNS_FILE, 'r') as f:
+      for line in f:
+         line = line.strip()
+         if line and not line.startswith('#'):
+            quote = line[0]
+            values = re.findall(quote + '([^' + quote + ']*)' + quote, line)
+            if len(values) >= 3 and values[1].strip():
+               patterns.append( (values[0], values[1], values[2]) )
+   return patterns
+
+
+#==============================================================================
+def create_library(count_n, seed_n):
+   '''
+   Generates a synthetic library of 'count_n' fake ComicRack books, by cycling
+   through the file name patterns from the test data.  The second (and
+   third, etc.) time that a pattern is used, its issue number is changed, so
+   that most books are different issues of the same few hundred series.
+
+   Returns the list of books, and a dict that maps each series name in the
+   library to the set of issue numbers that the library contains for it.
+   '''
+   rng = random.Random(seed_n)
+   patterns = load_patterns()
+   books = []
+   series = {}
+   for i in range(count_n):
+      file_s, series_s, issue_s = patterns[i % len(patterns)]
+      cycle_n = i // len(patterns)
+      if cycle_n and issue_s.isdigit():
+         # change the issue number iff it appears exactly once in the name
+         runs = [ m for m in re.finditer(r'\d+', file_s)
+            if int(m.group()) == int(issue_s) ]
+         if len(runs) == 1:
+            m = runs[0]
+            issue_s = str(int(issue_s) + cycle_n)
+            file_s = file_s[:m.start()] + issue_s.zfill(len(m.group())) \
+               + file_s[m.end():]
+      folder_s = "Folder{0:02d}".format(rng.randint(0, 20))
+      books.append(BenchmarkComicBook(
+         r"C:\Comics\{0}\{1}".format(folder_s, file_s)))
+      series.setdefault(series_s, set())
+      if issue_s:
+         series[series_s].add(issue_s)
+   return books, series
+
+
+#==============================================================================
+def run(comicrack, books, mode_s, api_url_s):
+   '''
+   Scrapes the given books (with the given ComicRack object) in the given
+   mode, and returns a dict with the results.
+   '''
+   BenchmarkConfiguration.mode_s = mode_s
+   server_url_s = api_url_s[:api_url_s.rstrip('/').rfind('/')]
+   server_stats(server_url_s, True)
+
+   print "running", mode_s, "benchmark on", len(books), "books..."
+   GC.Collect()
+   GC.WaitForPendingFinalizers()
+   sampler = MemorySampler()
+   stopwatch = Stopwatch.StartNew()
+   try:
+      ComicVineScraper.cvs_scrape(books)
+   finally:
+      stopwatch.Stop()
+      sampler.stop()
+
+   seconds = stopwatch.Elapsed.TotalSeconds
+   performance = log.get_performance_data()
+   counters = performance["counters"]
+   stats = server_stats(server_url_s, False)
+
+   # the hit rate of each cache that counts its hits and misses
+   hit_rates = {}
+   for name_s in counters:
+      if name_s.endswith(".hit") or name_s.endswith(".miss"):
+         cache_s = name_s[:name_s.rfind('.')]
+         hits_n = counters.get(cache_s + ".hit", 0)
+         lookups_n = hits_n + counters.get(cache_s + ".miss", 0)
+         hit_rates[cache_s] = hits_n / float(lookups_n) if lookups_n else 0.0
+
+   api_n = stats.get("api", 0)
+   images_n = stats.get("images", 0)
+   count_n = max(1, len(books))
+   return {
+      "mode" : mode_s,
+      "books" : len(books),
+      "scraped_books" : len( [b for b in books if b.scraped_b] ),
+      "seconds" : seconds,
+      "books_per_sec" : len(books) / seconds if seconds > 0 else 0.0,
+      "requests" : {
+         "api" : api_n,
+         "images" : images_n,
+         "per_book" : (api_n + images_n) / float(count_n),
+         "api_per_book" : api_n / float(count_n),
+         "not_modified" : stats.get("api_not_modified", 0),
+         "rate_limited" : stats.get("rate_limited", 0),
+         "injected_errors" : stats.get("injected_errors", 0),
+         "server" : stats },
+      "cache_hit_rates" : hit_rates,
+      "dialogs" : dict( (k[len(DIALOG_COUNTER):], v) 
+         for k, v in counters.items() if k.startswith(DIALOG_COUNTER) ),
+      "memory" : {
+         "peak_managed_mb" : sampler.peak_managed_n / 1048576.0,
+         "peak_working_set_mb" : sampler.peak_working_set_n / 1048576.0 },
+      "performance" : performance }
+
+
+#==============================================================================
+def server_stats(server_url_s, reset_b):
+   '''
+   Gets (or resets) the stand-in server's counters.  Returns an empty dict if
+   there is no stand-in server at the given url.
+   '''
+   client = WebClient()
+   try:
+      return json.loads(client.DownloadString(
+         server_url_s + ("/stats/reset" if reset_b else "/stats")))
+   except Exception:
+      return {} # i.e. we're not using the stand-in server
+   finally:
+      client.Dispose()
+
+
+#==============================================================================
+def __print_run(result):
+   ''' Prints a summary of the given run() results to the console. '''
+   print "{0}: {1} books ({2} scraped) in {3:.1f} s = {4:.2f} books/sec".format(
+      result["mode"], result["books"], result["scraped_books"],
+      result["seconds"], result["books_per_sec"])
+   print "   requests/book: {0:.2f} ({1:.2f} api, {2} not modified)".format(
+      result["requests"]["per_book"], result["requests"]["api_per_book"],
+      result["requests"]["not_modified"])
+   print "   peak memory: {0:.1f} MB managed, {1:.1f} MB working set".format(
+      result["memory"]["peak_managed_mb"],
+      result["memory"]["peak_working_set_mb"])
+   for cache_s, rate in sorted(result["cache_hit_rates"].items()):
+      print "   {0} hit rate: {1:.0%}".format(cache_s, rate)
+   for dialog_s, n in sorted(result["dialogs"].items()):
+      print "   {0} dialogs answered: {1}".format(dialog_s, n)
+
+
+#==============================================================================
+class StandIn(object):
+   '''
+   Runs the ComicVine stand-in server in a separate (CPython) process, with a
+   synthetic database that contains the given series and issues.
+   '''
+
+   #===========================================================================
+   def __init__(self, python_s, port_n, series, latency_ms):
+      ''' Synthesizes the database, starts the server, and waits for it. '''
+      self.fixtures_dir_s = Path.Combine(Path.GetTempPath(),
+         "cvs-benchmark-fixtures")
+      if os.path.isdir(self.fixtures_dir_s):
+         shutil.rmtree(self.fixtures_dir_s)
+      os.makedirs(self.fixtures_dir_s)
+      names_file_s = os.path.join(self.fixtures_dir_s, "names.txt")
+      with open(names_file_s, 'w') as f:
+         for series_s, issues in sorted(series.items()):
+            f.write(series_s + '\t' + ','.join(sorted(issues)) + '\n')
+
+      self.__python_s = python_s
+      synthesize = self.__start('synthesize "{0}" --names "{1}"'.format(
+         self.fixtures_dir_s, names_file_s))
+      synthesize.WaitForExit()
+      if synthesize.ExitCode != 0:
+         raise Exception("couldn't synthesize the stand-in's database")
+
+      self.__server = self.__start('serve "{0}" --port {1} --latency-ms {2}'\
+         .format(self.fixtures_dir_s, port_n, latency_ms))
+      self.api_url_s = "http://localhost:{0}/api/".format(port_n)
+      for i in range(100):
+         if server_stats("http://localhost:{0}".format(port_n), False):
+            break
+         time.sleep(0.1)
+      else:
+         self.stop()
+         raise Exception("the stand-in server didn't start")
+
+
+   #===========================================================================
+   def __start(self, args_s):
+      ''' Starts the stand-in script with the given arguments. '''
+      info = ProcessStartInfo(self.__python_s,
+         '"{0}" {1}'.format(STANDIN_SCRIPT, args_s))
+      info.UseShellExecute = False
+      info.CreateNoWindow = True
+      return Process.Start(info)
+
+
+   #===========================================================================
+   def stop(self):
+      ''' Stops the stand-in server. '''
+      if self.__server and not self.__server.HasExited:
+         self.__server.Kill()
+         self.__server.WaitForExit()
+      self.__server = None
+
+
+#==============================================================================
+class MemorySampler(object):
+   ''' Samples this process's memory use in the background, to find peaks. '''
+
+   #===========================================================================
+   def __init__(self):
+      ''' Starts sampling. '''
+      self.peak_managed_n = 0
+      self.peak_working_set_n = 0
+      self.__running_b = True
+      self.__process = Process.GetCurrentProcess()
+      self.__thread = Thread(ThreadStart(self.__sample_loop))
+      self.__thread.IsBackground = True
+      self.__thread.Start()
+
+   #===========================================================================
+   def stop(self):
+      ''' Stops sampling (and takes one last sample.) '''
+      self.__running_b = False
+      self.__thread.Join()
+      self.__sample()
+
+   #===========================================================================
+   def __sample_loop(self):
+      while self.__running_b:
+         self.__sample()
+         Thread.Sleep(100)
+
+   #===========================================================================
+   def __sample(self):
+      self.__process.Refresh()
+      self.peak_managed_n = max(self.peak_managed_n, GC.GetTotalMemory(False))
+      self.peak_working_set_n = max(self.peak_working_set_n,
+         self.__process.WorkingSet64)
+
+
+#==============================================================================
+class BenchmarkApp(object):
+   ''' A fake ComicRack App object, that can render fake cover pages. '''
+   ProductVersion = '999.999.99999'
+
+   def GetComicPage(self, book, page_index):
+      # a blank page hashes like the stand-in's placeholder covers, so the
+      # automatcher treats it as a cover match.
+      page = Bitmap(400, 600)
+      with Graphics.FromImage(page) as g:
+         g.Clear(Color.White)
+      return page
+
+   def SetCustomBookThumbnail(self, book, bitmap):
+      return True
+
+   def GetLibraryBooks(self):
+      return []
+
+
+#==============================================================================
+class BenchmarkComicBook(object):
+   '''
+   A fake ComicRack ComicBook with no metadata, backed by a (nonexistent)
+   file with the given path.  The ComicVineScraper only checks that the
+   class name contains 'ComicBook'.
+   '''
+
+   #===========================================================================
+   def __init__(self, path_s):
+      self.Id = Guid.NewGuid()
+      self.FilePath = path_s
+      self.Series = self.Number = self.Title = self.AlternateSeries = ''
+      self.Summary = self.Publisher = self.Imprint = self.Format = ''
+      self.Characters = self.Teams = self.Locations = self.Writer = ''
+      self.Penciller = self.Inker = self.Colorist = self.Letterer = ''
+      self.CoverArtist = self.Editor = self.Tags = self.Notes = ''
+      self.Web = self.CustomThumbnailKey = self.ShadowFormat = ''
+      self.Year = self.Month = self.Day = self.Volume = -1
+      self.ShadowVolume = -1
+      self.CommunityRating = 0.0
+      self.PageCount = 24
+      self.ReleasedTime = DateTime.MinValue
+      self.__custom_values = {}
+
+   #===========================================================================
+   def GetCustomValue(self, key_s):
+      return self.__custom_values.get(key_s)
+
+   #===========================================================================
+   def SetCustomValue(self, key_s, value_s):
+      self.__custom_values[key_s] = value_s
+
+   #===========================================================================
+   scraped_b = property( lambda self :
+      bool(self.__custom_values.get("comicvine_issue")) )
+
+
+#==============================================================================
+class BenchmarkConfiguration(Configuration):
+   ''' The user's configuration, adjusted for the current benchmark mode. '''
+
+   # the current benchmark mode (see MODES)
+   mode_s = MODES[0]
+
+   welcome_dialog_b = property( lambda self : False )
+   scrape_delay_n = property( lambda self : 0 )
+   
+   # the stand-in's injected errors must not switch us to offline mode
+   offline_mode_b = property( lambda self : False )
+   auto_offline_b = property( lambda self : False )
+
+   #===========================================================================
+   def load_defaults(self):
+      Configuration.load_defaults(self)
+      mode_s = BenchmarkConfiguration.mode_s
+      self.api_key_s = self.api_key_s if self.api_key_s else "benchmark"
+      self.autochoose_series_b = mode_s == 'autoscrape'
+      self.fast_rescrape_b = mode_s == 'rescrape'
+      self.confirm_issue_b = False
+      self.summary_dialog_b = False
+
+
+#==============================================================================
+class AutoDialog(object):
+   '''
+   The base class for fake versions of the ScrapeEngine's dialogs, which
+   answer themselves (the way a user who knows the right answer would) and
+   count how many times they were shown.
+   '''
+   def __init__(self, *args):
+      self.args = args
+   def __enter__(self):
+      return self
+   def __exit__(self, type, value, traceback):
+      return False
+
+
+#==============================================================================
+class AutoSearchForm(AutoDialog):
+   ''' Skips books whose series can't be found with their own name. '''
+   def show_form(self):
+      log.count(DIALOG_COUNTER + "search")
+      return SearchFormResult("SKIP")
+
+
+#==============================================================================
+class AutoSeriesForm(AutoDialog):
+   ''' Picks the series with the same name as the book, or skips. '''
+   def show_form(self):
+      log.count(DIALOG_COUNTER + "series")
+      scraper, book, series_refs, search_terms_s = self.args
+      simplify = lambda s : re.sub(r'\W|_', '', s.lower()) if s else ''
+      for ref in series_refs:
+         if simplify(ref.series_name_s) == simplify(book.series_s):
+            return SeriesFormResult("OK", ref)
+      return SeriesFormResult("SKIP")
+
+
+#==============================================================================
+class AutoIssueForm(AutoDialog):
+   '''
+   Picks the suggested issue, if there is one.  Otherwise the ScrapeEngine
+   couldn't find the book's issue number in the series, so this skips.
+   '''
+   def show_form(self):
+      log.count(DIALOG_COUNTER + "issue")
+      scraper, hint, issue_refs, series_ref = self.args
+      return IssueFormResult("OK", hint) if hint else IssueFormResult("SKIP")
+
+
+#==============================================================================
+class AutoMessageBox(object):
+   ''' Doesn't show any message boxes. '''
+   @staticmethod
+   def Show(*args):
+      log.count(DIALOG_COUNTER + "message")
+      return None
+
+
+#==============================================================================
+def __install_auto_answers():
+   '''
+   Replaces the Configuration class and all of the dialogs that the
+   ScrapeEngine can show with versions that don't need a user.
+   '''
+   scrapeengine.Configuration = BenchmarkConfiguration
+   scrapeengine.SearchForm = AutoSearchForm
+   scrapeengine.SeriesForm = AutoSeriesForm
+   scrapeengine.IssueForm = AutoIssueForm
+   scrapeengine.MessageBox = AutoMessageBox